@@ -19,6 +19,11 @@ try:
     processing_run = db["runs"]
     processing_logs = db["processing_logs"]
     statistics = db["statistics"]
+    processed_objects = db["processed_objects"]  # objetos del storage ya procesados (clave + ETag)
+    run_deletions = db["run_deletions"]  # progreso de los borrados de corridas (DELETE /process/runs/{run_id})
+    idempotency_keys = db["idempotency_keys"]  # respuestas guardadas por Idempotency-Key (con TTL)
+    processing_jobs = db["processing_jobs"]  # corridas encoladas para los workers (POST /process/queue)
+    processing_tasks = db["processing_tasks"]  # una tarea por archivo, con lease del worker que la procesa
 
 except Exception as e:
     print(f"❌ Error de conexión: {e}")
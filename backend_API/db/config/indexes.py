@@ -0,0 +1,76 @@
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import PyMongoError
+
+from backend_API.db.config.db import db
+from backend_API.utils.config import LOG_RETENTION_DAYS, STATISTICS_RETENTION_DAYS
+from backend_API.utils.logger import setup_logger
+
+logger = setup_logger("MongoIndexes")
+
+# Los borrados de corridas terminados se guardan una semana
+RUN_DELETION_RETENTION_SECONDS = 7 * 24 * 3600
+
+
+def ensure_ttl_index(collection, field: str, seconds: int):
+    """
+    Índice TTL sobre `field`. Si ya existe con otro vencimiento se cambia con
+    collMod (create_index fallaría); con 0 se elimina y los documentos no vencen.
+    """
+    name = f"{field}_ttl"
+    existing = collection.index_information().get(name)
+    if not seconds:
+        if existing:
+            collection.drop_index(name)
+        return
+    if existing is None:
+        collection.create_index(field, name=name, expireAfterSeconds=seconds)
+    elif existing.get("expireAfterSeconds") != seconds:
+        collection.database.command("collMod", collection.name,
+                                    index={"name": name, "expireAfterSeconds": seconds})
+
+
+def ensure_indexes():
+    """Crea los índices de la API al arrancar (create_index no hace nada si ya existe)."""
+    try:
+        # Clave de idempotencia de las facturas (ver utils/invoice_utils.dedupe_key). Parcial: las
+        # facturas guardadas antes de la clave no la tienen y no chocan entre sí
+        db.invoices.create_index(
+            [("dedupe_key", ASCENDING)],
+            name="dedupe_key_unique",
+            unique=True,
+            partialFilterExpression={"dedupe_key": {"$type": "string"}},
+        )
+        # Búsqueda de facturas (InvoiceService.search_invoices): orden por (date, _id) descendente
+        # para la paginación por cursor, con los filtros de igualdad adelante (igualdad, orden, rango)
+        db.invoices.create_index([("date", DESCENDING), ("_id", DESCENDING)], name="search_date")
+        db.invoices.create_index([("cuit_ruc", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)],
+                                 name="search_cuit_ruc_date")
+        db.invoices.create_index([("currency", ASCENDING), ("status", ASCENDING), ("date", DESCENDING),
+                                  ("_id", DESCENDING)], name="search_currency_status_date")
+        db.invoices.create_index([("status", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)],
+                                 name="search_status_date")
+        db.invoices.create_index([("company", TEXT), ("main_description", TEXT)], name="search_text",
+                                 default_language="spanish")
+        db.processed_objects.create_index("key", unique=True)
+        # Corridas y objetos procesados de una factura (operaciones masivas, reparse)
+        db.runs.create_index("invoices")
+        db.processed_objects.create_index("invoice_id", sparse=True)
+        db.processed_objects.create_index("run_id")
+        # Borrado en cascada de una corrida
+        db.processing_logs.create_index("processing_run_id")
+        db.statistics.create_index("processing_run_id", sparse=True)
+        # Retención (LOG_RETENTION_DAYS, STATISTICS_RETENTION_DAYS): Mongo borra los vencidos en segundo plano
+        ensure_ttl_index(db.processing_logs, "created_at", LOG_RETENTION_DAYS * 86400)
+        ensure_ttl_index(db.statistics, "process_date", STATISTICS_RETENTION_DAYS * 86400)
+        ensure_ttl_index(db.run_deletions, "finished_at", RUN_DELETION_RETENTION_SECONDS)
+        # Cola de tareas de los workers: toma (pendientes o con lease vencido) y avance por job
+        db.processing_tasks.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)],
+                                         name="task_claim")
+        db.processing_tasks.create_index([("job_id", ASCENDING), ("key", ASCENDING)], unique=True)
+        db.processing_jobs.create_index("status")
+        # Mongo borra las claves vencidas (expires_at ya incluye IDEMPOTENCY_TTL_SECONDS)
+        db.idempotency_keys.create_index("expires_at", expireAfterSeconds=0)
+        logger.info("✅ Índices de Mongo verificados")
+    except PyMongoError as e:
+        # Sin índices la API funciona igual, pero sin la garantía de unicidad
+        logger.error(f"❌ Error creando índices de Mongo: {e}")
@@ -1,4 +1,10 @@
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from starlette.concurrency import run_in_threadpool
+from backend_API.db.config.indexes import ensure_indexes
+from backend_API.utils.janitor import Janitor
+from backend_API.utils.cpu_pool import cpu_pool
 from backend_API.routers.processing import ProcessingDownloadRouter
 from backend_API.routers.processing.ProcessingRouter import router as processing_router
 from backend_API.routers.invoince_image import InvoiceImageRouter
@@ -6,6 +12,10 @@ from backend_API.routers.invoice import InvoiceRouter
 from backend_API.routers.logs import ProcessingLogRouter
 from backend_API.routers.logs.ProcessingLogRouter import router as logs_router
 from backend_API.routers.statistics.StatisticProcessRouter import router as statistics_router
+from backend_API.routers.metrics.MetricsRouter import router as metrics_router
+from backend_API.utils.metrics import observe_http
+from backend_API.utils.tracing import span
+from backend_API.utils.ingestion import RequestSizeLimitMiddleware
 
 from dotenv import load_dotenv
 
@@ -14,10 +24,46 @@ load_dotenv()
 
 print("Starting DIP App...")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(ensure_indexes)
+    # Los procesos del pool se levantan al arrancar y no en la primera factura
+    await run_in_threadpool(cpu_pool.start)
+    janitor = Janitor()
+    janitor.start()
+    yield
+    janitor.stop()
+    # Cancela las tareas en cola y espera a las que están corriendo
+    await run_in_threadpool(cpu_pool.shutdown)
+
+
 app = FastAPI(
     title="Digital Invoices Processor App",
+    lifespan=lifespan,
 )
 
+# Límite del cuerpo completo (MAX_UPLOAD_REQUEST_BYTES) antes de parsear el multipart
+app.add_middleware(RequestSizeLimitMiddleware)
+
+
+@app.middleware("http")
+async def http_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    with span("http.request", **{"http.method": request.method, "url.path": request.url.path}) as request_span:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Se etiqueta con la plantilla de la ruta (/process/runs/{run_id}), no con la URL real
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            request_span.update_name(f"{request.method} {route}")
+            request_span.set_attribute("http.route", route)
+            request_span.set_attribute("http.status_code", status)
+            observe_http(request.method, route, status, time.perf_counter() - started)
+
+
 @app.get("/")
 def read_root():
     return {"Message": "Digital Invoices Processor in Running now"}
@@ -28,4 +74,5 @@ app.include_router(InvoiceRouter.router)
 app.include_router(ProcessingDownloadRouter.router)
 app.include_router(logs_router)
 app.include_router(statistics_router)
+app.include_router(metrics_router)
 
@@ -0,0 +1,42 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, EmailStr
+
+
+class InvoiceBulkFilter(BaseModel):
+    # Mismos filtros que GET /invoices/search
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+    min_total: Optional[float] = None
+    max_total: Optional[float] = None
+    currency: Optional[str] = None
+    status: Optional[str] = None
+    cuit_ruc: Optional[str] = None
+
+
+class InvoicePatch(BaseModel):
+    # Solo se aplican los campos presentes en el request
+    company: Optional[str] = None
+    date: Optional[datetime] = None
+    invoice_number: Optional[str] = None
+    total_price: Optional[float] = None
+    currency: Optional[str] = None
+    number_of_items: Optional[int] = None
+    main_description: Optional[str] = None
+    cuit_ruc: Optional[str] = None
+    address: Optional[str] = None
+    phone: Optional[str] = None
+    email: Optional[EmailStr] = None
+    status: Optional[str] = None
+
+
+class InvoiceBulkUpdate(BaseModel):
+    ids: Optional[List[str]] = None          # o ids o filter
+    filter: Optional[InvoiceBulkFilter] = None
+    patch: InvoicePatch
+
+
+class InvoiceBulkDelete(BaseModel):
+    ids: Optional[List[str]] = None          # o ids o filter
+    filter: Optional[InvoiceBulkFilter] = None
@@ -23,6 +23,9 @@ class InvoiceCreate(BaseModel):
     status: str
     error: Optional[str] = None
     raw_answer: Optional[str] = None
+    content_sha256: Optional[str] = None  # SHA-256 del archivo (clave de la factura si faltan CUIT o número)
+    phash: Optional[str] = None  # hash perceptual de la imagen (detección de casi-duplicados)
+    near_duplicate_of: Optional[str] = None  # id de la factura casi idéntica ya guardada, si la hay
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
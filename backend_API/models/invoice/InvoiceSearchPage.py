@@ -0,0 +1,11 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from backend_API.models.invoice.InvoiceModel import InvoiceModel
+
+
+class InvoiceSearchPage(BaseModel):
+    items: List[InvoiceModel]
+    next_cursor: Optional[str] = None  # se pasa como `cursor` para pedir la página siguiente
+    explain: Optional[dict] = None  # plan de la consulta, solo con debug=true
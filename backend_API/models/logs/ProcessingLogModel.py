@@ -11,6 +11,8 @@ class ProcessingLogModel(BaseModel):
     status: str  # "success" | "error"
     error_message: Optional[str] = None
     processing_run_id: Optional[str] = None
+    invoice_id: Optional[str] = None
+    raw_answer: Optional[str] = None  # respuesta cruda de Gemini cuando no se pudo crear la factura
     created_at: datetime
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
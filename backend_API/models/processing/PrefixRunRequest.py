@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+from typing import Optional
+
+class PrefixRunRequest(BaseModel):
+    prefix: str                         # ej. "proveedores/2025/01/"
+    max_objects: Optional[int] = None   # procesar como mucho N objetos pendientes en esta corrida
+    reprocess: bool = False             # ignorar el registro de objetos ya procesados
+    workers: Optional[int] = None       # descargas/extracciones en paralelo (por defecto PREFIX_WORKERS)
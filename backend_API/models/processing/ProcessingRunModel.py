@@ -9,9 +9,17 @@ class ProcessingRunModel(BaseModel):
     total_files: int
     successful: int
     errors: int
+    skipped: int = 0  # casi-duplicados que no se enviaron a Gemini (NEAR_DUPLICATE_MODE=skip)
     success_rate: float
     invoices: List[str] = []
-    excel_report_path: Optional[str] = None
+    excel_report_path: Optional[str] = None  # corridas anteriores: Excel en el disco del nodo que la procesó
+    excel_report_key: Optional[str] = None  # clave del Excel en el storage compartido
+    report_stale: bool = False  # facturas modificadas o borradas después de generar el Excel
+    invoice_writes: Optional[dict] = None  # facturas insertadas, actualizadas y sin cambios (upsert por dedupe_key)
+    parse_stats: Optional[dict] = None  # intentos, fallos y tiempo de parseo de las respuestas de Gemini
+    timing_profile: Optional[dict] = None  # tiempos por etapa, archivos más lentos y bytes transferidos
+    near_duplicates: Optional[List[dict]] = None  # archivos marcados u omitidos por parecerse a una factura existente
+    source: Optional[dict] = None  # origen de los archivos cuando no es una subida directa (ej. {"type": "archive", "name": ...})
     started_at: datetime
     ended_at: datetime
     created_at: Optional[datetime] = None
@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+class ReparseRequest(BaseModel):
+    run_id: Optional[str] = None          # si se indica, los demás filtros se ignoran
+    status: Optional[str] = None          # estado de la factura (ej. "Success")
+    date_from: Optional[datetime] = None  # sobre el timestamp de procesamiento
+    date_to: Optional[datetime] = None
+    invoice_file: Optional[str] = None
+    include_errors: bool = True           # reintentar también los logs con error que guardaron raw_answer
+    rebuild_report: bool = True
@@ -9,4 +9,5 @@ class StatisticsProcessCreate(BaseModel):
     successful: int
     errors: int
     success_rate: float
+    processing_run_id: Optional[str] = None  # corrida que generó las estadísticas
     
@@ -10,5 +10,6 @@ class StatisticsProcessModel(BaseModel):
     successful: int
     errors: int
     success_rate: float
+    processing_run_id: Optional[str] = None  # corrida que generó las estadísticas
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
@@ -1,12 +1,16 @@
+from datetime import datetime
 from bson import ObjectId
-from fastapi import APIRouter, HTTPException, UploadFile, File, status
-from typing import List
+from fastapi import APIRouter, HTTPException, Query, UploadFile, File, status
+from typing import List, Optional
+from starlette.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from backend_API.db.config import db
 from backend_API.models.invoice.InvoiceCreate import InvoiceCreate
 from backend_API.schema.Invoice.InvoiceSchema import invoices_schema
 from backend_API.models.invoice.InvoiceModel import InvoiceModel
-from backend_API.services.invoice.InvoiceService import create_invoice, delete_existing_invoice, process_batch, search_invoice, update_invoice
+from backend_API.models.invoice.InvoiceSearchPage import InvoiceSearchPage
+from backend_API.models.invoice.InvoiceBulkRequest import InvoiceBulkDelete, InvoiceBulkUpdate
+from backend_API.services.invoice.InvoiceService import bulk_delete_invoices, bulk_update_invoices, create_invoice, delete_existing_invoice, process_batch, search_invoice, search_invoices, update_invoice
 
 router = APIRouter(
     prefix="/invoices",
@@ -22,6 +26,27 @@ async def get_invoice():
     return invoices_schema(db.invoices.find())
 
 
+# GET - Search (antes de /{id} para que "search" no se tome como id)
+@router.get("/search", response_model=InvoiceSearchPage)
+async def search(date_from: Optional[datetime] = None,
+                 date_to: Optional[datetime] = None,
+                 min_total: Optional[float] = None,
+                 max_total: Optional[float] = None,
+                 currency: Optional[str] = None,
+                 status: Optional[str] = None,
+                 cuit_ruc: Optional[str] = None,
+                 q: Optional[str] = Query(None, description="Texto a buscar en company y main_description"),
+                 limit: int = Query(50, ge=1, le=200),
+                 cursor: Optional[str] = Query(None, description="next_cursor de la página anterior"),
+                 debug: bool = Query(False, description="Incluye el plan de la consulta (explain)")):
+    return await run_in_threadpool(
+        search_invoices,
+        date_from=date_from, date_to=date_to, min_total=min_total, max_total=max_total,
+        currency=currency, invoice_status=status, cuit_ruc=cuit_ruc, text=q,
+        limit=limit, cursor=cursor, debug=debug,
+    )
+
+
 # GET - Calling an invoice by id - Path
 @router.get("/{id}", response_model=InvoiceModel)
 async def get_invoice(id: str):
@@ -51,4 +76,16 @@ async def update_existing_invoice(id:str, invoice:InvoiceCreate):
 @router.delete("/{id}",
                response_model=InvoiceModel)
 async def delete_invoice(id:str):
-    return delete_existing_invoice(id)
\ No newline at end of file
+    return delete_existing_invoice(id)
+
+
+# PATCH - Bulk update (ids o filtro + patch)
+@router.patch("/bulk")
+async def bulk_update(request: InvoiceBulkUpdate):
+    return await run_in_threadpool(bulk_update_invoices, request)
+
+
+# POST - Bulk delete (ids o filtro)
+@router.post("/bulk-delete")
+async def bulk_delete(request: InvoiceBulkDelete):
+    return await run_in_threadpool(bulk_delete_invoices, request)
@@ -1,10 +1,11 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 from bson import ObjectId
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile, status
+from fastapi import APIRouter, File, Form, Header, HTTPException, UploadFile, status
 from fastapi.responses import JSONResponse
 from backend_API.services.processing.ProcessingService import ProcessingService
-from backend_API.utils.s3_utils import delete_image_from_aws, upload_image_to_aws
+from backend_API.services.idempotency.IdempotencyService import IdempotencyService
+from backend_API.utils.storage_utils import delete_by_url, get_storage
 from backend_API.models.invoice_image.InvoiceImageModel import InvoiceImageModel
 from backend_API.schema.invoice_image.InvoiceImageSchema import image_invoice_schema, image_invoices_schema
 from backend_API.db.config import db
@@ -53,12 +54,24 @@ async def image_invoice(id: str):
 @router.post("/", 
              response_model= List[InvoiceImageModel], 
              status_code= status.HTTP_201_CREATED)
-async def create_image_invoice(files: List[UploadFile] = File(...)):#,
+async def create_image_invoice(files: List[UploadFile] = File(...),
+                               idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):#,
                                 #invoice_id: str = Form(...)
     #if not invoice_id:
      #   raise HTTPException(
       #      status.HTTP_400_BAD_REQUEST, 
        #     detail="Invoice ID is required")
+    # Un reintento con la misma Idempotency-Key devuelve las imágenes ya creadas (sin el 409 por nombre)
+    return await IdempotencyService.execute(
+        "POST /image_invoice",
+        idempotency_key,
+        IdempotencyService.fingerprint(files),
+        lambda: upload_image_invoices(files),
+        status_code=status.HTTP_201_CREATED,
+    )
+
+
+async def upload_image_invoices(files: List[UploadFile]) -> List[InvoiceImageModel]:
     try:    
         uploaded_images = []
 
@@ -71,8 +84,8 @@ async def create_image_invoice(files: List[UploadFile] = File(...)):#,
                     detail=f"An image with the name  {file.filename} already exists"
                 )
 
-            # Subir la imagen a AWS S3
-            s3_url = upload_image_to_aws(file.file, file.filename, file.content_type)
+            # Subir la imagen al almacenamiento (S3 o disco local)
+            s3_url = get_storage().put(file.filename, file.file, file.content_type)
 
             # Crear los metadatos de la imagen
             image_invoice_dict = {
@@ -112,19 +125,19 @@ async def update_image_invoice(id: str, file: UploadFile = File(...)):
             status.HTTP_404_NOT_FOUND, 
             detail="Image of invoice not found")
     
-    # Eliminar la imagen del bucket S3
+    # Eliminar la imagen del almacenamiento
     current_s3_url = image_invoice.image_url
     if current_s3_url:
         try:
-            delete_image_from_aws(current_s3_url)
+            delete_by_url(current_s3_url)
         except Exception as e:
             raise HTTPException(
                 status.HTTP_500_INTERNAL_SERVER_ERROR, 
                 detail=f"Error deleting image of Invoice from AWS: {str(e)}")
     
-    # Subir la nueva imagen a AWS S3
+    # Subir la nueva imagen al almacenamiento
     try:
-        s3_url = upload_image_to_aws(file.file, file.filename, file.content_type)
+        s3_url = get_storage().put(file.filename, file.file, file.content_type)
     except Exception as e:
         raise HTTPException(
             status.HTTP_500_INTERNAL_SERVER_ERROR, 
@@ -172,7 +185,7 @@ async def delete_image_invoice(id: str):
         # Eliminar la imagen
         if "image_url" in image:
             try:
-                delete_image_from_aws(image["image_url"])
+                delete_by_url(image["image_url"])
             except Exception as e:
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
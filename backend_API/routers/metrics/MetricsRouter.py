@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Response
+
+from backend_API.utils.metrics import render_metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+# GET - Métricas en formato Prometheus
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Latencia por etapa, resultados, reintentos, caché, archivos en curso y
+    latencia HTTP por ruta. Con PROMETHEUS_MULTIPROC_DIR agrega todos los workers.
+    """
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
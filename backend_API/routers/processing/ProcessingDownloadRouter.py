@@ -1,15 +1,18 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
 from backend_API.db.config.db import db
+from backend_API.services.processing.ProcessingService import REPORT_CONTENT_TYPE
+from backend_API.utils.download_utils import storage_download
 from bson import ObjectId
 import os
 
-router = APIRouter(prefix="/processing/download", 
+router = APIRouter(prefix="/processing/download",
                    tags=["Processing"])
 
-@router.get("/{run_id}", 
+@router.get("/{run_id}",
             summary="Download Excel report of the processing")
-async def download_excel_report(run_id: str):
+async def download_excel_report(run_id: str, request: Request):
     try:
         run = db.runs.find_one({"_id": ObjectId(run_id)})
     except Exception:
@@ -18,6 +21,13 @@ async def download_excel_report(run_id: str):
     if not run:
         raise HTTPException(status_code=404, detail="Run ID not found")
 
+    # Reporte en el storage compartido: lo puede servir cualquier nodo
+    excel_key = run.get("excel_report_key")
+    if excel_key:
+        return await run_in_threadpool(storage_download, excel_key, os.path.basename(excel_key),
+                                       REPORT_CONTENT_TYPE, request.headers.get("range"))
+
+    # Corridas anteriores: el Excel está en el disco del nodo que las procesó
     excel_path = run.get("excel_report_path")
     if not excel_path or not os.path.exists(excel_path):
         raise HTTPException(status_code=404, detail="Excel file not found")
@@ -25,5 +35,5 @@ async def download_excel_report(run_id: str):
     return FileResponse(
         path=excel_path,
         filename=os.path.basename(excel_path),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        media_type=REPORT_CONTENT_TYPE
     )
@@ -1,9 +1,21 @@
-from fastapi import APIRouter, UploadFile, File, status, HTTPException
+from bson import ObjectId
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Header, status, HTTPException
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
-from typing import List
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
 from backend_API.db.config import db
 from backend_API.db.config.db import processing_run
+from backend_API.models.processing.ProcessingRunModel import ProcessingRunModel
+from backend_API.models.processing.PrefixRunRequest import PrefixRunRequest
+from backend_API.models.processing.ReparseRequest import ReparseRequest
+from backend_API.schema.processing.ProcessingRunSchema import processing_run_schema
+from backend_API.services.idempotency.IdempotencyService import IdempotencyService
 from backend_API.services.processing.ProcessingService import ProcessingService
+from backend_API.services.processing.PrefixService import PrefixService
+from backend_API.services.processing.ReparseService import ReparseService
+from backend_API.services.processing.RunDeletionService import RunDeletionService
+from backend_API.services.processing.TaskQueueService import TaskQueueService
 
 
 router = APIRouter(
@@ -24,16 +36,29 @@ async def health_check():
 
 # POST
 @router.post("/", status_code=status.HTTP_201_CREATED)
-async def process_invoices(files: List[UploadFile] = File(...)):
+async def process_invoices(files: List[UploadFile] = File(...),
+                           idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
     """
     Procesa una o varias imágenes de facturas:
     - Sube imágenes a S3
     - Procesa con Gemini
     - Guarda facturas, logs, estadísticas y el resumen
+
+    Con `Idempotency-Key`, un reintento con la misma clave devuelve la respuesta
+    guardada (o espera a la corrida en curso) en lugar de procesar de nuevo.
     """
+    run_oid = ObjectId()
     try:
-        result = await ProcessingService.process_batch(files)
-        return result
+        return await IdempotencyService.execute(
+            "POST /process",
+            idempotency_key,
+            IdempotencyService.fingerprint(files),
+            lambda: ProcessingService.process_batch(files, run_oid=run_oid),
+            status_code=status.HTTP_201_CREATED,
+            run_id=str(run_oid),
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -41,6 +66,52 @@ async def process_invoices(files: List[UploadFile] = File(...)):
         )
 
 
+# POST - Archivo comprimido (ZIP/TAR) con muchas facturas
+@router.post("/archive", status_code=status.HTTP_201_CREATED)
+async def process_archive(file: UploadFile = File(...)):
+    """
+    Procesa todas las imágenes de un ZIP o TAR (.tar, .tar.gz, .tgz, .tar.bz2, .tar.xz)
+    como una sola corrida. Cada miembro queda como un log de la corrida.
+    """
+    try:
+        return await ProcessingService.process_archive(file)
+    except HTTPException:
+        raise
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Error durante el procesamiento: {str(e)}"}
+        )
+
+
+# POST - Objetos que ya están en el storage
+@router.post("/prefix", status_code=status.HTTP_201_CREATED)
+async def process_prefix(request: PrefixRunRequest):
+    """
+    Procesa las imágenes que ya están en el bucket bajo `prefix`, sin volver a
+    subirlas. Los objetos ya procesados con el mismo ETag se omiten, así que
+    repetir la llamada retoma una corrida interrumpida.
+    """
+    return await run_in_threadpool(PrefixService.process_prefix, request)
+
+
+# POST - Objetos del storage encolados para los workers (python -m backend_API.worker)
+@router.post("/queue", status_code=status.HTTP_202_ACCEPTED)
+async def enqueue_prefix(request: PrefixRunRequest):
+    """
+    Como POST /process/prefix, pero los objetos quedan como tareas en Mongo y los
+    procesan los workers que estén corriendo. La corrida se crea (con el mismo id
+    que el job) cuando termina la última tarea.
+    """
+    return await run_in_threadpool(TaskQueueService.enqueue_prefix, request)
+
+
+# GET - Avance de un job de la cola
+@router.get("/queue/{job_id}")
+async def get_queue_job(job_id: str):
+    return jsonable_encoder(await run_in_threadpool(TaskQueueService.get_job, job_id))
+
+
 # GET - Run Process
 @router.get("/runs")
 async def list_processing_runs():
@@ -51,6 +122,60 @@ async def list_processing_runs():
             "run_id": str(run["_id"]),
             "name": run.get("name"),
             "started_at": run.get("started_at"),
-            "excel_report_path": run.get("excel_report_path")
+            "excel_report_path": run.get("excel_report_path"),
+            "excel_report_key": run.get("excel_report_key")
         })
-    return runs
\ No newline at end of file
+    return runs
+
+
+# GET - Detalle de una corrida (incluye timing_profile)
+@router.get("/runs/{run_id}", response_model=ProcessingRunModel)
+async def get_processing_run(run_id: str):
+    return ProcessingRunModel(**processing_run_schema(ProcessingService.find_run(run_id)))
+
+
+# DELETE - Corrida completa (imágenes, facturas, logs, estadísticas y Excel)
+@router.delete("/runs/{run_id}")
+async def delete_processing_run(run_id: str, background_tasks: BackgroundTasks):
+    """
+    Borra la corrida en cascada. Las corridas chicas se borran dentro de la
+    request (200); las grandes siguen en segundo plano (202) y el avance se
+    consulta en GET /process/runs/{run_id}/deletion.
+    """
+    deletion, mode = await run_in_threadpool(RunDeletionService.request_deletion, run_id)
+    if mode == "done":
+        return deletion
+    if mode == "start":
+        background_tasks.add_task(RunDeletionService.delete_run, run_id)
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder(deletion))
+
+
+@router.get("/runs/{run_id}/deletion")
+async def get_run_deletion(run_id: str):
+    deletion = await run_in_threadpool(RunDeletionService.get_status, run_id)
+    if deletion is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No deletion for this run")
+    return deletion
+
+
+# POST - Reparse (sin llamar a Gemini)
+@router.post("/reparse")
+async def reparse_invoices(request: ReparseRequest):
+    """
+    Reaplica el parseo y la normalización actuales sobre el raw_answer guardado
+    de las facturas (y de los logs con error) que cumplen el filtro.
+    No hace llamadas al modelo.
+    """
+    return await run_in_threadpool(ReparseService.reparse, request)
+
+
+@router.post("/runs/{run_id}/reparse")
+async def reparse_run(run_id: str, include_errors: bool = True, rebuild_report: bool = True):
+    request = ReparseRequest(run_id=run_id, include_errors=include_errors, rebuild_report=rebuild_report)
+    return await run_in_threadpool(ReparseService.reparse, request)
+
+
+# POST - Regenerar el Excel de una corrida
+@router.post("/runs/{run_id}/report")
+async def rebuild_run_report(run_id: str):
+    return await run_in_threadpool(ReparseService.rebuild_report, run_id)
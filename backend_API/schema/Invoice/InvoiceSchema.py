@@ -26,6 +26,9 @@ def invoice_schema(invoice) -> dict:
         "status": invoice["status"],
         "error": invoice.get("error"),
         "raw_answer": invoice.get("raw_answer"),
+        "content_sha256": invoice.get("content_sha256"),
+        "phash": invoice.get("phash"),
+        "near_duplicate_of": invoice.get("near_duplicate_of"),
         "created_at": invoice.get("created_at"),
         "updated_at": invoice.get("updated_at")
     }
@@ -6,6 +6,8 @@ def processing_log_schema(log) -> dict:
         "status": log["status"],
         "error_message": log.get("error_message"),
         "processing_run_id": log["processing_run_id"],
+        "invoice_id": log.get("invoice_id"),
+        "raw_answer": log.get("raw_answer"),
         "created_at": log["created_at"]
     }
 
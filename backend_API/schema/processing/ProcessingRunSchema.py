@@ -6,9 +6,17 @@ def processing_run_schema(run) -> dict:
         "total_files": run["total_files"],
         "successful": run["successful"],
         "errors": run["errors"],
+        "skipped": run.get("skipped", 0),
         "success_rate": run["success_rate"],
         "invoices": [str(inv) for inv in run.get("invoices") or []],
         "excel_report_path": run.get("excel_report_path"),
+        "excel_report_key": run.get("excel_report_key"),
+        "report_stale": run.get("report_stale", False),
+        "invoice_writes": run.get("invoice_writes"),
+        "parse_stats": run.get("parse_stats"),
+        "timing_profile": run.get("timing_profile"),
+        "near_duplicates": run.get("near_duplicates"),
+        "source": run.get("source"),
         "started_at": run["started_at"],
         "ended_at": run["ended_at"],
         "created_at": run.get("created_at"),
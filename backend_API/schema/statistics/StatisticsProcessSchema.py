@@ -6,6 +6,7 @@ def statistic_process_schema(statistic_process) -> dict:
         "successful": statistic_process["successful"],
         "errors": statistic_process["errors"],
         "success_rate": statistic_process["success_rate"],
+        "processing_run_id": statistic_process.get("processing_run_id"),
         "created_at": statistic_process.get("created_at"),
         "updated_at": statistic_process.get("updated_at")
     }
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, List, Optional
+from fastapi import HTTPException, UploadFile, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+from backend_API.db.config.db import db
+from backend_API.utils.config import IDEMPOTENCY_LOCK_SECONDS, IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_WAIT_SECONDS
+from backend_API.utils.logger import setup_logger
+from backend_API.utils.metrics import CACHE_HITS
+
+logger = setup_logger("IdempotencyService")
+
+MAX_KEY_LENGTH = 255
+POLL_SECONDS = 1.0
+
+
+class IdempotencyService:
+    """
+    Soporte del header Idempotency-Key. La primera request con una clave la
+    registra en `idempotency_keys` (en curso) y guarda la respuesta al terminar;
+    un reintento con la misma clave espera a la corrida en curso o recibe la
+    respuesta guardada, sin volver a subir archivos ni llamar a Gemini.
+    Las claves vencen por TTL (IDEMPOTENCY_TTL_SECONDS).
+    """
+
+    @staticmethod
+    def fingerprint(files: List[UploadFile]) -> str:
+        # Nombre, tamaño y tipo: distingue otra carga con la misma clave sin releer los archivos
+        sha = hashlib.sha256()
+        for file in files:
+            sha.update(f"{file.filename}\0{file.size}\0{file.content_type}\n".encode())
+        return sha.hexdigest()
+
+    @staticmethod
+    async def execute(scope: str, key: Optional[str], fingerprint: str,
+                      handler: Callable[[], Awaitable[Any]], status_code: int,
+                      run_id: Optional[str] = None) -> Any:
+        """
+        Ejecuta `handler` una sola vez por (scope, key). Sin clave, lo ejecuta
+        siempre. `run_id` es la corrida que crea el handler: los reintentos que
+        llegan mientras está en curso la reciben si la espera se agota.
+        """
+        if not key:
+            return await handler()
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"Idempotency-Key longer than {MAX_KEY_LENGTH} characters")
+
+        doc_id = f"{scope}:{key}"
+        record = await run_in_threadpool(IdempotencyService._claim, doc_id, scope, key, fingerprint, run_id)
+        if record is not None:
+            return await IdempotencyService._replay(doc_id, record, fingerprint)
+
+        try:
+            result = await handler()
+        except BaseException:
+            # Falló (o se canceló): la clave se libera para que el reintento se procese
+            await run_in_threadpool(db.idempotency_keys.delete_one, {"_id": doc_id, "status": "in_progress"})
+            raise
+
+        if isinstance(result, JSONResponse) and result.status_code >= 500:
+            await run_in_threadpool(db.idempotency_keys.delete_one, {"_id": doc_id, "status": "in_progress"})
+            return result
+        await run_in_threadpool(
+            db.idempotency_keys.update_one,
+            {"_id": doc_id},
+            {"$set": {
+                "status": "completed",
+                "status_code": status_code,
+                "response": jsonable_encoder(result),
+                "completed_at": datetime.utcnow(),
+            }},
+        )
+        return result
+
+    @staticmethod
+    def _claim(doc_id: str, scope: str, key: str, fingerprint: str, run_id: Optional[str]) -> Optional[dict]:
+        """
+        Registra la clave como en curso. Devuelve None si esta request la tomó, o
+        el registro existente si ya la tiene otra (o ya terminó).
+        """
+        now = datetime.utcnow()
+        claim = {
+            "status": "in_progress",
+            "fingerprint": fingerprint,
+            "run_id": run_id,
+            "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+        }
+        try:
+            db.idempotency_keys.insert_one({"_id": doc_id, "scope": scope, "key": key, **claim})
+            return None
+        except DuplicateKeyError:
+            pass
+
+        # El proceso que la tenía se cayó sin terminar: se toma la clave
+        taken = db.idempotency_keys.find_one_and_update(
+            {"_id": doc_id, "status": "in_progress", "fingerprint": fingerprint, "locked_until": {"$lt": now}},
+            {"$set": claim},
+            return_document=ReturnDocument.AFTER,
+        )
+        if taken is not None:
+            logger.warning(f"⚠️ Idempotency-Key {doc_id} abandonada; se procesa de nuevo")
+            return None
+        return db.idempotency_keys.find_one({"_id": doc_id})
+
+    @staticmethod
+    async def _replay(doc_id: str, record: dict, fingerprint: str) -> JSONResponse:
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                detail="Idempotency-Key already used with a different request")
+
+        # En curso: se espera a que termine la request original
+        waited = 0.0
+        while record is not None and record["status"] == "in_progress" and waited < IDEMPOTENCY_WAIT_SECONDS:
+            await asyncio.sleep(POLL_SECONDS)
+            waited += POLL_SECONDS
+            record = await run_in_threadpool(db.idempotency_keys.find_one, {"_id": doc_id})
+
+        if record is None:
+            # La original falló y liberó la clave: el cliente puede reintentar
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail="The original request with this Idempotency-Key failed; retry it")
+        if record["status"] == "in_progress":
+            return JSONResponse(
+                status_code=status.HTTP_202_ACCEPTED,
+                content={"status": "in_progress", "run_id": record.get("run_id")},
+                headers={"Retry-After": str(int(POLL_SECONDS * 5))},
+            )
+
+        CACHE_HITS.labels("idempotency").inc()
+        logger.info(f"♻️ Respuesta repetida para Idempotency-Key {doc_id}")
+        return JSONResponse(status_code=record["status_code"], content=record["response"],
+                            headers={"Idempotent-Replayed": "true"})
@@ -1,31 +1,34 @@
 import os
-import logging
-import pandas as pd
+import base64
+import json
 from bson import ObjectId
 from fastapi import HTTPException, status
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 from backend_API.db.config import db
 from backend_API.models.invoice.InvoiceModel import InvoiceModel
-from backend_API.schema.Invoice.InvoiceSchema import invoice_schema
+from backend_API.models.invoice.InvoiceSearchPage import InvoiceSearchPage
+from backend_API.schema.Invoice.InvoiceSchema import invoice_schema, invoices_schema
 from backend_API.utils.config import UPLOADS_DIR, REPORTS_DIR
-from backend_API.utils.gemini_utils import extract_invoice_data
+from backend_API.utils.gemini_utils import extract_invoice_response, normalize_invoice_data
+from backend_API.utils.storage_utils import get_storage
+from backend_API.utils.ingestion import ingest_upload
 from backend_API.models.invoice.InvoiceCreate import InvoiceCreate
 from backend_API.models.processing.ProcessingRunCreate import ProcessingRunCreate
 from backend_API.models.statistics.StatisticsProcessCreate import StatisticsProcessCreate
 from bson.errors import InvalidId
 from pydantic import ValidationError
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from backend_API.models.invoice.InvoiceBulkRequest import InvoiceBulkDelete, InvoiceBulkFilter, InvoiceBulkUpdate
+from backend_API.services.processing.ProcessingService import ProcessingService, near_duplicate_index
+from backend_API.utils.invoice_utils import dedupe_key
+from backend_API.utils.logger import setup_logger
+from backend_API.utils.cpu_pool import cpu_pool
+from backend_API.utils.report_utils import build_excel, to_sheet
 
 # Logger configuration
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-if not logger.handlers:
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    ch.setFormatter(formatter)
-    logger.addHandler(ch)
+logger = setup_logger("InvoiceService")
 
 UPLOADS_DIR = "uploads"
 REPORTS_DIR = "reports"
@@ -59,84 +62,75 @@ column_labels = {
 
 
 async def process_batch(files: List, folder_path: str) -> dict:
-    os.makedirs(UPLOADS_DIR, exist_ok=True)
     os.makedirs(REPORTS_DIR, exist_ok=True)
 
     processed = []
     start_time = datetime.now()
 
     for file in files:
-        save_path = os.path.join(UPLOADS_DIR, file.filename)
-        with open(save_path, "wb") as f:
-            f.write(await file.read())
-
-        success, data, error = extract_invoice_data(save_path)
+        try:
+            # Mismo handle para storage y Gemini, sin copias en memoria ni en uploads/
+            upload = await ingest_upload(file)
+            key = f"{folder_path}/{file.filename}"
+            image_url = get_storage().put(key, upload.rewind(), upload.content_type)
+
+            success, data, error, raw_text = extract_invoice_response(upload.file, filename=file.filename)
+        finally:
+            # Libera el spool de la subida aunque falle la ingesta, el storage o Gemini
+            await file.close()
         timestamp = datetime.now()
 
         entry = {
             "invoice_file": file.filename,
-            "complete_path": save_path,
+            "complete_path": key,
+            "image_url": image_url,
             "timestamp": timestamp,
             "status": "Success" if success else "Error",
             "error": error,
-            "raw_answer": data if success else None,
+            "raw_answer": raw_text,
+            "content_sha256": upload.sha256,
         }
 
         if success:
-            entry.update(data)
+            # Mismo mapeo que ProcessingService: acepta las claves en español del prompt
+            entry.update(normalize_invoice_data(data, default_date=timestamp))
 
         processed.append(entry)
 
 
     # Procesar resultados
-    invoice_ids = []
     success_rows, error_rows = [], []
     success_count, error_count = 0, 0
 
     for item in processed:
         if item["status"] == "Success":
             success_count += 1
-            inv = InvoiceCreate(
-                invoice_file=item["invoice_file"],
-                complete_path=item["complete_path"],
-                image_url=None,
-                timestamp=item["timestamp"],
-                company=item.get("company", "Not found"),
-                date=datetime.fromisoformat(item.get("date")) if item.get("date") else item["timestamp"],
-                invoice_number=item.get("invoice_number", "Not found"),
-                total_price=float(item.get("total_price", 0)),
-                currency=item.get("currency", "Not found"),
-                number_of_items=int(item.get("number_of_items", 0)),
-                main_description=item.get("main_description", "Not found"),
-                cuit_ruc=item.get("cuit_ruc", "Not found"),
-                address=item.get("address", "Not found"),
-                phone=item.get("phone", "Not found"),
-                email=item.get("email"),
-                status="Success",
-                raw_answer=str(item["raw_answer"]),
-            )
-            res = await db.invoices.insert_one(inv.dict())
-            invoice_ids.append(str(res.inserted_id))
-            success_rows.append(inv.dict())
+            success_rows.append(InvoiceCreate(**item).dict())
         else:
             error_count += 1
             error_rows.append(item)
 
+    # Upsert por dedupe_key: repetir el lote no duplica facturas
+    saved = ProcessingService.save_invoices(success_rows) if success_rows else []
+    invoice_ids = list(dict.fromkeys(invoice_id for invoice_id, _ in saved))
+
     # Exportar Excel
     timestamp_str = datetime.now().strftime("%Y-%m-%dT%H-%M-%S")
-    excel_path = REPORTS_DIR / f"invoice_report_{timestamp_str}.xlsx"
+    excel_path = os.path.join(REPORTS_DIR, f"invoice_report_{timestamp_str}.xlsx")
 
-    with pd.ExcelWriter(excel_path, engine="openpyxl") as writer:
-        if success_rows:
-            df_success = pd.DataFrame(success_rows)
-            df_success.rename(columns=column_labels, inplace=True)
-            df_success.to_excel(writer, sheet_name="Invoices", index=False)
-
-    if error_rows:
-        df_errors = pd.DataFrame(error_rows)
-        df_errors.rename(columns=column_labels, inplace=True)
-        df_errors.to_excel(writer, sheet_name="Errors", index=False)
+    # DataFrames y to_excel en el pool de procesos, fuera del event loop
+    await cpu_pool.run_async(build_excel, excel_path, [
+        to_sheet("Invoices", success_rows, column_labels),
+        to_sheet("Errors", error_rows, column_labels),
+    ])
 
+    # El Excel se sirve desde el storage compartido; la copia local se descarta
+    run_oid = ObjectId()
+    excel_key = ProcessingService.report_key(f"invoice_report_{timestamp_str}_{run_oid}")
+    try:
+        ProcessingService.upload_report(excel_path, excel_key)
+    finally:
+        os.remove(excel_path)
 
     # Guardar estadísticas
     stats = StatisticsProcessCreate(
@@ -146,7 +140,7 @@ async def process_batch(files: List, folder_path: str) -> dict:
         errors=error_count,
         success_rate=(success_count / len(files)) * 100 if files else 0
     )
-    await db.statistics.insert_one(stats.dict())
+    db.statistics.insert_one(stats.dict())
 
     # Guardar corrida
     run = ProcessingRunCreate(
@@ -157,18 +151,18 @@ async def process_batch(files: List, folder_path: str) -> dict:
         errors=error_count,
         success_rate=(success_count / len(files)) * 100,
         invoices=invoice_ids,
-        excel_report_path=str(excel_path),
+        excel_report_key=excel_key,
         started_at=start_time,
         ended_at=datetime.now()
     )
-    await db.runs.insert_one(run.dict())
+    db.processing_run.insert_one({"_id": run_oid, **run.dict()})
 
     return {
         "summary": {
             "total": len(files),
             "success": success_count,
             "errors": error_count,
-            "excel_report_path": str(excel_path)
+            "excel_report_key": excel_key
         }
     }
 
@@ -176,7 +170,7 @@ async def process_batch(files: List, folder_path: str) -> dict:
 # Search Invoice
 def search_invoice(field: str, key: str):
     try:
-        logger.info(f"Searching invoice with {field} = {key}")
+        logger.debug(f"Searching invoice with {field} = {key}")
 
         if field == "_id":
             try:
@@ -191,10 +185,10 @@ def search_invoice(field: str, key: str):
             logger.warning(f"Invoice not found: {field} = {key}")
             #raise HTTPException(status_code=404, detail="Invoice not found")
             return None
-        logger.info(f"Invoice found: {invoice}")
+        # Solo el id: el documento completo (con raw_answer) no va al log
+        logger.debug(f"Invoice found: {invoice['_id']}")
 
         parsed_invoice = invoice_schema(invoice)
-        logger.info(f"Parsed invoice: {parsed_invoice}")
 
         return InvoiceModel(**parsed_invoice)
 
@@ -207,24 +201,126 @@ def search_invoice(field: str, key: str):
     
 
 
+# Search Invoices (filtros + texto, paginado por cursor)
+SEARCH_MAX_LIMIT = 200
+
+
+def _encode_cursor(invoice: dict) -> str:
+    last = {"date": invoice["date"].isoformat(), "id": str(invoice["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(last).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    try:
+        last = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(last["date"]), ObjectId(last["id"])
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def _plan_summary(explain: dict) -> dict:
+    """Etapas e índices del plan ganador, y si la consulta recorrió la colección entera."""
+    planner = explain.get("queryPlanner", {})
+    winning = planner.get("winningPlan", {})
+    winning = winning.get("queryPlan", winning)  # motor SBE (Mongo 7+)
+    stages, indexes = [], []
+    pending = [winning]
+    while pending:
+        stage = pending.pop()
+        stages.append(stage.get("stage"))
+        if stage.get("indexName"):
+            indexes.append(stage["indexName"])
+        pending.extend(stage.get("inputStages", []))
+        if "inputStage" in stage:
+            pending.append(stage["inputStage"])
+    stats = explain.get("executionStats", {})
+    return {
+        "index_backed": "COLLSCAN" not in stages,
+        "stages": stages,
+        "indexes": indexes,
+        "n_returned": stats.get("nReturned"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "execution_ms": stats.get("executionTimeMillis"),
+        "parsed_query": planner.get("parsedQuery"),
+    }
+
+
+def invoice_query(date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                  min_total: Optional[float] = None, max_total: Optional[float] = None,
+                  currency: Optional[str] = None, invoice_status: Optional[str] = None,
+                  cuit_ruc: Optional[str] = None, text: Optional[str] = None) -> dict:
+    """Filtro de Mongo de la búsqueda (también lo usan las operaciones masivas)."""
+    query = {}
+    if date_from or date_to:
+        query["date"] = {**({"$gte": date_from} if date_from else {}), **({"$lte": date_to} if date_to else {})}
+    if min_total is not None or max_total is not None:
+        query["total_price"] = {**({"$gte": min_total} if min_total is not None else {}),
+                                **({"$lte": max_total} if max_total is not None else {})}
+    if currency:
+        query["currency"] = currency.upper()
+    if invoice_status:
+        query["status"] = invoice_status
+    if cuit_ruc:
+        query["cuit_ruc"] = cuit_ruc
+    if text:
+        query["$text"] = {"$search": text}
+    return query
+
+
+def search_invoices(date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                    min_total: Optional[float] = None, max_total: Optional[float] = None,
+                    currency: Optional[str] = None, invoice_status: Optional[str] = None,
+                    cuit_ruc: Optional[str] = None, text: Optional[str] = None,
+                    limit: int = 50, cursor: Optional[str] = None, debug: bool = False) -> InvoiceSearchPage:
+    """
+    Búsqueda de facturas ordenada por fecha (más nuevas primero) con paginación
+    por cursor: cada página sigue desde la última (date, _id) de la anterior, así
+    el costo no crece con el número de página como con skip. Los índices que la
+    respaldan se crean en db/config/indexes.py; con `debug` se devuelve el plan.
+    """
+    query = invoice_query(date_from, date_to, min_total, max_total, currency, invoice_status, cuit_ruc, text)
+    if cursor:
+        last_date, last_id = _decode_cursor(cursor)
+        query["$or"] = [{"date": {"$lt": last_date}}, {"date": last_date, "_id": {"$lt": last_id}}]
+
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    # Uno más para saber si hay otra página; raw_answer no se devuelve en los listados
+    find = db.invoices.find(query, {"raw_answer": 0}).sort([("date", -1), ("_id", -1)]).limit(limit + 1)
+    invoices = list(find)
+    next_cursor = _encode_cursor(invoices[limit - 1]) if len(invoices) > limit else None
+
+    explain = None
+    if debug:
+        explain = _plan_summary(find.clone().explain())
+        logger.debug(f"Invoice search plan: {explain['stages']} {explain['indexes']}")
+
+    return InvoiceSearchPage(
+        items=[InvoiceModel(**invoice) for invoice in invoices_schema(invoices[:limit])],
+        next_cursor=next_cursor,
+        explain=explain,
+    )
+
+
 # Create Invoice
 def create_invoice(invoice: InvoiceCreate):
     try:
         logger.info(f"Creating Invoice: {invoice.invoice_file}")
 
-        existing_invoice = search_invoice('invoice_file', invoice.invoice_file)
-        if existing_invoice:
-            logger.warning(f"Invoice already exists: {invoice.invoice_file}")
+        invoice_dict = invoice.dict()
+        invoice_dict["dedupe_key"] = dedupe_key(invoice_dict)
+        invoice_dict["created_at"] = datetime.now()
+
+        # El índice único resuelve la carrera entre dos altas iguales (no hay find_one previo)
+        try:
+            id = db.invoices.insert_one(invoice_dict).inserted_id
+        except DuplicateKeyError:
+            logger.warning(f"Invoice already exists: {invoice_dict['dedupe_key']}")
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail='Invoice already exists'
             )
 
-        invoice_dict = invoice.dict()
-        invoice_dict["created_at"] = datetime.now()
-
-        id = db.invoices.insert_one(invoice_dict).inserted_id
-
         logger.info(f"Invoice created with ID: {id}")
 
         new_invoice = invoice_schema(db.invoices.find_one({'_id': id}))
@@ -261,13 +357,21 @@ async def update_invoice(id: str, invoice: InvoiceModel):
             )
 
         invoice_dict = invoice.model_dump(exclude='id')
+        invoice_dict["dedupe_key"] = dedupe_key(invoice_dict)
         invoice_dict["updated_at"] = datetime.now()
 
-        result = db.invoices.find_one_and_update(
-            {'_id': ObjectId(id)},
-            {'$set': invoice_dict},
-            return_document=True
-        )
+        try:
+            result = db.invoices.find_one_and_update(
+                {'_id': ObjectId(id)},
+                {'$set': invoice_dict},
+                return_document=True
+            )
+        except DuplicateKeyError:
+            logger.warning(f"Invoice {id} would duplicate {invoice_dict['dedupe_key']}")
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail='Another invoice already has this tax ID and invoice number'
+            )
 
         if result is None:
             logger.warning(f"Invoice not updated, not found: {id}")
@@ -276,7 +380,8 @@ async def update_invoice(id: str, invoice: InvoiceModel):
                 detail='Invoice not found'
             )
 
-        logger.info(f"Invoice updated: {result}")
+        logger.info(f"Invoice updated: {result['_id']}")
+        _invalidate_derived([id])
         return InvoiceModel(**invoice_schema(result))
     
     except HTTPException:
@@ -306,6 +411,120 @@ def delete_existing_invoice(id:str):
         )
     
     db.invoices.delete_one({'_id': ObjectId(id)})
+    _invalidate_derived([id], deleted=True)
 
     
-    return InvoiceModel(**invoice_schema(invoice_found))
\ No newline at end of file
+    return InvoiceModel(**invoice_schema(invoice_found))
+
+
+# Bulk update / delete: una sola bulk_write desordenada y un resultado por id
+BULK_MAX_INVOICES = 10000
+
+
+def _bulk_targets(ids: Optional[List[str]], invoice_filter: Optional[InvoiceBulkFilter],
+                  projection: dict) -> tuple[list, list]:
+    """Facturas a modificar (una consulta) y los resultados de los ids inválidos o inexistentes."""
+    if (ids is None) == (invoice_filter is None):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Send either ids or filter")
+
+    results = []
+    if ids is not None:
+        if len(ids) > BULK_MAX_INVOICES:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"At most {BULK_MAX_INVOICES} ids per request")
+        object_ids = []
+        for invoice_id in dict.fromkeys(ids):
+            if ObjectId.is_valid(invoice_id):
+                object_ids.append(ObjectId(invoice_id))
+            else:
+                results.append({"id": invoice_id, "status": "invalid_id"})
+        docs = list(db.invoices.find({"_id": {"$in": object_ids}}, projection))
+        found = {doc["_id"] for doc in docs}
+        results += [{"id": str(oid), "status": "not_found"} for oid in object_ids if oid not in found]
+        return docs, results
+
+    criteria = invoice_filter.model_dump()
+    query = invoice_query(invoice_status=criteria.pop("status"), **criteria)
+    if not query:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty filter")
+    docs = list(db.invoices.find(query, projection).limit(BULK_MAX_INVOICES + 1))
+    if len(docs) > BULK_MAX_INVOICES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Filter matches more than {BULK_MAX_INVOICES} invoices; narrow it down")
+    return docs, results
+
+
+def _run_bulk(operations: list, docs: list, done_status: str, results: list) -> int:
+    errors = {}
+    count = 0
+    if operations:
+        try:
+            res = db.invoices.bulk_write(operations, ordered=False)
+            count = res.deleted_count if done_status == "deleted" else res.modified_count
+        except BulkWriteError as e:
+            count = e.details.get("nRemoved" if done_status == "deleted" else "nModified", 0)
+            errors = {error["index"]: error for error in e.details.get("writeErrors", [])}
+
+    for index, doc in enumerate(docs):
+        error = errors.get(index)
+        if error is None:
+            results.append({"id": str(doc["_id"]), "status": done_status})
+        elif error.get("code") == 11000:
+            results.append({"id": str(doc["_id"]), "status": "conflict",
+                            "error": "Another invoice already has this tax ID and invoice number"})
+        else:
+            results.append({"id": str(doc["_id"]), "status": "error", "error": error.get("errmsg")})
+    return count
+
+
+def _invalidate_derived(invoice_ids: List[str], deleted: bool = False) -> int:
+    """
+    Marca como desactualizado el Excel de las corridas que incluyen estas
+    facturas (POST /process/runs/{run_id}/report lo regenera). Al borrar, además
+    las saca de la corrida, del registro de objetos procesados y del índice de
+    casi-duplicados.
+    """
+    if not invoice_ids:
+        return 0
+    update = {"$set": {"report_stale": True, "updated_at": datetime.now()}}
+    if deleted:
+        update["$pull"] = {"invoices": {"$in": invoice_ids}}
+        db.processed_objects.delete_many({"invoice_id": {"$in": invoice_ids}})
+        near_duplicate_index.forget(invoice_ids)
+    return db.processing_run.update_many({"invoices": {"$in": invoice_ids}}, update).modified_count
+
+
+def bulk_update_invoices(request: InvoiceBulkUpdate) -> dict:
+    patch = request.patch.model_dump(exclude_none=True)
+    if not patch:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty patch")
+    if "currency" in patch:
+        patch["currency"] = patch["currency"].upper()
+
+    # Si cambia el CUIT o el número se recalcula la clave de cada factura
+    rekey = "cuit_ruc" in patch or "invoice_number" in patch
+    projection = {"cuit_ruc": 1, "invoice_number": 1, "content_sha256": 1, "complete_path": 1} if rekey else {"_id": 1}
+    docs, results = _bulk_targets(request.ids, request.filter, projection)
+
+    now = datetime.now()
+    operations = []
+    for doc in docs:
+        fields = {**patch, "updated_at": now}
+        if rekey:
+            fields["dedupe_key"] = dedupe_key({**doc, **patch})
+        operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+    modified = _run_bulk(operations, docs, "updated", results)
+
+    updated = [r["id"] for r in results if r["status"] == "updated"]
+    runs = _invalidate_derived(updated)
+    logger.info(f"Bulk update: {len(docs)} matched, {modified} modified, {runs} runs invalidated")
+    return {"matched": len(docs), "modified": modified, "runs_invalidated": runs, "results": results}
+
+
+def bulk_delete_invoices(request: InvoiceBulkDelete) -> dict:
+    docs, results = _bulk_targets(request.ids, request.filter, {"_id": 1})
+    deleted = _run_bulk([DeleteOne({"_id": doc["_id"]}) for doc in docs], docs, "deleted", results)
+
+    runs = _invalidate_derived([r["id"] for r in results if r["status"] == "deleted"], deleted=True)
+    logger.info(f"Bulk delete: {len(docs)} matched, {deleted} deleted, {runs} runs invalidated")
+    return {"matched": len(docs), "deleted": deleted, "runs_invalidated": runs, "results": results}
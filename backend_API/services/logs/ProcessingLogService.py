@@ -1,12 +1,11 @@
-import logging
 from fastapi import HTTPException
 from backend_API.db.config import db
 from backend_API.models.logs.ProcessingLogModel import ProcessingLogModel
 from backend_API.schema.logs.ProcessingLogSchema import processing_log_schema, processing_logs_schema
+from backend_API.utils.logger import setup_logger
 
 # Logger configuration
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+logger = setup_logger("ProcessingLogService")
 
 
 # Search Log
@@ -19,7 +18,7 @@ def search_processing_log(field: str, key):
         if not log:
             return {"error": "Log not found"}
         
-        print(log)
+        logger.debug(f"Log found: {log['_id']}")
         return ProcessingLogModel(**processing_log_schema(log))
     except:
         raise{"error": "Log not found"}
@@ -0,0 +1,144 @@
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator
+from backend_API.db.config.db import db
+from backend_API.models.processing.PrefixRunRequest import PrefixRunRequest
+from backend_API.services.processing.ProcessingService import ProcessingService, RunContext
+from backend_API.utils.config import PREFIX_WORKERS, SUPPORTED_FORMATS
+from backend_API.utils.ingestion import spool_chunks
+from backend_API.utils.logger import setup_logger
+from backend_API.utils.metrics import CACHE_HITS, QUEUE_DEPTH, count_outcome, track_stage
+from backend_API.utils.storage_utils import StorageBackend, get_storage
+from backend_API.utils.tracing import span
+
+logger = setup_logger("PrefixService")
+
+# Claves por consulta a processed_objects (coincide con el tamaño de página de S3)
+LOOKUP_BATCH_SIZE = 1000
+
+
+class PrefixService:
+    """
+    Procesa imágenes que ya están en el storage bajo un prefijo, sin volver a
+    subirlas. Cada objeto se registra en processed_objects (clave + ETag) apenas
+    su resultado queda guardado, así una corrida interrumpida se retoma volviendo a llamar con el
+    mismo prefijo: solo se procesan los objetos nuevos, modificados o con error.
+    """
+
+    @staticmethod
+    def process_prefix(request: PrefixRunRequest) -> dict:
+        storage = get_storage()
+
+        ctx = RunContext(source={"type": "prefix", "prefix": request.prefix})
+        workers = max(1, request.workers or PREFIX_WORKERS)
+        counters = {"listed": 0, "skipped": 0}
+
+        with span("process_prefix", run_id=ctx.run_id, prefix=request.prefix):
+            pending = PrefixService.pending_objects(storage.list(request.prefix), request, counters)
+            if request.max_objects:
+                pending = islice(pending, request.max_objects)
+            total = PrefixService._process_objects(ctx, storage, pending, workers)
+            result = ProcessingService.finalize_run(ctx, total)
+
+        result["summary"]["objects_listed"] = counters["listed"]
+        result["summary"]["objects_skipped"] = counters["skipped"]
+        logger.info(f"Prefix {request.prefix}: {total} processed, {counters['skipped']} already processed")
+        return result
+
+    @staticmethod
+    def pending_objects(objects: Iterable[dict], request: PrefixRunRequest, counters: dict) -> Iterator[dict]:
+        """Filtra los objetos soportados que no se procesaron (o omitieron por casi-duplicados) con el mismo ETag."""
+        objects = iter(objects)
+        while True:
+            page = []
+            for obj in objects:
+                counters["listed"] += 1
+                if Path(obj["key"]).suffix.lower() in SUPPORTED_FORMATS:
+                    page.append(obj)
+                if len(page) == LOOKUP_BATCH_SIZE:
+                    break
+            if not page:
+                return
+
+            done = {}
+            if not request.reprocess:
+                cursor = db.processed_objects.find(
+                    {"key": {"$in": [obj["key"] for obj in page]}, "status": {"$in": ["Success", "Skipped"]}},
+                    {"key": 1, "etag": 1},
+                )
+                done = {doc["key"]: doc["etag"] for doc in cursor}
+
+            for obj in page:
+                if done.get(obj["key"]) == obj["etag"]:
+                    counters["skipped"] += 1
+                    CACHE_HITS.labels("processed_objects").inc()
+                    continue
+                yield obj
+
+    @staticmethod
+    def _process_objects(ctx: RunContext, storage: StorageBackend, objects: Iterable[dict], workers: int) -> int:
+        # Como mucho workers * 2 objetos descargados o en espera a la vez
+        slots = threading.BoundedSemaphore(workers * 2)
+        total = 0
+
+        def run_object(obj: dict):
+            try:
+                PrefixService.process_object(ctx, storage, obj)
+            except Exception as e:
+                # process_object no propaga errores de la extracción, pero sí los de Mongo al marcar
+                # o guardar el lote; se registran acá en vez de guardar un future por objeto
+                logger.error(f"❌ Error procesando {obj['key']}: {e}")
+                ctx.add_error(obj["key"], f"Error processing {obj['key']}: {e}")
+                count_outcome(False)
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for obj in objects:
+                total += 1
+                slots.acquire()
+                QUEUE_DEPTH.inc()
+                executor.submit(contextvars.copy_context().run, run_object, obj)
+        return total
+
+    @staticmethod
+    def process_object(ctx: RunContext, storage: StorageBackend, obj: dict):
+        """Descarga el objeto y lo procesa sin volver a subirlo (también lo usa el modo worker)."""
+        key = obj["key"]
+        try:
+            with track_stage("s3_download"):
+                upload = spool_chunks(storage.open_stream(key), key)
+        except Exception as e:
+            QUEUE_DEPTH.dec()
+            log = ctx.add_error(key, f"Error downloading {key}: {getattr(e, 'detail', e)}", storage.url_for(key))
+            count_outcome(False)
+            PrefixService._mark_processed(ctx, obj, log)
+        else:
+            ctx.profiler.add_bytes("downloaded", upload.size)
+            try:
+                # El objeto se marca cuando su factura queda escrita (por lotes), no antes
+                ProcessingService.process_file(ctx, upload, stored_key=key,
+                                               on_saved=lambda log: PrefixService._mark_processed(ctx, obj, log))
+            finally:
+                upload.close()
+
+    @staticmethod
+    def _mark_processed(ctx: RunContext, obj: dict, log: dict):
+        key = obj["key"]
+        db.processed_objects.update_one(
+            {"key": key},
+            {"$set": {
+                "key": key,
+                "etag": obj["etag"],
+                "size": obj["size"],
+                "run_id": ctx.run_id,
+                "status": log["status"],
+                "invoice_id": log.get("invoice_id"),
+                "processed_at": datetime.utcnow(),
+            }},
+            upsert=True,
+        )
@@ -1,13 +1,28 @@
-import io
 import os
-import json
 import uuid
-import pandas as pd
+import tempfile
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List
-from fastapi import UploadFile
-from backend_API.utils.s3_utils import upload_image_to_aws
-from backend_API.utils.gemini_utils import extract_invoice_data, parse_safe_email, parse_safe_float, parse_safe_int
+from typing import Callable, List, Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, UploadFile, status
+from starlette.concurrency import run_in_threadpool
+from pymongo import UpdateOne
+from backend_API.utils.storage_utils import get_storage
+from backend_API.utils.gemini_utils import ParseStats, extract_invoice_response, normalize_invoice_data
+from backend_API.utils.metrics import IN_FLIGHT, NEAR_DUPLICATES, QUEUE_DEPTH, count_outcome, track_stage
+from backend_API.utils.phash_utils import NearDuplicateIndex, hamming, image_hash
+from backend_API.utils.invoice_utils import DATA_FIELDS, dedupe_key, same_data
+from backend_API.utils.profiling import RunProfiler
+from backend_API.utils.cpu_pool import cpu_pool
+from backend_API.utils.report_utils import build_excel, to_sheet
+from backend_API.utils.tracing import span
+from backend_API.utils.ingestion import IngestedFile, ingest_upload
+from backend_API.utils.archive_utils import is_archive, iter_archive_members
+from backend_API.utils.config import ARCHIVE_WORKERS, NEAR_DUPLICATE_MODE, NEAR_DUPLICATE_THRESHOLD, REPORTS_PREFIX
 from backend_API.db.config.db import db
 from backend_API.models.invoice.InvoiceCreate import InvoiceCreate
 from backend_API.models.logs.ProcessingLogCreate import ProcessingLogCreate
@@ -17,176 +32,386 @@ from backend_API.models.processing.ProcessingRunCreate import ProcessingRunCreat
 # Configuración
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Facturas que se acumulan antes de escribirlas con un solo bulk_write
+WRITE_BATCH_SIZE = 100
+
+REPORT_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Hashes perceptuales de las facturas guardadas; se carga en la primera búsqueda
+near_duplicate_index = NearDuplicateIndex(db.invoices)
+
+
+class RunContext:
+    """
+    Estado de una corrida mientras se procesan sus archivos. Los archivos de
+    un ZIP/TAR se procesan en paralelo, por eso las altas van con lock.
+    """
+
+    def __init__(self, source: Optional[dict] = None, run_oid: Optional[ObjectId] = None):
+        # El id del run se genera antes para poder etiquetar los spans de cada archivo
+        # (o lo trae el router, para asociarlo a un Idempotency-Key)
+        self.run_oid = run_oid or ObjectId()
+        self.start_time = datetime.utcnow()
+        self.today_path = self.start_time.strftime("%Y/%m/%d")
+        self.source = source
+        self.invoice_ids = []
+        self.logs = []
+        self.extracted_data = []
+        self.near_duplicates = []
+        self.invoice_writes = {"inserted": 0, "updated": 0, "unchanged": 0}
+        self._pending_invoices = []
+        self._writing = []  # lotes que se están escribiendo (todavía no visibles en Mongo)
+        self.parse_stats = ParseStats()
+        self.profiler = RunProfiler()
+        self._lock = threading.Lock()
+
+    @property
+    def run_id(self) -> str:
+        return str(self.run_oid)
+
+    def add(self, log: dict, invoice_id: Optional[str] = None, row: Optional[dict] = None):
+        with self._lock:
+            self.logs.append(log)
+            if invoice_id:
+                self.invoice_ids.append(invoice_id)
+            if row:
+                self.extracted_data.append(row)
+
+    def add_error(self, filename: str, error: str, image_url: str = "N/A", raw_answer: Optional[str] = None) -> dict:
+        log = ProcessingLogCreate(
+            invoice_filename=filename,
+            image_url=image_url,
+            status="Error",
+            error_message=error,
+            raw_answer=raw_answer,
+            created_at=datetime.utcnow()
+        ).dict()
+        self.add(log)
+        return log
+
+    def add_near_duplicate(self, filename: str, match: dict, action: str):
+        with self._lock:
+            self.near_duplicates.append({
+                "file": filename,
+                "action": action,
+                "duplicate_of_invoice_id": match["invoice_id"],
+                "duplicate_of_file": match["invoice_file"],
+                "distance": match["distance"],
+            })
+        NEAR_DUPLICATES.labels(action).inc()
+
+    def queue_invoice(self, invoice: dict, log: dict, on_saved: Optional[Callable[[dict], None]] = None):
+        """Encola la factura para el próximo bulk_write; el log recibe el invoice_id al escribirse."""
+        with self._lock:
+            self._pending_invoices.append((invoice, log, on_saved))
+            full = len(self._pending_invoices) >= WRITE_BATCH_SIZE
+        if full:
+            self.flush_invoices()
+
+    def flush_invoices(self):
+        with self._lock:
+            pending, self._pending_invoices = self._pending_invoices, []
+            self._writing.extend(pending)
+        if not pending:
+            return
+        try:
+            with self.profiler.run_stage("mongo_write"), track_stage("mongo_write"):
+                results = ProcessingService.save_invoices([invoice for invoice, _, _ in pending])
+        except Exception as e:
+            results = None
+            for _, log, _ in pending:
+                log.update(status="Error", error_message=f"Error saving invoice: {e}")
+        finally:
+            # Escritas, ya las ve el índice de casi-duplicados; si falló el lote, no existen
+            written = {id(item) for item in pending}
+            with self._lock:
+                self._writing = [item for item in self._writing if id(item) not in written]
+        if results is not None:
+            with self._lock:
+                for (_, log, _), (invoice_id, outcome) in zip(pending, results):
+                    log["invoice_id"] = invoice_id
+                    self.invoice_ids.append(invoice_id)
+                    self.invoice_writes[outcome] += 1
+        for _, log, on_saved in pending:
+            if on_saved:
+                on_saved(log)
+
+    def find_pending(self, phash: str, threshold: int) -> Optional[dict]:
+        """Factura de esta corrida todavía sin escribir más parecida a `phash` dentro del umbral."""
+        value = int(phash, 16)
+        with self._lock:
+            candidates = [invoice for invoice, _, _ in self._pending_invoices + self._writing if invoice.get("phash")]
+        best = min(((hamming(value, int(invoice["phash"], 16)), invoice["invoice_file"]) for invoice in candidates),
+                   default=None)
+        if best is None or best[0] > threshold:
+            return None
+        return {"invoice_id": None, "invoice_file": best[1], "distance": best[0]}
+
+    def add_skipped(self, filename: str, match: dict, image_url: str = "N/A") -> dict:
+        self.add_near_duplicate(filename, match, "skipped")
+        log = ProcessingLogCreate(
+            invoice_filename=filename,
+            image_url=image_url,
+            status="Skipped",
+            error_message=(f"Near-duplicate of {match['invoice_file']} "
+                           f"(invoice {match['invoice_id']}, distance {match['distance']})"),
+            created_at=datetime.utcnow()
+        ).dict()
+        self.add(log)
+        return log
+
+
 class ProcessingService:
     @staticmethod
-    async def process_batch(files: List[UploadFile]) -> dict:
-        processed = []
-        extracted_data = []
-        start_time = datetime.utcnow()
-        today_path = start_time.strftime("%Y/%m/%d")
-        invoice_ids = []
-        logs = []
-
-        for file in files:
-            try:
-                
-                # Leer archivo una sola vez
-                content = await file.read()
-                unique_name = f"{uuid.uuid4()}_{file.filename}"
-                s3_path = f"{today_path}/{unique_name}"
+    async def process_batch(files: List[UploadFile], run_oid: Optional[ObjectId] = None) -> dict:
+        ctx = RunContext(run_oid=run_oid)
+        with span("process_batch", run_id=ctx.run_id, files=len(files)):
+            QUEUE_DEPTH.inc(len(files))
+            for file in files:
+                try:
+                    # Se recorre por bloques (tamaño, hash, límite) y después storage y
+                    # Gemini leen el mismo handle: nunca hay una copia entera en memoria
+                    upload = await ingest_upload(file)
+                except Exception as e:
+                    QUEUE_DEPTH.dec()
+                    ctx.add_error(file.filename, str(e))
+                    count_outcome(False)
+                    await file.close()
+                    continue
+                try:
+                    await run_in_threadpool(ProcessingService.process_file, ctx, upload)
+                finally:
+                    # Libera el spool de la subida apenas termina el archivo
+                    await file.close()
 
-                image_url = upload_image_to_aws(io.BytesIO(content), s3_path, file.content_type)
+            return await run_in_threadpool(ProcessingService.finalize_run, ctx, len(files))
 
+    @staticmethod
+    async def process_archive(file: UploadFile) -> dict:
+        """
+        Procesa un ZIP o TAR con facturas como una sola corrida. Los miembros se
+        leen de a uno y se procesan con hasta ARCHIVE_WORKERS en paralelo.
+        """
+        if not is_archive(file.filename):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="Expected a .zip, .tar, .tar.gz, .tgz, .tar.bz2 or .tar.xz file")
+        ctx = RunContext(source={"type": "archive", "name": file.filename})
+        try:
+            with span("process_archive", run_id=ctx.run_id, archive=file.filename):
+                total = await run_in_threadpool(ProcessingService._process_archive_members, ctx, file)
+                return await run_in_threadpool(ProcessingService.finalize_run, ctx, total)
+        finally:
+            await file.close()
+
+    @staticmethod
+    def _process_archive_members(ctx: RunContext, file: UploadFile, workers: int = ARCHIVE_WORKERS) -> int:
+        # Como mucho workers * 2 miembros descomprimidos a la vez (en proceso o en espera)
+        slots = threading.BoundedSemaphore(workers * 2)
+        total = 0
+        futures = {}
+
+        def run_member(member: IngestedFile):
+            try:
+                ProcessingService.process_file(ctx, member)
+            finally:
+                member.close()
+                slots.release()
+
+        file.file.seek(0)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for name, member, error in iter_archive_members(file.file, file.filename):
+                    total += 1
+                    if member is None:
+                        ctx.add_error(name, error)
+                        count_outcome(False)
+                        continue
+                    slots.acquire()
+                    QUEUE_DEPTH.inc()
+                    # Cada tarea hereda el contexto actual: los spans quedan bajo process_archive
+                    futures[executor.submit(contextvars.copy_context().run, run_member, member)] = name
+            except Exception as e:
+                if not total:
+                    raise  # archivo inválido o ZIP con demasiados miembros: no se procesó nada
+                # TAR que pasa ARCHIVE_MAX_MEMBERS o que se corta a la mitad: las facturas ya
+                # guardadas necesitan su run, así que se cierra con lo procesado hasta acá
+                ctx.source["error"] = getattr(e, "detail", None) or str(e)
 
-                # Guardado temporal para Gemini (si lo necesita localmente)
-                temp_path = f"temp/{unique_name}"
-                os.makedirs("temp", exist_ok=True)
-                with open(temp_path, "wb") as f:
-                    f.write(content)
+        for future, name in futures.items():
+            if future.exception() is not None:
+                ctx.add_error(name, f"Error processing {name}: {future.exception()}")
+                count_outcome(False)
+        return total
 
-                # Procesamiento con Gemini
-                success, data, error = extract_invoice_data(temp_path)
+    @staticmethod
+    def process_file(ctx: RunContext, upload: IngestedFile, stored_key: Optional[str] = None,
+                     on_saved: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Sube el archivo, lo extrae con Gemini y encola la factura para guardarla.
+        Nunca propaga errores: el resultado queda como log (Success/Error) en la corrida.
+        Con `stored_key` el archivo ya está en el storage y no se vuelve a subir.
+        `on_saved(log)` se llama cuando el resultado queda guardado: enseguida si
+        no hay factura, o cuando se escribe el lote que la contiene.
+        """
+        QUEUE_DEPTH.dec()
+        IN_FLIGHT.inc()
+        filename = upload.filename
+        log = None
+        queued = False
+        with span("process_file", run_id=ctx.run_id, file_name=filename,
+                  file_size=upload.size, content_sha256=upload.sha256) as file_span, \
+                ctx.profiler.file(filename):
+            image_url = "N/A"
+            raw_text = None
+            try:
+                phash, match = ProcessingService.find_near_duplicate(ctx, upload)
+                if match and NEAR_DUPLICATE_MODE == "skip":
+                    # Ni storage ni Gemini: la factura ya está guardada (on_saved se llama al final)
+                    log = ctx.add_skipped(filename, match)
+                else:
+                    if match:
+                        ctx.add_near_duplicate(filename, match, "flagged")
 
-                os.remove(temp_path)
+                    if stored_key:
+                        s3_path = stored_key
+                        image_url = get_storage().url_for(stored_key)
+                    else:
+                        unique_name = f"{uuid.uuid4()}_{os.path.basename(filename)}"
+                        s3_path = f"{ctx.today_path}/{unique_name}"
 
-                timestamp = datetime.utcnow()
-                raw_data = json.dumps(data) if success else None
+                        with track_stage("s3_upload"):
+                            image_url = get_storage().put(s3_path, upload.rewind(), upload.content_type)
+                        ctx.profiler.add_bytes("uploaded", upload.size)
 
-                if success:
-                    try:
-                        
-                        datos = data
+                    # Procesamiento con Gemini
+                    success, data, error, raw_text = extract_invoice_response(upload.file, ctx.parse_stats, filename=filename)
+                    timestamp = datetime.utcnow()
 
-                        inv = InvoiceCreate(
-                            invoice_file=file.filename,
+                    if not success:
+                        log = ctx.add_error(filename, error, image_url, raw_text)
+                    else:
+                        inv = ProcessingService.build_invoice(
+                            data,
+                            invoice_file=filename,
                             complete_path=s3_path,
                             image_url=image_url,
                             timestamp=timestamp,
-                            company=datos.get("empresa", "No encontrado"),
-                            date=datetime.fromisoformat(datos.get("fecha")) if datos.get("fecha") else timestamp,
-                            invoice_number=datos.get("numero_factura", "No encontrado"),
-                            total_price=parse_safe_float(datos.get("precio_total")),
-                            currency=datos.get("moneda", "No encontrado"),
-                            number_of_items=parse_safe_int(datos.get("cantidad_items")),
-                            main_description=datos.get("descripcion_principal", "No encontrado"),
-                            cuit_ruc=datos.get("cuit_ruc", "No encontrado"),
-                            address=datos.get("direccion", "No encontrado"),
-                            phone=datos.get("telefono", "No encontrado"),
-                            email=parse_safe_email(datos.get("email")),
-                            status="Success",
-                            raw_answer=raw_data,
+                            raw_answer=raw_text,
+                            content_sha256=upload.sha256,
+                            phash=phash,
+                            near_duplicate_of=match["invoice_id"] if match else None,
                         )
 
-
-                        res = db.invoices.insert_one(inv.dict())
-                        invoice_ids.append(str(res.inserted_id))
-
-                        logs.append(ProcessingLogCreate(
-                            invoice_filename=file.filename,
+                        log = ProcessingLogCreate(
+                            invoice_filename=filename,
                             image_url=image_url,
                             status="Success",
                             processing_run_id=None,  # se agregará después
+                            invoice_id=None,  # al escribir el lote
                             created_at=timestamp
-                        ).dict())
-
-                        extracted_data.append({
-                            "invoice_filename": file.filename,
-                            "image_url": image_url,
-                            "company": inv.company,
-                            "date": inv.date,
-                            "invoice_number": inv.invoice_number,
-                            "total_price": inv.total_price,
-                            "currency": inv.currency,
-                            "number_of_items": inv.number_of_items,
-                            "main_description": inv.main_description,
-                            "cuit_ruc": inv.cuit_ruc,
-                            "address": inv.address,
-                            "phone": inv.phone,
-                            "email": inv.email,
-                        })
-
-
-                    except Exception as json_error:
-                        logs.append(ProcessingLogCreate(
-                            invoice_filename=file.filename,
-                            image_url=image_url,
-                            status="Error",
-                            error_message=f"Error parseando JSON: {json_error}",
-                            created_at=timestamp
-                        ).dict())
-                else:
-                    logs.append(ProcessingLogCreate(
-                        invoice_filename=file.filename,
-                        image_url=image_url,
-                        status="Error",
-                        error_message=error,
-                        created_at=timestamp
-                    ).dict())
+                        ).dict()
+                        ctx.add(log, row=ProcessingService.extracted_row(inv.dict()))
+                        ctx.queue_invoice(inv.dict(), log, on_saved)
+                        queued = True
 
             except Exception as e:
-                logs.append(ProcessingLogCreate(
-                    invoice_filename=file.filename,
-                    image_url="N/A",
-                    status="Error",
-                    error_message=str(e),
-                    created_at=datetime.utcnow()
-                ).dict())
+                error_message = f"Error parseando JSON: {e}" if raw_text else str(e)
+                log = ctx.add_error(filename, error_message, image_url, raw_text)
+            finally:
+                IN_FLIGHT.dec()
+                file_status = log["status"] if log is not None else "Error"
+                count_outcome(file_status == "Success", skipped=file_status == "Skipped")
+                file_span.set_attribute("status", file_status)
+        if on_saved and not queued:
+            on_saved(log)
+        return log
+
+    @staticmethod
+    def find_near_duplicate(ctx: RunContext, upload: IngestedFile) -> tuple[Optional[str], Optional[dict]]:
+        """
+        Hash perceptual del archivo y la factura más parecida dentro de NEAR_DUPLICATE_THRESHOLD:
+        entre las guardadas o entre las de esta corrida que esperan su lote. Los PDF no se
+        comparan (no se rasterizan solo para esto).
+        """
+        if NEAR_DUPLICATE_MODE == "off":
+            return None, None
+        with track_stage("phash"):
+            phash = image_hash(upload.file, upload.filename)
+            if not phash:
+                return None, None
+            matches = [m for m in (near_duplicate_index.find(phash, NEAR_DUPLICATE_THRESHOLD),
+                                   ctx.find_pending(phash, NEAR_DUPLICATE_THRESHOLD)) if m]
+        # A igual distancia, mejor una factura ya guardada (con id)
+        match = min(matches, key=lambda m: (m["distance"], m["invoice_id"] is None), default=None)
+        return phash, match
+
+    @staticmethod
+    def finalize_run(ctx: RunContext, total_files: int) -> dict:
+        """Guarda estadísticas, Excel, el run y sus logs, y devuelve el resumen."""
+        ctx.flush_invoices()
+        profiler = ctx.profiler
+        logs = ctx.logs
+        # Un reproceso puede traer la misma factura dos veces en la corrida
+        invoice_ids = list(dict.fromkeys(ctx.invoice_ids))
 
         # Resumen
-        total_files = len(files)
         successful = len([l for l in logs if l["status"] == "Success"])
-        errors = total_files - successful
+        skipped = len([l for l in logs if l["status"] == "Skipped"])
+        errors = total_files - successful - skipped
         success_rate = (successful / total_files * 100) if total_files > 0 else 0
 
         # Guardar estadísticas
         stats = StatisticsProcessCreate(
-            process_date=start_time,
+            process_date=ctx.start_time,
             total_files=total_files,
             successful=successful,
             errors=errors,
-            success_rate=success_rate
+            success_rate=success_rate,
+            processing_run_id=ctx.run_id
         )
-        db.statistics.insert_one(stats.dict())
+        with profiler.run_stage("mongo_write"), track_stage("mongo_write"):
+            db.statistics.insert_one(stats.dict())
 
         # Exportar Excel
-        filename_base = start_time.strftime("invoice_report_%Y-%m-%dT%H-%M-%S")
-        excel_name = f"{filename_base}.xlsx"
-        excel_path = f"reports/{excel_name}"
-        os.makedirs("reports", exist_ok=True)
-
-        df_success = pd.DataFrame([l for l in logs if l["status"] == "Success"])
-        df_error = pd.DataFrame([l for l in logs if l["status"] == "Error"])
-        df_extracted = pd.DataFrame(extracted_data)
-
-        with pd.ExcelWriter(excel_path) as writer:
-            if not df_extracted.empty:
-                df_extracted.to_excel(writer, sheet_name="ExtractedData", index=False)
-            if not df_success.empty:
-                df_success.to_excel(writer, sheet_name="Logs_Success", index=False)
-            if not df_error.empty:
-                df_error.to_excel(writer, sheet_name="Logs_Errors", index=False)
+        filename_base = ctx.start_time.strftime("invoice_report_%Y-%m-%dT%H-%M-%S")
+        # Con el id: dos corridas que empiezan en el mismo segundo (en cualquier nodo) no comparten Excel
+        excel_key = ProcessingService.report_key(f"{filename_base}_{ctx.run_id}")
 
+        with profiler.run_stage("excel"), track_stage("excel"):
+            report_size = ProcessingService.publish_report(excel_key, ctx.extracted_data, logs, ctx.near_duplicates)
+        profiler.add_bytes("report", report_size)
 
         # Crear ProcessingRun
         run = ProcessingRunCreate(
             name=filename_base,
-            folder_path=today_path,
+            folder_path=ctx.today_path,
             total_files=total_files,
             successful=successful,
             errors=errors,
+            skipped=skipped,
             success_rate=success_rate,
             invoices=invoice_ids,
-            excel_report_path=excel_path,
-            started_at=start_time,
+            invoice_writes=ctx.invoice_writes,
+            excel_report_key=excel_key,
+            parse_stats=ctx.parse_stats.as_dict(),
+            near_duplicates=ctx.near_duplicates,
+            source=ctx.source,
+            started_at=ctx.start_time,
             ended_at=datetime.utcnow()
         )
-        res = db.runs.insert_one(run.dict())
-        run_id = str(res.inserted_id)
+        with profiler.run_stage("mongo_write"), track_stage("mongo_write"):
+            res = db.runs.insert_one({"_id": ctx.run_oid, **run.dict()})
+            run_id = str(res.inserted_id)
 
-        # Actualizar logs con processing_run_id
-        for log in logs:
-            log["processing_run_id"] = run_id
-            db.processing_logs.insert_one(log)
+            # Actualizar logs con processing_run_id
+            for log in logs:
+                log["processing_run_id"] = run_id
+            if logs:
+                db.processing_logs.insert_many(logs)
+
+        # El perfil se cierra al final para incluir la escritura del run y los logs
+        timing_profile = profiler.as_dict()
+        db.runs.update_one({"_id": res.inserted_id}, {"$set": {"timing_profile": timing_profile}})
 
         return {
             "run_id": run_id,
@@ -194,8 +419,151 @@ class ProcessingService:
                 "total": total_files,
                 "success": successful,
                 "errors": errors,
+                "skipped": skipped,
                 "success_rate": success_rate,
-                "excel_report": excel_path,
-                "invoices": invoice_ids
+                "excel_report": excel_key,
+                "invoices": invoice_ids,
+                "invoice_writes": ctx.invoice_writes,
+                "parse_stats": ctx.parse_stats.as_dict(),
+                "near_duplicates": ctx.near_duplicates,
+                "source": ctx.source,
+                "timing_profile": timing_profile
             }
         }
+
+    @staticmethod
+    def find_run(run_id: str) -> dict:
+        try:
+            run = db.runs.find_one({"_id": ObjectId(run_id)})
+        except InvalidId:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid run ID")
+        if not run:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Run ID not found")
+        return run
+
+    @staticmethod
+    def save_invoices(invoices: List[dict]) -> List[tuple[str, str]]:
+        """
+        Guarda las facturas con upserts por dedupe_key (índice único) en un solo
+        bulk_write: volver a procesar los mismos archivos actualiza las facturas
+        existentes en lugar de duplicarlas. Devuelve (invoice_id, resultado) por
+        factura, con resultado "inserted", "updated" o "unchanged".
+        """
+        now = datetime.utcnow()
+        keys = [dedupe_key(invoice) for invoice in invoices]
+        projection = {"dedupe_key": 1, **{field: 1 for field in DATA_FIELDS}}
+        existing = {doc["dedupe_key"]: doc
+                    for doc in db.invoices.find({"dedupe_key": {"$in": list(set(keys))}}, projection)}
+
+        operations = []
+        results = []
+        inserts = {}  # índice de la operación -> clave
+        for invoice, key in zip(invoices, keys):
+            data = {field: invoice[field] for field in DATA_FIELDS}
+            current = existing.get(key)
+            if current is None:
+                inserts[len(operations)] = key
+                operations.append(UpdateOne(
+                    {"dedupe_key": key},
+                    {"$setOnInsert": {**invoice, "dedupe_key": key, "created_at": now}},
+                    upsert=True,
+                ))
+                # Si la misma factura aparece otra vez en el lote se compara contra esta
+                existing[key] = {"dedupe_key": key, **data}
+                results.append([key, "inserted"])
+            elif same_data(current, data):
+                results.append([key, "unchanged"])
+            else:
+                # La imagen y la fecha de alta originales se conservan
+                operations.append(UpdateOne(
+                    {"dedupe_key": key},
+                    {"$set": {**data, "raw_answer": invoice.get("raw_answer"), "updated_at": now}},
+                ))
+                current.update(data)
+                results.append([key, "updated"])
+
+        ids = {doc["dedupe_key"]: doc["_id"] for doc in existing.values() if "_id" in doc}
+        if operations:
+            res = db.invoices.bulk_write(operations, ordered=False)
+            for index, key in inserts.items():
+                if index in res.upserted_ids:
+                    ids[key] = res.upserted_ids[index]
+        missing = {key for key, _ in results if key not in ids}
+        if missing:
+            # Insertada al mismo tiempo por otra corrida: el upsert encontró la suya
+            for doc in db.invoices.find({"dedupe_key": {"$in": list(missing)}}, {"dedupe_key": 1}):
+                ids[doc["dedupe_key"]] = doc["_id"]
+            for result in results:
+                if result[0] in missing and result[1] == "inserted":
+                    result[1] = "unchanged"
+        return [(str(ids[key]), outcome) for key, outcome in results]
+
+    @staticmethod
+    def build_invoice(data: dict, **fields) -> InvoiceCreate:
+        """
+        Arma la factura a partir del JSON de Gemini. `fields` trae los datos del archivo
+        (invoice_file, complete_path, image_url, timestamp, raw_answer).
+        """
+        return InvoiceCreate(
+            **fields,
+            **normalize_invoice_data(data, default_date=fields["timestamp"]),
+            status="Success",
+        )
+
+    @staticmethod
+    def extracted_row(invoice: dict) -> dict:
+        return {
+            "invoice_filename": invoice["invoice_file"],
+            "image_url": invoice.get("image_url"),
+            "company": invoice.get("company"),
+            "date": invoice.get("date"),
+            "invoice_number": invoice.get("invoice_number"),
+            "total_price": invoice.get("total_price"),
+            "currency": invoice.get("currency"),
+            "number_of_items": invoice.get("number_of_items"),
+            "main_description": invoice.get("main_description"),
+            "cuit_ruc": invoice.get("cuit_ruc"),
+            "address": invoice.get("address"),
+            "phone": invoice.get("phone"),
+            "email": invoice.get("email"),
+        }
+
+    @staticmethod
+    def report_key(name: str) -> str:
+        return f"{REPORTS_PREFIX}/{name}.xlsx"
+
+    @staticmethod
+    def publish_report(key: str, extracted_data: List[dict], logs: List[dict],
+                       near_duplicates: Optional[List[dict]] = None) -> int:
+        """Genera el Excel en un temporal y lo sube al storage compartido. Devuelve el tamaño en bytes."""
+        fd, tmp_path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        try:
+            ProcessingService.write_excel_report(tmp_path, extracted_data, logs, near_duplicates)
+            return ProcessingService.upload_report(tmp_path, key)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def upload_report(local_path: str, key: str) -> int:
+        """Sube un Excel ya generado al storage (cualquier nodo de la API puede servirlo después)."""
+        size = os.path.getsize(local_path)
+        with open(local_path, "rb") as f:
+            get_storage().put(key, f, content_type=REPORT_CONTENT_TYPE)
+        return size
+
+    @staticmethod
+    def write_excel_report(excel_path: str, extracted_data: List[dict], logs: List[dict],
+                           near_duplicates: Optional[List[dict]] = None):
+        os.makedirs(os.path.dirname(excel_path) or ".", exist_ok=True)
+
+        # La respuesta cruda no va al Excel
+        log_rows = [{k: v for k, v in l.items() if k not in ("_id", "raw_answer")} for l in logs]
+        # Al pool de procesos van columnas + tuplas; los DataFrames y to_excel se arman allá
+        cpu_pool.run(build_excel, excel_path, [
+            to_sheet("ExtractedData", extracted_data),
+            to_sheet("Logs_Success", (l for l in log_rows if l["status"] == "Success")),
+            to_sheet("Logs_Errors", (l for l in log_rows if l["status"] == "Error")),
+            to_sheet("NearDuplicates", near_duplicates or []),
+        ])
@@ -0,0 +1,214 @@
+import time
+from collections import defaultdict
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from backend_API.db.config.db import db
+from backend_API.models.processing.ReparseRequest import ReparseRequest
+from backend_API.services.processing.ProcessingService import ProcessingService
+from backend_API.utils.gemini_utils import INVOICE_FIELD_KEYS, ParseStats, normalize_invoice_data, parse_invoice_response
+from backend_API.utils.invoice_utils import dedupe_key, same_data
+from backend_API.utils.logger import setup_logger
+from backend_API.utils.storage_utils import get_storage
+
+logger = setup_logger("ReparseService")
+
+BATCH_SIZE = 1000
+
+
+class ReparseService:
+    """
+    Vuelve a aplicar el parseo y la normalización actuales sobre el raw_answer
+    guardado, sin llamar a Gemini.
+    """
+
+    @staticmethod
+    def reparse(request: ReparseRequest) -> dict:
+        started = time.perf_counter()
+        invoice_filter, log_filter = ReparseService._filters(request)
+
+        summary = {
+            "invoices_scanned": 0,
+            "invoices_updated": 0,
+            "invoices_unchanged": 0,
+            "invoices_unparseable": 0,
+            "invoices_conflicts": 0,
+            "error_logs_scanned": 0,
+            "error_logs_recovered": 0,
+            "reports_rebuilt": [],
+        }
+        parse_stats = ParseStats()
+
+        updated_ids = ReparseService._reparse_invoices(invoice_filter, summary, parse_stats)
+        affected_runs = set()
+        if request.include_errors:
+            affected_runs |= ReparseService._recover_error_logs(log_filter, summary, parse_stats)
+
+        if request.rebuild_report:
+            if request.run_id:
+                affected_runs.add(request.run_id)
+            else:
+                affected_runs |= ReparseService._runs_for_invoices(updated_ids)
+            for run_id in sorted(affected_runs):
+                summary["reports_rebuilt"].append(ReparseService.rebuild_report(run_id)["excel_report"])
+
+        summary["parse_stats"] = parse_stats.as_dict()
+        summary["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        logger.info(f"Reparse finished: {summary['invoices_updated']} invoices updated, "
+                    f"{summary['error_logs_recovered']} errors recovered")
+        return summary
+
+    @staticmethod
+    def _filters(request: ReparseRequest) -> tuple[dict, dict]:
+        log_filter = {"status": "Error", "raw_answer": {"$ne": None}}
+
+        if request.run_id:
+            run = ProcessingService.find_run(request.run_id)
+            invoice_ids = [ObjectId(i) for i in run.get("invoices") or []]
+            log_filter["processing_run_id"] = request.run_id
+            return {"_id": {"$in": invoice_ids}}, log_filter
+
+        invoice_filter = {"raw_answer": {"$ne": None}}
+        if request.status:
+            invoice_filter["status"] = request.status
+        if request.invoice_file:
+            invoice_filter["invoice_file"] = request.invoice_file
+            log_filter["invoice_filename"] = request.invoice_file
+        if request.date_from or request.date_to:
+            date_range = {}
+            if request.date_from:
+                date_range["$gte"] = request.date_from
+            if request.date_to:
+                date_range["$lte"] = request.date_to
+            invoice_filter["timestamp"] = date_range
+            log_filter["created_at"] = date_range
+        return invoice_filter, log_filter
+
+    @staticmethod
+    def _reparse_invoices(invoice_filter: dict, summary: dict, parse_stats: ParseStats) -> list:
+        projection = {"raw_answer": 1, "timestamp": 1, "content_sha256": 1, "complete_path": 1,
+                      **{field: 1 for field in INVOICE_FIELD_KEYS}}
+        now = datetime.utcnow()
+        updated_ids = []
+        operations = []
+
+        for invoice in db.invoices.find(invoice_filter, projection).batch_size(BATCH_SIZE):
+            summary["invoices_scanned"] += 1
+            success, data, _ = parse_invoice_response(invoice.get("raw_answer"), parse_stats)
+            if not success:
+                summary["invoices_unparseable"] += 1
+                continue
+
+            fields = normalize_invoice_data(data, default_date=invoice["timestamp"])
+            if same_data(invoice, fields):
+                summary["invoices_unchanged"] += 1
+                continue
+
+            # Si cambian el CUIT o el número, cambia también la clave de idempotencia
+            key = dedupe_key({**invoice, **fields})
+            operations.append(UpdateOne({"_id": invoice["_id"]}, {"$set": {**fields, "dedupe_key": key, "updated_at": now}}))
+            updated_ids.append(invoice["_id"])
+            if len(operations) >= BATCH_SIZE:
+                ReparseService._bulk_update(operations, summary)
+                operations = []
+
+        if operations:
+            ReparseService._bulk_update(operations, summary)
+        return updated_ids
+
+    @staticmethod
+    def _bulk_update(operations: list, summary: dict):
+        try:
+            summary["invoices_updated"] += db.invoices.bulk_write(operations, ordered=False).modified_count
+        except BulkWriteError as e:
+            # Facturas que ahora coinciden con otra (mismo CUIT y número): quedan sin tocar
+            summary["invoices_updated"] += e.details.get("nModified", 0)
+            summary["invoices_conflicts"] += sum(1 for error in e.details.get("writeErrors", []) if error.get("code") == 11000)
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+    @staticmethod
+    def _recover_error_logs(log_filter: dict, summary: dict, parse_stats: ParseStats) -> set:
+        """Crea la factura de los logs con error cuyo raw_answer ahora sí se puede parsear."""
+        storage = get_storage()
+        recovered_by_run = defaultdict(list)
+
+        for log in db.processing_logs.find(log_filter).batch_size(BATCH_SIZE):
+            summary["error_logs_scanned"] += 1
+            success, data, _ = parse_invoice_response(log["raw_answer"], parse_stats)
+            if not success:
+                continue
+            try:
+                invoice = ProcessingService.build_invoice(
+                    data,
+                    invoice_file=log["invoice_filename"],
+                    complete_path=storage.key_from_url(log["image_url"]) or log["image_url"],
+                    image_url=log["image_url"],
+                    timestamp=log["created_at"],
+                    raw_answer=log["raw_answer"],
+                )
+            except Exception as e:
+                logger.warning(f"Log {log['_id']} still not valid: {e}")
+                continue
+
+            invoice_id, _ = ProcessingService.save_invoices([invoice.dict()])[0]
+            db.processing_logs.update_one(
+                {"_id": log["_id"]},
+                {"$set": {"status": "Success", "invoice_id": str(invoice_id), "error_message": None,
+                          "raw_answer": None, "updated_at": datetime.utcnow()}},
+            )
+            recovered_by_run[log.get("processing_run_id")].append(str(invoice_id))
+            summary["error_logs_recovered"] += 1
+
+        # Ajustar los contadores de cada corrida afectada
+        for run_id, invoice_ids in recovered_by_run.items():
+            if not run_id:
+                continue
+            run = db.runs.find_one({"_id": ObjectId(run_id)}, {"total_files": 1, "successful": 1, "skipped": 1})
+            if not run:
+                continue
+            successful = run["successful"] + len(invoice_ids)
+            db.runs.update_one(
+                {"_id": run["_id"]},
+                {
+                    "$push": {"invoices": {"$each": invoice_ids}},
+                    "$set": {
+                        "successful": successful,
+                        "errors": run["total_files"] - successful - run.get("skipped", 0),
+                        "success_rate": (successful / run["total_files"] * 100) if run["total_files"] else 0,
+                        "updated_at": datetime.utcnow(),
+                    },
+                },
+            )
+        return {run_id for run_id in recovered_by_run if run_id}
+
+    @staticmethod
+    def _runs_for_invoices(invoice_ids: list) -> set:
+        run_ids = set()
+        for i in range(0, len(invoice_ids), BATCH_SIZE):
+            chunk = [str(invoice_id) for invoice_id in invoice_ids[i:i + BATCH_SIZE]]
+            for run in db.runs.find({"invoices": {"$in": chunk}}, {"_id": 1}):
+                run_ids.add(str(run["_id"]))
+        return run_ids
+
+    @staticmethod
+    def rebuild_report(run_id: str) -> dict:
+        """Regenera el Excel de una corrida con los datos actuales de Mongo."""
+        run = ProcessingService.find_run(run_id)
+
+        invoice_ids = [ObjectId(i) for i in run.get("invoices") or []]
+        extracted_data = [
+            ProcessingService.extracted_row(invoice)
+            for invoice in db.invoices.find({"_id": {"$in": invoice_ids}}).batch_size(BATCH_SIZE)
+        ]
+        logs = list(db.processing_logs.find({"processing_run_id": run_id}))
+
+        # Las corridas anteriores tenían el Excel en disco local: se migra al storage compartido
+        excel_key = run.get("excel_report_key") or ProcessingService.report_key(f"{run.get('name') or 'invoice_report'}_{run_id}")
+        ProcessingService.publish_report(excel_key, extracted_data, logs, run.get("near_duplicates"))
+        db.runs.update_one({"_id": run["_id"]},
+                           {"$set": {"excel_report_key": excel_key, "report_stale": False,
+                                     "updated_at": datetime.utcnow()}})
+
+        return {"run_id": run_id, "excel_report": excel_key}
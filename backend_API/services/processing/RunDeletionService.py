@@ -0,0 +1,164 @@
+import os
+from datetime import datetime, timedelta
+from typing import Iterator
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from backend_API.db.config.db import db
+from backend_API.services.processing.ProcessingService import ProcessingService, near_duplicate_index
+from backend_API.utils.logger import setup_logger
+from backend_API.utils.storage_utils import S3_DELETE_BATCH_SIZE, get_storage
+from backend_API.utils.tracing import span
+
+logger = setup_logger("RunDeletionService")
+
+# Facturas por lote: un delete_objects de S3 y un delete_many de Mongo por lote
+BATCH_SIZE = S3_DELETE_BATCH_SIZE
+
+# Hasta este tamaño el borrado se hace dentro de la request; más grande, en segundo plano
+SYNC_MAX_INVOICES = 200
+
+# Un borrado "running" sin avances en este tiempo se considera abandonado (el proceso se cayó)
+STALE_AFTER = timedelta(minutes=10)
+
+
+class RunDeletionService:
+    """
+    Borra una corrida completa: imágenes del storage, facturas, logs,
+    estadísticas, el Excel y el run. El progreso queda en `run_deletions`, así
+    se puede consultar desde cualquier nodo y un borrado interrumpido se retoma
+    volviendo a pedirlo (cada paso se puede repetir).
+    """
+
+    @staticmethod
+    def request_deletion(run_id: str) -> tuple[dict, str]:
+        """
+        Registra el borrado y devuelve (estado, modo). Las corridas chicas se
+        borran enseguida ("done"); en las grandes hay que lanzar delete_run en
+        background ("start"), salvo que otro pedido ya lo esté haciendo ("running").
+        """
+        run = ProcessingService.find_run(run_id)
+        now = datetime.utcnow()
+        state = {
+            "status": "running",
+            "total_invoices": len(run.get("invoices") or []),
+            "invoices_deleted": 0,
+            "invoices_kept": 0,
+            "objects_deleted": 0,
+            "logs_deleted": 0,
+            "statistics_deleted": 0,
+            "report_deleted": False,
+            "error": None,
+            "started_at": now,
+            "updated_at": now,
+            "finished_at": None,
+        }
+        try:
+            db.run_deletions.insert_one({"_id": run_id, **state})
+        except DuplicateKeyError:
+            current = db.run_deletions.find_one({"_id": run_id})
+            if current["status"] == "running" and current["updated_at"] > now - STALE_AFTER:
+                return current, "running"
+            db.run_deletions.update_one({"_id": run_id}, {"$set": state})
+
+        if state["total_invoices"] <= SYNC_MAX_INVOICES:
+            return RunDeletionService.delete_run(run_id), "done"
+        return {"_id": run_id, **state}, "start"
+
+    @staticmethod
+    def get_status(run_id: str) -> dict | None:
+        return db.run_deletions.find_one({"_id": run_id})
+
+    @staticmethod
+    def delete_run(run_id: str) -> dict:
+        with span("delete_run", run_id=run_id):
+            try:
+                RunDeletionService._delete(run_id)
+            except Exception as e:
+                logger.error(f"❌ Error borrando la corrida {run_id}: {e}")
+                RunDeletionService._progress(run_id, {"$set": {"status": "failed", "error": str(e)}})
+            else:
+                RunDeletionService._progress(run_id, {"$set": {"status": "completed",
+                                                               "finished_at": datetime.utcnow()}})
+        return RunDeletionService.get_status(run_id)
+
+    @staticmethod
+    def _progress(run_id: str, update: dict):
+        update.setdefault("$set", {})["updated_at"] = datetime.utcnow()
+        db.run_deletions.update_one({"_id": run_id}, update)
+
+    @staticmethod
+    def _delete(run_id: str):
+        run = db.runs.find_one({"_id": ObjectId(run_id)})
+        if run is None:
+            # Ya se había borrado el run (último paso): no queda nada
+            return
+        storage = get_storage()
+        # En una corrida por prefijo las imágenes son los objetos originales del bucket: no se borran
+        owns_objects = (run.get("source") or {}).get("type") != "prefix"
+        shared_ids, kept_keys = [], set()
+
+        for chunk in RunDeletionService._chunks(run.get("invoices") or []):
+            object_ids = [ObjectId(invoice_id) for invoice_id in chunk]
+            # Con los upserts por dedupe_key una factura puede ser de varias corridas: esas se conservan
+            shared = set(db.runs.distinct("invoices", {"invoices": {"$in": chunk}, "_id": {"$ne": run["_id"]}}))
+            to_delete = [oid for oid in object_ids if str(oid) not in shared]
+            if shared:
+                shared_ids.extend(shared & set(chunk))
+                kept_keys.update(doc.get("complete_path") for doc in
+                                 db.invoices.find({"_id": {"$in": [ObjectId(i) for i in shared & set(chunk)]}},
+                                                  {"complete_path": 1}))
+
+            keys = []
+            if owns_objects and to_delete:
+                keys = [doc["complete_path"]
+                        for doc in db.invoices.find({"_id": {"$in": to_delete}}, {"complete_path": 1})
+                        if doc.get("complete_path")]
+            objects_deleted = storage.delete_many(keys) if keys else 0
+            deleted = db.invoices.delete_many({"_id": {"$in": to_delete}}).deleted_count if to_delete else 0
+            near_duplicate_index.forget([str(oid) for oid in to_delete])
+
+            RunDeletionService._progress(run_id, {
+                "$inc": {"invoices_deleted": deleted, "invoices_kept": len(object_ids) - len(to_delete),
+                         "objects_deleted": objects_deleted},
+            })
+            # Si el proceso se corta, el reintento no vuelve a recorrer lo ya borrado
+            db.runs.update_one({"_id": run["_id"]}, {"$pull": {"invoices": {"$in": chunk}}})
+
+        # Imágenes subidas en esta corrida que no quedaron en una factura borrada arriba: archivos con
+        # error y copias de facturas que ya existían (la factura conserva su imagen original)
+        if owns_objects:
+            log_filter = {"processing_run_id": run_id, "image_url": {"$ne": "N/A"},
+                          "$or": [{"invoice_id": None}, {"invoice_id": {"$in": shared_ids}}]}
+            keys = (storage.key_from_url(log["image_url"])
+                    for log in db.processing_logs.find(log_filter, {"image_url": 1}))
+            objects_deleted = storage.delete_many(key for key in keys if key and key not in kept_keys)
+            RunDeletionService._progress(run_id, {"$inc": {"objects_deleted": objects_deleted}})
+
+        logs_deleted = db.processing_logs.delete_many({"processing_run_id": run_id}).deleted_count
+        # Las estadísticas anteriores a processing_run_id se reconocen por la fecha de inicio
+        statistics_deleted = db.statistics.delete_many({"$or": [
+            {"processing_run_id": run_id},
+            {"processing_run_id": {"$exists": False}, "process_date": run["started_at"]},
+        ]}).deleted_count
+        db.processed_objects.delete_many({"run_id": run_id})
+
+        report_deleted = False
+        if run.get("excel_report_key"):
+            # El Excel es de la corrida aunque las imágenes sean del bucket (corridas por prefijo)
+            report_deleted = storage.delete_many([run["excel_report_key"]]) > 0
+        excel_path = run.get("excel_report_path")
+        if excel_path and os.path.isfile(excel_path):
+            os.remove(excel_path)
+            report_deleted = True
+
+        RunDeletionService._progress(run_id, {
+            "$inc": {"logs_deleted": logs_deleted, "statistics_deleted": statistics_deleted},
+            "$set": {"report_deleted": report_deleted},
+        })
+        db.runs.delete_one({"_id": run["_id"]})
+        logger.info(f"🗑️ Corrida {run_id} borrada")
+
+    @staticmethod
+    def _chunks(items: list) -> Iterator[list]:
+        for i in range(0, len(items), BATCH_SIZE):
+            yield items[i:i + BATCH_SIZE]
@@ -0,0 +1,348 @@
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from backend_API.db.config.db import db
+from backend_API.models.logs.ProcessingLogCreate import ProcessingLogCreate
+from backend_API.models.processing.PrefixRunRequest import PrefixRunRequest
+from backend_API.services.processing.PrefixService import PrefixService
+from backend_API.services.processing.ProcessingService import ProcessingService, RunContext
+from backend_API.utils.config import TASK_LEASE_SECONDS, TASK_MAX_ATTEMPTS
+from backend_API.utils.logger import setup_logger
+from backend_API.utils.metrics import QUEUE_DEPTH, QUEUE_TASKS
+from backend_API.utils.storage_utils import get_storage
+from backend_API.utils.tracing import span
+
+logger = setup_logger("TaskQueueService")
+
+# Tareas por insert_many al encolar y por lectura al armar la corrida
+BATCH_SIZE = 1000
+
+
+class TaskQueueService:
+    """
+    Cola de tareas por archivo en Mongo para el modo worker (python -m backend_API.worker).
+
+    Un job es una corrida: se encola con una tarea por objeto del storage y los
+    workers toman las tareas con un lease atómico (find_one_and_update). El lease se
+    renueva con heartbeats; si un worker se cae, vence y cualquier otro retoma la
+    tarea. Cada tarea guarda su resultado (log, fila del Excel, contadores) y el
+    worker que completa la última arma la corrida con finalize_run.
+    """
+
+    @staticmethod
+    def enqueue_prefix(request: PrefixRunRequest) -> dict:
+        """Encola los objetos pendientes bajo el prefijo (mismo filtro que POST /process/prefix)."""
+        storage = get_storage()
+        job_oid = ObjectId()
+        job_id = str(job_oid)
+        now = datetime.utcnow()
+        # type "prefix": al borrar la corrida no se tocan los objetos originales del bucket
+        source = {"type": "prefix", "prefix": request.prefix, "mode": "queue"}
+        db.processing_jobs.insert_one({
+            "_id": job_oid,
+            "source": source,
+            "status": "queued",
+            "total": None,  # se conoce al terminar de listar; hasta entonces el job no se puede cerrar
+            "completed": 0,
+            "created_at": now,
+            "updated_at": now,
+        })
+
+        counters = {"listed": 0, "skipped": 0}
+        with span("enqueue_prefix", job_id=job_id, prefix=request.prefix):
+            pending = PrefixService.pending_objects(storage.list(request.prefix), request, counters)
+            if request.max_objects:
+                pending = islice(pending, request.max_objects)
+            total = 0
+            for chunk in TaskQueueService._chunks(pending):
+                total += TaskQueueService._insert_tasks(job_id, chunk)
+
+        db.processing_jobs.update_one({"_id": job_oid}, {"$set": {
+            "status": "running",
+            "total": total,
+            "objects_listed": counters["listed"],
+            "objects_skipped": counters["skipped"],
+            "updated_at": datetime.utcnow(),
+        }})
+        logger.info(f"📥 Job {job_id}: {total} tareas encoladas bajo {request.prefix}")
+        # Si los workers ya terminaron todo mientras se listaba, el job se cierra acá
+        TaskQueueService.finalize_job(job_id, "api")
+        return {"job_id": job_id, "queued": total,
+                "objects_listed": counters["listed"], "objects_skipped": counters["skipped"]}
+
+    @staticmethod
+    def _insert_tasks(job_id: str, objects: list) -> int:
+        now = datetime.utcnow()
+        tasks = [{
+            "job_id": job_id,
+            "key": obj["key"],
+            "etag": obj["etag"],
+            "size": obj["size"],
+            "status": "pending",
+            "attempts": 0,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "result": None,
+            "created_at": now,
+        } for obj in objects]
+        try:
+            return len(db.processing_tasks.insert_many(tasks, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            # Clave repetida en el listado: (job_id, key) es único
+            return e.details["nInserted"]
+
+    @staticmethod
+    def claim(worker_id: str) -> Optional[dict]:
+        """Toma una tarea pendiente o con el lease vencido (el worker anterior se cayó)."""
+        now = datetime.utcnow()
+        task = db.processing_tasks.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "pending"},
+                    {"status": "leased", "lease_expires_at": {"$lt": now}},
+                ],
+                "attempts": {"$lt": TASK_MAX_ATTEMPTS},
+            },
+            {
+                "$set": {
+                    "status": "leased",
+                    "lease_owner": worker_id,
+                    "lease_expires_at": now + timedelta(seconds=TASK_LEASE_SECONDS),
+                    "leased_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+        if task is not None:
+            QUEUE_TASKS.labels("claimed" if task["attempts"] == 1 else "reclaimed").inc()
+        return task
+
+    @staticmethod
+    def heartbeat(worker_id: str, task_ids: Iterable[ObjectId]) -> int:
+        """Renueva los leases de las tareas que el worker tiene en proceso."""
+        task_ids = list(task_ids)
+        if not task_ids:
+            return 0
+        now = datetime.utcnow()
+        return db.processing_tasks.update_many(
+            {"_id": {"$in": task_ids}, "status": "leased", "lease_owner": worker_id},
+            {"$set": {"lease_expires_at": now + timedelta(seconds=TASK_LEASE_SECONDS), "heartbeat_at": now}},
+        ).modified_count
+
+    @staticmethod
+    def release(task: dict, worker_id: str, error: Optional[str] = None):
+        """
+        Devuelve la tarea a la cola (el worker se detiene o falló antes de terminarla).
+        Si ya usó los TASK_MAX_ATTEMPTS intentos no vuelve: se cierra como error, si no
+        ningún worker la tomaría y el job no terminaría nunca.
+        """
+        if task["attempts"] >= TASK_MAX_ATTEMPTS:
+            log = TaskQueueService._error_log(
+                task["key"], f"Failed after {task['attempts']} attempts: {error or 'worker error'}")
+            TaskQueueService._finish({"_id": task["_id"], "status": "leased", "lease_owner": worker_id},
+                                     "failed", {"log": log}, worker_id)
+            return
+        released = db.processing_tasks.update_one(
+            {"_id": task["_id"], "status": "leased", "lease_owner": worker_id},
+            {"$set": {"status": "pending", "lease_owner": None, "lease_expires_at": None}},
+        ).modified_count
+        if released:
+            QUEUE_TASKS.labels("released").inc()
+
+    @staticmethod
+    def process_task(task: dict, worker_id: str):
+        """
+        Procesa el objeto de la tarea con el mismo camino que POST /process/prefix
+        (ProcessingService.process_file) y guarda el resultado en la tarea.
+        """
+        ctx = RunContext(source={"type": "prefix", "mode": "queue"}, run_oid=ObjectId(task["job_id"]))
+        obj = {"key": task["key"], "etag": task["etag"], "size": task["size"]}
+        QUEUE_DEPTH.inc()
+        PrefixService.process_object(ctx, get_storage(), obj)
+        # Una factura por tarea: se escribe antes de dar la tarea por terminada
+        ctx.flush_invoices()
+
+        log = ctx.logs[0]
+        result = {
+            "log": log,
+            "row": ctx.extracted_data[0] if ctx.extracted_data else None,
+            "near_duplicates": ctx.near_duplicates,
+            "invoice_writes": ctx.invoice_writes,
+            "parse_stats": ctx.parse_stats.as_dict(),
+            "bytes": ctx.profiler.as_dict()["bytes"],
+        }
+        TaskQueueService._finish(
+            {"_id": task["_id"], "status": "leased", "lease_owner": worker_id},
+            "done" if log["status"] != "Error" else "failed",
+            result,
+            worker_id,
+        )
+
+    @staticmethod
+    def fail_exhausted(worker_id: str) -> int:
+        """
+        Cierra como error las tareas que ya usaron TASK_MAX_ATTEMPTS intentos: con el lease
+        vencido (ej. un archivo que tira el worker) o pendientes (devueltas sin cerrar).
+        """
+        failed = 0
+        while True:
+            task = db.processing_tasks.find_one(
+                {"$or": [{"status": "leased", "lease_expires_at": {"$lt": datetime.utcnow()}},
+                         {"status": "pending"}],
+                 "attempts": {"$gte": TASK_MAX_ATTEMPTS}},
+                {"_id": 1, "key": 1, "status": 1, "attempts": 1, "lease_expires_at": 1},
+            )
+            if task is None:
+                return failed
+            log = TaskQueueService._error_log(task["key"], f"Worker lease expired {task['attempts']} times")
+            # El filtro incluye el estado leído: si otro worker la cerró primero no se cuenta dos veces
+            if TaskQueueService._finish(
+                {"_id": task["_id"], "status": task["status"], "lease_expires_at": task["lease_expires_at"]},
+                "failed", {"log": log}, worker_id,
+            ):
+                failed += 1
+
+    @staticmethod
+    def _error_log(key: str, message: str) -> dict:
+        return ProcessingLogCreate(
+            invoice_filename=key,
+            image_url=get_storage().url_for(key),
+            status="Error",
+            error_message=message,
+            created_at=datetime.utcnow()
+        ).dict()
+
+    @staticmethod
+    def _finish(task_filter: dict, task_status: str, result: dict, worker_id: str) -> bool:
+        task = db.processing_tasks.find_one_and_update(
+            task_filter,
+            {"$set": {"status": task_status, "result": result, "lease_expires_at": None,
+                      "finished_at": datetime.utcnow()}},
+            projection={"job_id": 1, "key": 1},
+        )
+        if task is None:
+            # El lease venció y otra máquina la retomó: su resultado es el que cuenta (las
+            # facturas se guardan por dedupe_key, procesarla dos veces no duplica nada)
+            QUEUE_TASKS.labels("lost").inc()
+            logger.warning(f"⚠️ Lease perdido para la tarea {task_filter['_id']}; se descarta el resultado")
+            return False
+
+        QUEUE_TASKS.labels("completed" if task_status == "done" else "failed").inc()
+        job = db.processing_jobs.find_one_and_update(
+            {"_id": ObjectId(task["job_id"])},
+            {"$inc": {"completed": 1}, "$set": {"updated_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if job and job["total"] is not None and job["completed"] >= job["total"]:
+            TaskQueueService.finalize_job(task["job_id"], worker_id)
+        return True
+
+    @staticmethod
+    def finalize_job(job_id: str, worker_id: str) -> Optional[dict]:
+        """
+        Arma la corrida cuando todas las tareas terminaron. Lo hace un solo worker: el
+        que pasa el job a "finalizing"; si se cae en el medio, otro lo retoma al vencer el lease.
+        """
+        now = datetime.utcnow()
+        job = db.processing_jobs.find_one_and_update(
+            {
+                "_id": ObjectId(job_id),
+                "total": {"$ne": None},
+                "$expr": {"$gte": ["$completed", "$total"]},
+                "$or": [
+                    {"status": "running"},
+                    {"status": "finalizing", "finalizing_expires_at": {"$lt": now}},
+                ],
+            },
+            {"$set": {"status": "finalizing", "finalizing_owner": worker_id,
+                      "finalizing_expires_at": now + timedelta(seconds=TASK_LEASE_SECONDS)}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is None:
+            return None
+
+        # Un cierre anterior llegó a guardar el run pero no a marcar el job
+        if db.runs.find_one({"_id": job["_id"]}, {"_id": 1}) is None:
+            ctx = RunContext(source=job["source"], run_oid=job["_id"])
+            ctx.start_time = job["created_at"]
+            ctx.today_path = ctx.start_time.strftime("%Y/%m/%d")
+            for task in db.processing_tasks.find({"job_id": job_id}, {"result": 1}).batch_size(BATCH_SIZE):
+                TaskQueueService._merge_result(ctx, task.get("result") or {})
+            ProcessingService.finalize_run(ctx, job["total"])
+
+        db.processing_jobs.update_one({"_id": job["_id"]}, {"$set": {
+            "status": "done", "run_id": job_id, "finished_at": datetime.utcnow(), "updated_at": datetime.utcnow(),
+        }})
+        # Los resultados ya están en el run y sus logs
+        db.processing_tasks.delete_many({"job_id": job_id})
+        logger.info(f"✅ Job {job_id} finalizado ({job['total']} tareas)")
+        return job
+
+    @staticmethod
+    def finalize_ready_jobs(worker_id: str) -> int:
+        """Jobs con todas las tareas terminadas que nadie cerró (ej. el worker se cayó al cerrarlo)."""
+        now = datetime.utcnow()
+        ready = db.processing_jobs.find(
+            {
+                "total": {"$ne": None},
+                "$expr": {"$gte": ["$completed", "$total"]},
+                "$or": [
+                    {"status": "running"},
+                    {"status": "finalizing", "finalizing_expires_at": {"$lt": now}},
+                ],
+            },
+            {"_id": 1},
+        )
+        return sum(1 for job in ready if TaskQueueService.finalize_job(str(job["_id"]), worker_id))
+
+    @staticmethod
+    def _merge_result(ctx: RunContext, result: dict):
+        log = result.get("log")
+        if log is None:
+            return
+        ctx.add(log, invoice_id=log.get("invoice_id"), row=result.get("row"))
+        ctx.near_duplicates.extend(result.get("near_duplicates") or [])
+        for outcome, count in (result.get("invoice_writes") or {}).items():
+            ctx.invoice_writes[outcome] += count
+        ctx.parse_stats.merge(result.get("parse_stats") or {})
+        for kind, amount in (result.get("bytes") or {}).items():
+            ctx.profiler.add_bytes(kind, amount)
+
+    @staticmethod
+    def get_job(job_id: str) -> dict:
+        try:
+            job = db.processing_jobs.find_one({"_id": ObjectId(job_id)})
+        except InvalidId:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid job ID")
+        if not job:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+
+        tasks = {doc["_id"]: doc["count"] for doc in db.processing_tasks.aggregate([
+            {"$match": {"job_id": job_id}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ])}
+        return {
+            "job_id": job_id,
+            "status": job["status"],
+            "total": job["total"],
+            "completed": job["completed"],
+            "tasks": tasks,
+            "objects_listed": job.get("objects_listed"),
+            "objects_skipped": job.get("objects_skipped"),
+            # Con el job terminado, el detalle está en GET /process/runs/{run_id}
+            "run_id": job.get("run_id"),
+            "created_at": job["created_at"],
+            "finished_at": job.get("finished_at"),
+        }
+
+    @staticmethod
+    def _chunks(items: Iterable[dict]) -> Iterator[list]:
+        items = iter(items)
+        while chunk := list(islice(items, BATCH_SIZE)):
+            yield chunk
@@ -1,12 +1,10 @@
-import logging
-
 from backend_API.db.config import db
 from backend_API.models.statistics.StatisticsProcessModel import StatisticsProcessModel
 from backend_API.schema.statistics.StatisticsProcessSchema import statistic_process_schema
+from backend_API.utils.logger import setup_logger
 
 # Logger configuration
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+logger = setup_logger("StatisticProcessService")
 
 def search_statistic_process(field:str, key):
     try:
@@ -15,7 +13,7 @@ def search_statistic_process(field:str, key):
         if not statistic:
             return {"error":"Statistic Processing not found"}
         
-        print(statistic)
+        logger.debug(f"Statistic found: {statistic['_id']}")
         return StatisticsProcessModel(**statistic_process_schema(statistic))
     
     except:
@@ -0,0 +1,100 @@
+import posixpath
+import tarfile
+import zipfile
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from backend_API.utils.config import ARCHIVE_MAX_MEMBERS, MAX_UPLOAD_FILE_BYTES
+from backend_API.utils.ingestion import IngestedFile, spool_stream
+
+ZIP_SUFFIXES = (".zip",)
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# (nombre del miembro, archivo listo para procesar o None, error o None)
+ArchiveMember = Tuple[str, Optional[IngestedFile], Optional[str]]
+
+
+def is_archive(filename: str) -> bool:
+    return (filename or "").lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES)
+
+
+def _skip(name: str) -> bool:
+    # Carpetas de metadatos de macOS y archivos ocultos que agregan los compresores
+    base = posixpath.basename(name)
+    return name.startswith("__MACOSX/") or base.startswith(".") or not base
+
+
+def _too_many_members(filename: str, max_members: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Archive {filename} has more than {max_members} members",
+    )
+
+
+def iter_archive_members(fileobj: BinaryIO, filename: str,
+                         max_member_bytes: int = MAX_UPLOAD_FILE_BYTES,
+                         max_members: int = ARCHIVE_MAX_MEMBERS) -> Iterator[ArchiveMember]:
+    """
+    Recorre el archivo de a un miembro por vez. Cada miembro se descomprime por
+    bloques a un spool propio, así nunca se desempaqueta el archivo completo.
+    El llamador debe cerrar cada IngestedFile al terminar de procesarlo.
+    Un ZIP con más de `max_members` falla antes del primer miembro; un TAR recién
+    al pasar el límite (su índice no se conoce sin leerlo).
+    """
+    name = filename.lower()
+    if name.endswith(ZIP_SUFFIXES):
+        members = _iter_zip(fileobj, filename, max_members)
+    elif name.endswith(TAR_SUFFIXES):
+        members = _iter_tar(fileobj)
+    else:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unsupported archive: {filename}")
+
+    count = 0
+    for member_name, size, open_member in members:
+        if _skip(member_name):
+            continue
+        count += 1
+        if count > max_members:
+            raise _too_many_members(filename, max_members)
+        # El tamaño declarado corta antes de descomprimir; spool_stream controla el real
+        if size is not None and size > max_member_bytes:
+            yield member_name, None, f"File {member_name} exceeds {max_member_bytes} bytes"
+            continue
+        try:
+            with open_member() as stream:
+                member = spool_stream(stream, member_name, max_member_bytes)
+        except HTTPException as e:
+            yield member_name, None, e.detail
+            continue
+        except (zipfile.BadZipFile, tarfile.TarError, OSError) as e:
+            yield member_name, None, f"Error reading {member_name}: {e}"
+            continue
+        yield member_name, member, None
+
+
+def _iter_zip(fileobj: BinaryIO, filename: str, max_members: int):
+    # El índice de un ZIP está al final: se necesita un handle posicionable (el spool de la subida lo es)
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid ZIP archive: {e}")
+    with archive:
+        infos = [info for info in archive.infolist() if not info.is_dir()]
+        if sum(1 for info in infos if not _skip(info.filename)) > max_members:
+            raise _too_many_members(filename, max_members)
+        for info in infos:
+            yield info.filename, info.file_size, lambda info=info: archive.open(info)
+
+
+def _iter_tar(fileobj: BinaryIO):
+    # Modo "r|*": lectura secuencial en streaming, con cualquier compresión
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode="r|*")
+    except tarfile.TarError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid TAR archive: {e}")
+    with archive:
+        for info in archive:
+            if info.isfile():
+                # En streaming el contenido del miembro solo se puede leer antes de pasar al siguiente
+                yield info.name, info.size, lambda info=info: archive.extractfile(info)
@@ -1,6 +1,97 @@
+import os
 from pathlib import Path
 
-SUPPORTED_FORMATS = [".jpg", ".jpeg", ".png", ".webp", ".tiff", ".bmp", ".gif"]
+IMAGE_FORMATS = [".jpg", ".jpeg", ".png", ".webp", ".tiff", ".bmp", ".gif"]
+PDF_FORMATS = [".pdf"]
+SUPPORTED_FORMATS = IMAGE_FORMATS + PDF_FORMATS
 LOG_FILE = 'logs/procesador_facturas.log'
 UPLOADS_DIR = Path("uploads")
 REPORTS_DIR = Path("reports")
+LOG_DIR = Path(__file__).resolve().parent.parent / "logs"  # backend_API/logs, un archivo por proceso
+
+# Almacenamiento de archivos: "s3" (por defecto) o "local" para instalaciones on-prem
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3").lower()
+LOCAL_STORAGE_DIR = Path(os.getenv("LOCAL_STORAGE_DIR", "storage"))
+LOCAL_STORAGE_BASE_URL = os.getenv("LOCAL_STORAGE_BASE_URL")  # ej. http://files.internal/invoices
+AWS_S3_ENDPOINT_URL = os.getenv("AWS_S3_ENDPOINT_URL")  # MinIO / S3 compatible local
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "20"))
+STORAGE_CHUNK_SIZE = 1024 * 1024
+
+# Reportes Excel: se guardan en el storage compartido (bajo REPORTS_PREFIX) para que cualquier nodo
+# los sirva. "stream" los envía a través de la API (con soporte de Range); "redirect" devuelve un
+# 307 a una URL prefirmada cuando el backend la soporta (S3)
+REPORTS_PREFIX = os.getenv("REPORTS_PREFIX", "reports").strip("/")
+REPORT_DOWNLOAD_MODE = os.getenv("REPORT_DOWNLOAD_MODE", "stream").lower()
+REPORT_URL_EXPIRES_SECONDS = int(os.getenv("REPORT_URL_EXPIRES_SECONDS", "900"))
+
+# Límites de subida (modo API): por archivo y por request completo, en bytes
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(25 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(500 * 1024 * 1024)))
+SPOOL_MAX_MEMORY_BYTES = 1024 * 1024  # más grande que esto se pasa a disco (igual que Starlette)
+
+# Archivos comprimidos (ZIP/TAR): miembros procesados en paralelo y máximo de miembros por archivo
+ARCHIVE_WORKERS = int(os.getenv("ARCHIVE_WORKERS", "4"))
+ARCHIVE_MAX_MEMBERS = int(os.getenv("ARCHIVE_MAX_MEMBERS", "10000"))
+
+# Procesamiento de objetos que ya están en el storage (POST /process/prefix): descargas en paralelo
+PREFIX_WORKERS = int(os.getenv("PREFIX_WORKERS", "8"))
+
+# Extracción con Gemini: "prompt" (JSON pedido en el prompt) o "structured" (JSON forzado con esquema)
+GEMINI_EXTRACTION_MODE = os.getenv("GEMINI_EXTRACTION_MODE", "prompt").lower()
+# Respuesta falsa y determinística en lugar de llamar a Gemini (pruebas offline, sin cuota)
+GEMINI_FAKE_EXTRACTOR = os.getenv("GEMINI_FAKE_EXTRACTOR", "false").lower() == "true"
+
+# Modo worker (python -m backend_API.worker): tareas por archivo en Mongo que los workers toman con
+# un lease; el lease se renueva cada TASK_HEARTBEAT_SECONDS y, si el worker se cae, vence y otra
+# máquina retoma la tarea (hasta TASK_MAX_ATTEMPTS intentos)
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))  # tareas en paralelo por proceso
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "2"))  # espera con la cola vacía
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))  # /metrics del worker (0 = desactivado)
+TASK_LEASE_SECONDS = int(os.getenv("TASK_LEASE_SECONDS", "120"))
+TASK_HEARTBEAT_SECONDS = float(os.getenv("TASK_HEARTBEAT_SECONDS", "30"))
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "3"))
+
+# Logging: cola en memoria + hilo escritor, JSON por línea y archivos rotativos
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", "2000"))  # truncado de mensajes largos (respuestas de Gemini, documentos)
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))  # fracción de líneas DEBUG que se escriben
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_TO_CONSOLE = os.getenv("LOG_TO_CONSOLE", "true").lower() == "true"
+LOG_TO_FILE = os.getenv("LOG_TO_FILE", "true").lower() == "true"  # false: solo consola (ej. contenedores)
+
+# Tracing (opcional, requiere opentelemetry-sdk): "none", "file" (JSON por línea) u "otlp" (collector)
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "logs/traces.jsonl")
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "dip-api")
+
+# PDF: las páginas se rasterizan en un pool de procesos y van todas en una sola consulta a Gemini
+# ("all") o solo la primera ("first", más rápido y barato para facturas de una página)
+PDF_DPI = int(os.getenv("PDF_DPI", "150"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "5"))
+PDF_PAGE_MODE = os.getenv("PDF_PAGE_MODE", "all").lower()
+
+# Pool de procesos para las etapas que usan CPU (validar, convertir y hashear imágenes, rasterizar
+# PDF, armar el Excel). 0 = todo en el proceso de la API. PDF_WORKERS se sigue aceptando
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+# Casi-duplicados (reescaneos, fotos de la misma factura): hash perceptual (dHash de 64 bits) y
+# búsqueda por distancia de Hamming. "flag" marca la factura, "skip" no la envía a Gemini, "off" desactiva
+NEAR_DUPLICATE_MODE = os.getenv("NEAR_DUPLICATE_MODE", "flag").lower()
+NEAR_DUPLICATE_THRESHOLD = int(os.getenv("NEAR_DUPLICATE_THRESHOLD", "6"))  # bits distintos (de 64)
+
+# Idempotency-Key (POST /process, POST /image_invoice): cuánto se guarda la respuesta, cuánto espera
+# un reintento a la request en curso y cuándo se considera abandonada una request que no terminó
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "3600"))
+
+# Retención: TTL de Mongo (días, 0 = sin vencimiento) y limpieza periódica de los directorios locales
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "90"))  # processing_logs
+STATISTICS_RETENTION_DAYS = int(os.getenv("STATISTICS_RETENTION_DAYS", "365"))  # statistics
+JANITOR_INTERVAL_SECONDS = int(os.getenv("JANITOR_INTERVAL_SECONDS", "3600"))  # 0 desactiva la limpieza
+JANITOR_DIRS = [Path(d.strip()) for d in os.getenv("JANITOR_DIRS", f"{UPLOADS_DIR},{REPORTS_DIR},temp,{LOG_DIR}").split(",") if d.strip()]
+JANITOR_MAX_AGE_DAYS = float(os.getenv("JANITOR_MAX_AGE_DAYS", "30"))
+JANITOR_MAX_DIR_BYTES = int(os.getenv("JANITOR_MAX_DIR_BYTES", str(5 * 1024 ** 3)))  # por directorio
+JANITOR_MIN_AGE_SECONDS = int(os.getenv("JANITOR_MIN_AGE_SECONDS", "3600"))  # nunca se borra algo más nuevo
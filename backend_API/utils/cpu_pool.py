@@ -0,0 +1,116 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, TypeVar
+
+from starlette.concurrency import run_in_threadpool
+
+from backend_API.utils.config import CPU_POOL_WORKERS
+from backend_API.utils.logger import setup_logger
+from backend_API.utils.metrics import CPU_POOL_PENDING, CPU_POOL_SIZE, CPU_POOL_TASKS
+
+logger = setup_logger("CpuPool")
+
+T = TypeVar("T")
+
+
+class CpuPool:
+    """
+    Pool de procesos para las etapas que usan CPU (validar, convertir y hashear
+    imágenes, rasterizar PDF, armar el Excel): en el proceso de la API retienen
+    el GIL y frenan a todas las requests concurrentes.
+
+    Lo arranca y lo detiene el lifespan de la app (o el worker); si se usa antes,
+    se crea en el primer pedido. Las funciones tienen que ser de módulos livianos
+    (image_utils, report_utils, pdf_utils) y recibir bytes o tuplas. Con
+    CPU_POOL_WORKERS=0 todo corre en el mismo proceso.
+    """
+
+    def __init__(self, workers: int = CPU_POOL_WORKERS):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._closed = False
+        self._get_executor()
+
+    def shutdown(self, cancel: bool = True):
+        """
+        Cancela lo que todavía no empezó (quien espera recibe CancelledError) y espera
+        al resto. Lo que se pida después (la app apagándose) corre en el mismo proceso.
+        """
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=cancel)
+            CPU_POOL_SIZE.set(0)
+            logger.info("🛑 Pool de procesos detenido")
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        with self._lock:
+            if self._executor is None and not self._closed:
+                # "spawn" evita hacer fork de un proceso con hilos (uvicorn, pools de boto3/pymongo)
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+                CPU_POOL_SIZE.set(self.workers)
+                logger.info(f"⚙️ Pool de procesos con {self.workers} workers")
+            return self._executor
+
+    def _submit(self, fn: Callable[..., T], *args) -> Optional[Future]:
+        """None si no hay pool (CPU_POOL_WORKERS=0 o ya detenido): quien llama ejecuta fn en el proceso."""
+        executor = self._get_executor()
+        if executor is None:
+            return None
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # Un hijo murió (ej. sin memoria): el pool queda inutilizable, se reemplaza
+            self._discard(executor)
+            executor = self._get_executor()
+            if executor is None:
+                return None
+            future = executor.submit(fn, *args)
+        CPU_POOL_PENDING.inc()
+        future.add_done_callback(lambda f: self._done(f, fn, executor))
+        return future
+
+    def _done(self, future: Future, fn: Callable, executor: ProcessPoolExecutor):
+        CPU_POOL_PENDING.dec()
+        if future.cancelled():
+            outcome = "cancelled"
+        elif isinstance(future.exception(), BrokenProcessPool):
+            outcome = "error"
+            self._discard(executor)
+        else:
+            outcome = "error" if future.exception() else "success"
+        CPU_POOL_TASKS.labels(fn.__name__, outcome).inc()
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is not executor:
+                return  # ya se reemplazó (varias tareas fallan juntas)
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        logger.error("❌ Pool de procesos roto; se crea uno nuevo en el próximo pedido")
+
+    def run(self, fn: Callable[..., T], *args) -> T:
+        """Ejecuta fn(*args) en el pool y espera el resultado (desde un hilo, nunca desde el event loop)."""
+        future = self._submit(fn, *args)
+        return fn(*args) if future is None else future.result()
+
+    async def run_async(self, fn: Callable[..., T], *args) -> T:
+        """Igual que run desde código async; si la request se cancela, la tarea pendiente también."""
+        future = self._submit(fn, *args)
+        if future is None:
+            return await run_in_threadpool(fn, *args)
+        return await asyncio.wrap_future(future)
+
+
+cpu_pool = CpuPool()
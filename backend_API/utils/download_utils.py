@@ -0,0 +1,71 @@
+import re
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import RedirectResponse, StreamingResponse
+from starlette.responses import Response
+
+from backend_API.utils.config import REPORT_DOWNLOAD_MODE, REPORT_URL_EXPIRES_SECONDS
+from backend_API.utils.storage_utils import get_storage
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta un header Range de un solo rango (bytes=a-b, bytes=a-, bytes=-n).
+    Devuelve (inicio, fin) inclusive, o None si hay que enviar el archivo completo
+    (sin header, sintaxis inválida o varios rangos). Lanza 416 si el rango queda fuera del archivo.
+    """
+    if not range_header or size == 0:
+        return None
+    match = _RANGE_RE.match(range_header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+
+    first, last = match.groups()
+    if first == "":
+        # Sufijo: los últimos n bytes
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def storage_download(key: str, filename: str, media_type: str,
+                     range_header: Optional[str] = None) -> Response:
+    """
+    Respuesta de descarga para un objeto del storage compartido: redirección a una URL
+    prefirmada (REPORT_DOWNLOAD_MODE=redirect) o streaming por bloques, con soporte de Range.
+    Hace llamadas bloqueantes al storage: usar desde run_in_threadpool.
+    """
+    storage = get_storage()
+    if REPORT_DOWNLOAD_MODE == "redirect":
+        url = storage.presigned_url(key, filename=filename, expires=REPORT_URL_EXPIRES_SECONDS)
+        if url:
+            return RedirectResponse(url, status_code=307)
+
+    # size() también confirma que el objeto existe antes de empezar a enviar la respuesta
+    size = storage.size(key)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+
+    byte_range = parse_range(range_header, size)
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(storage.open_stream(key), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(storage.open_stream(key, start=start, end=end), status_code=206,
+                             media_type=media_type, headers=headers)
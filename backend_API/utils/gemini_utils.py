@@ -1,11 +1,24 @@
 import os
+import ast
+import hashlib
+import logging
 import json
 import re
+import threading
+import time
 import google.generativeai as genai
+from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from PIL import Image
-from backend_API.utils.config import SUPPORTED_FORMATS
-from backend_API.utils.logger import setup_logger
+from typing import BinaryIO, Union
+from backend_API.models.invoice.InvoiceCreate import InvoiceCreate
+from backend_API.utils.config import GEMINI_EXTRACTION_MODE, GEMINI_FAKE_EXTRACTOR, PDF_FORMATS, SUPPORTED_FORMATS
+from backend_API.utils.logger import setup_logger, truncate
+from backend_API.utils.metrics import observe_stage, track_stage
+from backend_API.utils.tracing import span
+from backend_API.utils.pdf_utils import is_pdf, rasterize_pdf_in_pool
+from backend_API.utils.cpu_pool import cpu_pool
+from backend_API.utils.image_utils import convert_image, image_mime_type, read_bytes, verify_image
 from pydantic import EmailStr, ValidationError
 
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
@@ -13,18 +26,47 @@ model = genai.GenerativeModel("gemini-1.5-flash")
 
 logger = setup_logger("GeminiUtils")
 
+# Ruta en disco, archivo abierto en modo binario o el contenido ya leído
+ImageSource = Union[str, Path, BinaryIO, bytes]
+
+
+def extract_json_object(text: str) -> str | None:
+    """
+    Devuelve el primer objeto JSON completo de `text` en una sola pasada,
+    contando llaves y respetando strings y escapes (las llaves dentro de
+    valores o los objetos anidados no cortan el JSON).
+    """
+    start = None
+    depth = 0
+    in_string = False
+    escaped = False
+
+    for i, char in enumerate(text):
+        if start is None:
+            if char == "{":
+                start, depth = i, 1
+            continue
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
 
 def limpiar_json_response(response_text: str) -> str:
-    patrones = [
-        r'```json\s*(\{.*?\})\s*```',
-        r'```\s*(\{.*?\})\s*```',
-        r'(\{.*?\})'
-    ]
-    for pattern in patrones:
-        match = re.search(pattern, response_text, re.DOTALL)
-        if match:
-            return match.group(1)
-    return response_text
+    json_object = extract_json_object(response_text)
+    return json_object if json_object is not None else response_text
 
 
 def get_prompt() -> str:
@@ -50,57 +92,274 @@ IMPORTANTE: RESPONDE SOLO con el JSON. No agregues texto antes ni después.
 """
 
 
+def get_structured_prompt() -> str:
+    return """
+Analiza esta factura y completa los campos del esquema con los datos de la empresa emisora.
+Si algún campo no está presente, usa "No encontrado" (o 0 en los campos numéricos).
+La fecha va en formato YYYY-MM-DD y el precio total solo con números.
+"""
+
+
+# Tipos de Gemini para las anotaciones de InvoiceCreate
+_SCHEMA_TYPES = {str: "STRING", float: "NUMBER", int: "INTEGER", datetime: "STRING"}
+
+
+@lru_cache(maxsize=None)
+def build_response_schema() -> dict:
+    """Esquema de respuesta para Gemini derivado de los campos extraíbles de InvoiceCreate."""
+    properties = {}
+    for field in INVOICE_FIELD_KEYS:
+        annotation = InvoiceCreate.model_fields[field].annotation
+        # Optional[X] -> X
+        annotation = next((a for a in getattr(annotation, "__args__", ()) if a is not type(None)), annotation)
+        properties[field] = {"type": _SCHEMA_TYPES.get(annotation, "STRING")}
+    properties["date"]["description"] = "YYYY-MM-DD"
+    return {"type": "OBJECT", "properties": properties, "required": list(properties)}
+
+
+class ParseStats:
+    """Acumula intentos, fallos y tiempo de parseo de una corrida (thread-safe)."""
+
+    def __init__(self):
+        self.attempts = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms: float, success: bool):
+        with self._lock:
+            self.attempts += 1
+            self.failures += 0 if success else 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def merge(self, counts: dict):
+        """Suma los contadores de otro ParseStats (as_dict), ej. los de cada tarea del modo worker."""
+        with self._lock:
+            self.attempts += counts.get("attempts", 0)
+            self.failures += counts.get("failures", 0)
+            self.total_ms += counts.get("total_ms", 0.0)
+            self.max_ms = max(self.max_ms, counts.get("max_ms", 0.0))
+
+    def as_dict(self) -> dict:
+        return {
+            "mode": GEMINI_EXTRACTION_MODE,
+            "attempts": self.attempts,
+            "failures": self.failures,
+            "failure_rate": (self.failures / self.attempts * 100) if self.attempts else 0,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.attempts, 3) if self.attempts else 0,
+            "max_ms": round(self.max_ms, 3),
+        }
 
 
-def is_valid_image(path: str) -> bool:
+def is_valid_image(source: ImageSource, filename: str | None = None) -> bool:
+    """`source` es una ruta, un archivo abierto o su contenido; si no es una ruta, `filename` da la extensión."""
+    name = filename or str(source)
     try:
-        ext = Path(path).suffix.lower()
+        ext = Path(name).suffix.lower()
         if ext not in SUPPORTED_FORMATS:
             return False
-        with Image.open(path) as img:
-            img.verify()
+        if ext in PDF_FORMATS:
+            # El contenido se valida al rasterizar; acá solo la cabecera
+            return is_pdf(source)
+        # Decodificar y verificar es CPU: va al pool de procesos
+        cpu_pool.run(verify_image, read_bytes(source))
         return True
     except Exception as e:
-        logger.error(f"Invalid image {path}: {e}")
+        logger.error(f"Invalid image {name}: {e}")
         return False
 
 
-def extract_invoice_data(path: str) -> tuple[bool, dict, str]:
-    logger.info(f"📥 Procesando imagen: {path}")
-    if not is_valid_image(path):
-        logger.error(f"❌ Imagen inválida: {path}")
-        return False, {}, f"Invalid or unsupported file: {path}"
+def parse_invoice_response(response_text: str, stats: ParseStats | None = None) -> tuple[bool, dict, str]:
+    """
+    Convierte la respuesta cruda de Gemini (o un raw_answer guardado) en un dict.
+    No llama al modelo: se usa tanto al extraer como al reprocesar.
+    """
+    started = time.perf_counter()
+    with span("parse") as current:
+        success, data, error = _parse_invoice_response(response_text)
+        current.set_attribute("parse.success", success)
+    elapsed = time.perf_counter() - started
+    observe_stage("parse", elapsed)
+    if stats is not None:
+        stats.record(elapsed * 1000, success)
+    return success, data, error
+
 
+def _parse_invoice_response(response_text: str) -> tuple[bool, dict, str]:
+    if not response_text:
+        return False, {}, "Empty Gemini response"
+
+    # En modo structured la respuesta ya es JSON puro: se evita el escaneo
     try:
-        image = Image.open(path)
-        prompt = get_prompt()
-        response = model.generate_content([prompt, image])
-        logger.info(f"📤 Respuesta cruda Gemini:\n{response.text}")
-        clean_json = limpiar_json_response(response.text)
-        
-        try:
-            data = json.loads(clean_json)
-            logger.info(f"✅ JSON extraído correctamente para {path}")
+        data = json.loads(response_text)
+        if isinstance(data, dict):
             return True, data, None
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ JSON decode error: {e}")
+    except json.JSONDecodeError:
+        pass
+
+    clean_json = limpiar_json_response(response_text)
+    try:
+        data = json.loads(clean_json)
+    except json.JSONDecodeError as e:
+        # raw_answer antiguos guardados con str(dict)
+        try:
+            data = ast.literal_eval(clean_json)
+        except (ValueError, SyntaxError):
             return False, {}, f"JSON decode error: {str(e)}"
-        
-        #return True, json.loads(clean_json), None
+
+    if not isinstance(data, dict):
+        return False, {}, "JSON decode error: response is not an object"
+    return True, data, None
+
+
+def generate_invoice_response(images) -> str:
+    """`images` es una imagen o una lista (todas las páginas de un PDF van en la misma consulta)."""
+    if not isinstance(images, list):
+        images = [images]
+    if GEMINI_FAKE_EXTRACTOR:
+        return fake_invoice_response(images)
+    if len(images) > 1:
+        images = ["Las imágenes son páginas consecutivas de la misma factura.", *images]
+    if GEMINI_EXTRACTION_MODE == "structured":
+        response = model.generate_content(
+            [get_structured_prompt(), *images],
+            generation_config=genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=build_response_schema(),
+            ),
+        )
+    else:
+        response = model.generate_content([get_prompt(), *images])
+    return response.text
+
+
+def fake_invoice_response(images: list) -> str:
+    """
+    Respuesta con el formato del prompt sin llamar a Gemini (GEMINI_FAKE_EXTRACTOR).
+    Los datos salen del contenido: la misma imagen da siempre la misma factura.
+    """
+    digest = hashlib.sha256()
+    for image in images:
+        # Páginas de PDF: {"mime_type", "data"}; imágenes: PIL
+        digest.update(image["data"] if isinstance(image, dict) else image.tobytes())
+    h = digest.hexdigest()
+    return json.dumps({
+        "empresa": f"Proveedor {h[:6].upper()}",
+        "fecha": f"2025-{int(h[6:8], 16) % 12 + 1:02d}-{int(h[8:10], 16) % 28 + 1:02d}",
+        "numero_factura": f"0001-{int(h[10:18], 16) % 10 ** 8:08d}",
+        "precio_total": f"{int(h[18:24], 16) % 1000000 / 100:.2f}",
+        "moneda": "ARS",
+        "cantidad_items": str(int(h[24:26], 16) % 10 + 1),
+        "descripcion_principal": "Factura de prueba",
+        "cuit_ruc": f"30-{int(h[26:34], 16) % 10 ** 8:08d}-{int(h[34], 16) % 10}",
+        "direccion": NOT_FOUND,
+        "telefono": NOT_FOUND,
+        "email": NOT_FOUND,
+    })
+
+
+def image_part(data: bytes) -> dict:
+    """
+    Blob para Gemini ({"mime_type", "data"}). JPEG, PNG y WEBP van tal cual; el resto
+    se convierte a PNG en el pool de procesos. Este proceso nunca decodifica la imagen.
+    """
+    mime_type = image_mime_type(data)
+    if mime_type:
+        return {"mime_type": mime_type, "data": data}
+    with track_stage("transform"):
+        return {"mime_type": "image/png", "data": cpu_pool.run(convert_image, data)}
+
+
+def extract_invoice_response(source: ImageSource, parse_stats: ParseStats | None = None,
+                             filename: str | None = None) -> tuple[bool, dict, str, str]:
+    """
+    Igual que extract_invoice_data, pero también devuelve el texto crudo de Gemini.
+    `source` puede ser una ruta o el handle de la subida (ver utils/ingestion.py).
+    """
+    path = filename or str(source)
+    logger.info(f"📥 Procesando imagen: {path}")
+    with track_stage("validate"):
+        try:
+            # Se lee una sola vez: validación, conversión y rasterizado reciben los bytes
+            data = read_bytes(source)
+        except OSError as e:
+            logger.error(f"Invalid image {path}: {e}")
+            data = None
+        valid = data is not None and is_valid_image(data, path)
+    if not valid:
+        logger.error(f"❌ Imagen inválida: {path}")
+        return False, {}, f"Invalid or unsupported file: {path}", None
+
+    try:
+        if Path(path).suffix.lower() in PDF_FORMATS:
+            with track_stage("rasterize"):
+                pages = rasterize_pdf_in_pool(data)
+            with track_stage("gemini"):
+                raw_text = generate_invoice_response(pages)
+        else:
+            image = image_part(data)
+            with track_stage("gemini"):
+                raw_text = generate_invoice_response(image)
+        # La respuesta completa queda en raw_answer; al log va recortada y solo en DEBUG
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"📤 Respuesta cruda Gemini: {truncate(raw_text)}", extra={"file": path})
     except Exception as e:
         logger.error(f"❌ Error general Gemini: {e}")
-        return False, {}, str(e)
+        return False, {}, str(e), None
+
+    success, data, error = parse_invoice_response(raw_text, parse_stats)
+    if success:
+        logger.info(f"✅ JSON extraído correctamente para {path}")
+    else:
+        logger.error(f"❌ {error}")
+    return success, data, error, raw_text
+
+
+def extract_invoice_data(path: str) -> tuple[bool, dict, str]:
+    success, data, error, _ = extract_invoice_response(path)
+    return success, data, error
 
 def parse_safe_int(value, default=0):
     try:
         return int(value)
+    except (ValueError, TypeError):
+        pass
+    try:
+        # "3 items", "3.0"
+        return int(parse_safe_float(value, default=None))
     except (ValueError, TypeError):
         return default
 
 def parse_safe_float(value, default=0.0):
+    if isinstance(value, (int, float)):
+        return float(value)
     try:
         return float(value)
     except (ValueError, TypeError):
+        pass
+    if not isinstance(value, str):
+        return default
+
+    # "$ 1.234,56", "USD 1,234.56", "1 234,56"
+    number = re.sub(r"[^\d,.\-]", "", value)
+    if not re.search(r"\d", number):
+        return default
+    if "," in number and "." in number:
+        decimal_sep = "," if number.rfind(",") > number.rfind(".") else "."
+        thousands_sep = "." if decimal_sep == "," else ","
+        number = number.replace(thousands_sep, "").replace(decimal_sep, ".")
+    elif "," in number:
+        # Una sola coma con 1-2 decimales es separador decimal; si no, de miles
+        head, _, tail = number.rpartition(",")
+        number = f"{head.replace(',', '')}.{tail}" if len(tail) in (1, 2) else number.replace(",", "")
+    elif number.count(".") > 1:
+        number = number.replace(".", "")
+    try:
+        return float(number)
+    except ValueError:
         return default
     
 
@@ -110,3 +369,72 @@ def parse_safe_email(value: str) -> str | None:
     except (ValidationError, TypeError):
         return None
 
+
+DATE_FORMATS = ["%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d", "%d/%m/%y", "%m/%d/%Y"]
+
+def parse_safe_date(value, default: datetime) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        return default
+    value = value.strip()
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return default
+
+
+NOT_FOUND = "No encontrado"
+
+# Campo de InvoiceCreate -> claves aceptadas en la respuesta (prompt en español o claves en inglés)
+INVOICE_FIELD_KEYS = {
+    "company": ("company", "empresa"),
+    "date": ("date", "fecha"),
+    "invoice_number": ("invoice_number", "numero_factura"),
+    "total_price": ("total_price", "precio_total"),
+    "currency": ("currency", "moneda"),
+    "number_of_items": ("number_of_items", "cantidad_items"),
+    "main_description": ("main_description", "descripcion_principal"),
+    "cuit_ruc": ("cuit_ruc",),
+    "address": ("address", "direccion"),
+    "phone": ("phone", "telefono"),
+    "email": ("email",),
+}
+
+
+def normalize_invoice_data(data: dict, default_date: datetime) -> dict:
+    """
+    Mapea el JSON de Gemini a los campos de InvoiceCreate.
+    Es la única fuente de mapeo/normalización: procesamiento y reprocesamiento la comparten.
+    """
+    def pick(field: str):
+        for key in INVOICE_FIELD_KEYS[field]:
+            value = data.get(key)
+            if value not in (None, ""):
+                return value
+        return None
+
+    def text(field: str) -> str:
+        value = pick(field)
+        return str(value).strip() if value is not None else NOT_FOUND
+
+    email = pick("email")
+    return {
+        "company": text("company"),
+        "date": parse_safe_date(pick("date"), default_date),
+        "invoice_number": text("invoice_number"),
+        "total_price": parse_safe_float(pick("total_price")),
+        "currency": text("currency").upper() if pick("currency") else NOT_FOUND,
+        "number_of_items": parse_safe_int(pick("number_of_items")),
+        "main_description": text("main_description"),
+        "cuit_ruc": text("cuit_ruc"),
+        "address": text("address"),
+        "phone": text("phone"),
+        "email": parse_safe_email(email) if email and email != NOT_FOUND else None,
+    }
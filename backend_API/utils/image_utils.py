@@ -0,0 +1,72 @@
+import io
+from pathlib import Path
+from typing import BinaryIO, Union
+
+from PIL import Image
+
+# Funciones que corren en el pool de procesos (ver cpu_pool.py): reciben y devuelven bytes o
+# valores simples, y este módulo no importa nada del resto de la API (logger, métricas, Mongo)
+
+HASH_SIZE = 8  # 8x8 comparaciones = 64 bits
+
+# Formatos que Gemini acepta tal cual: se envían sin decodificar ni recomprimir
+GEMINI_IMAGE_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+def read_bytes(source: Union[str, Path, BinaryIO, bytes]) -> bytes:
+    """Contenido completo de una ruta o un archivo abierto (acotado por MAX_UPLOAD_FILE_BYTES)."""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, (str, Path)):
+        with open(source, "rb") as f:
+            return f.read()
+    source.seek(0)
+    data = source.read()
+    source.seek(0)
+    return data
+
+
+def dhash(image: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """
+    Difference hash: la imagen en grises reducida a (hash_size + 1) x hash_size;
+    cada bit indica si un píxel es más claro que el de su derecha. Sobrevive a
+    reescaneos, recompresión y cambios de tamaño o brillo.
+    """
+    # En JPEG decodifica directamente a una escala reducida (mucho más rápido que la imagen completa)
+    image.draft("L", (hash_size * 8, hash_size * 8))
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hash_image(data: bytes) -> str:
+    """dHash en hex de la imagen; lanza excepción si no se puede decodificar."""
+    with Image.open(io.BytesIO(data)) as image:
+        return f"{dhash(image):016x}"
+
+
+def verify_image(data: bytes) -> None:
+    """Lanza excepción si la imagen está dañada o no es un formato que PIL reconozca."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.verify()
+
+
+def image_mime_type(data: bytes) -> str | None:
+    """Tipo MIME si Gemini acepta la imagen sin convertir. Solo lee la cabecera."""
+    with Image.open(io.BytesIO(data)) as image:
+        return GEMINI_IMAGE_TYPES.get(image.format)
+
+
+def convert_image(data: bytes) -> bytes:
+    """Convierte a PNG los formatos que Gemini no acepta (TIFF, BMP, GIF: primer cuadro)."""
+    with Image.open(io.BytesIO(data)) as image:
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+        return buffer.getvalue()
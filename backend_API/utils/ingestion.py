@@ -0,0 +1,163 @@
+import hashlib
+import json
+import mimetypes
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO, Iterable, Optional
+
+from fastapi import HTTPException, UploadFile, status
+
+from backend_API.utils.config import (
+    MAX_UPLOAD_FILE_BYTES,
+    MAX_UPLOAD_REQUEST_BYTES,
+    SPOOL_MAX_MEMORY_BYTES,
+    STORAGE_CHUNK_SIZE,
+)
+
+
+@dataclass
+class IngestedFile:
+    """
+    Archivo recibido listo para procesar. `file` es el mismo handle que creó
+    Starlette al parsear el multipart (SpooledTemporaryFile: en memoria si es
+    chico, en disco si es grande); storage y Gemini lo leen sin copiarlo.
+    """
+    filename: str
+    content_type: Optional[str]
+    file: BinaryIO
+    size: int
+    sha256: str
+
+    def rewind(self) -> BinaryIO:
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+        self.file.close()
+
+
+def _too_large(filename: str, max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File {filename} exceeds {max_bytes} bytes",
+    )
+
+
+async def ingest_upload(upload: UploadFile, max_bytes: int = MAX_UPLOAD_FILE_BYTES) -> IngestedFile:
+    """
+    Recorre la subida por bloques para calcular tamaño y hash sin cargarla
+    entera en memoria. Supera `max_bytes` -> 413.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    await upload.seek(0)
+    while chunk := await upload.read(STORAGE_CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_bytes:
+            raise _too_large(upload.filename, max_bytes)
+        digest.update(chunk)
+    await upload.seek(0)
+    return IngestedFile(
+        filename=upload.filename,
+        content_type=upload.content_type,
+        file=upload.file,
+        size=size,
+        sha256=digest.hexdigest(),
+    )
+
+
+def spool_stream(stream: BinaryIO, filename: str, max_bytes: int = MAX_UPLOAD_FILE_BYTES) -> IngestedFile:
+    """
+    Copia un stream no posicionable (miembro de un ZIP/TAR, cuerpo de S3) a un
+    SpooledTemporaryFile por bloques: en memoria hasta 1 MB, en disco si es más grande.
+    """
+    return spool_chunks(iter(lambda: stream.read(STORAGE_CHUNK_SIZE), b""), filename, max_bytes)
+
+
+def spool_chunks(chunks: Iterable[bytes], filename: str, max_bytes: int = MAX_UPLOAD_FILE_BYTES) -> IngestedFile:
+    """Igual que spool_stream, a partir de bloques (ej. StorageBackend.open_stream)."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY_BYTES)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            if size > max_bytes:
+                raise _too_large(filename, max_bytes)
+            digest.update(chunk)
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return IngestedFile(
+        filename=filename,
+        content_type=mimetypes.guess_type(filename)[0],
+        file=spool,
+        size=size,
+        sha256=digest.hexdigest(),
+    )
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Rechaza con 413 los requests cuyo cuerpo supera `max_bytes`, antes de que
+    Starlette termine de leer el multipart. Usa Content-Length si viene y, si
+    no (chunked), cuenta los bytes a medida que llegan.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            return await self._reject(send)
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Cortar la lectura: la respuesta de error del parser se reemplaza por el 413
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        response_started = False
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if exceeded:
+                if message["type"] == "http.response.start" and not response_started:
+                    response_started = True
+                    await self._reject(send)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await self._reject(send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": f"Request body exceeds {self.max_bytes} bytes"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,42 @@
+import re
+from datetime import datetime
+from typing import Optional
+
+from backend_API.utils.gemini_utils import INVOICE_FIELD_KEYS, NOT_FOUND
+
+# Campos que salen de la extracción: si no cambian, volver a procesar no toca la factura
+DATA_FIELDS = tuple(INVOICE_FIELD_KEYS)
+
+
+def _key_part(value) -> Optional[str]:
+    if value is None or str(value).strip() in ("", NOT_FOUND):
+        return None
+    # "30-71234567-8" y "30712345678" son el mismo CUIT; igual con "0001-00012345"
+    return re.sub(r"[^0-9A-Za-z]", "", str(value)).upper() or None
+
+
+def dedupe_key(invoice: dict) -> str:
+    """
+    Clave de idempotencia de una factura: CUIT/RUC + número de factura
+    normalizados. Si falta alguno de los dos, el contenido del archivo (SHA-256) o,
+    en facturas sin hash, su ruta en el storage. Nunca el nombre que mandó el
+    cliente: dos "scan.pdf" distintos serían la misma factura.
+    """
+    tax_id = _key_part(invoice.get("cuit_ruc"))
+    number = _key_part(invoice.get("invoice_number"))
+    if tax_id and number:
+        return f"tax:{tax_id}:{number}"
+    if invoice.get("content_sha256"):
+        return f"sha256:{invoice['content_sha256']}"
+    return f"path:{invoice['complete_path']}"
+
+
+def _comparable(value):
+    # Mongo guarda las fechas con precisión de milisegundos
+    if isinstance(value, datetime):
+        return value.replace(microsecond=value.microsecond // 1000 * 1000, tzinfo=None)
+    return value
+
+
+def same_data(current: dict, data: dict) -> bool:
+    return all(_comparable(current.get(field)) == _comparable(value) for field, value in data.items())
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Iterable
+
+from backend_API.utils.config import (
+    JANITOR_DIRS,
+    JANITOR_INTERVAL_SECONDS,
+    JANITOR_MAX_AGE_DAYS,
+    JANITOR_MAX_DIR_BYTES,
+    JANITOR_MIN_AGE_SECONDS,
+)
+from backend_API.utils.logger import setup_logger
+from backend_API.utils.metrics import JANITOR_DIRECTORY_BYTES, JANITOR_FILES_REMOVED, JANITOR_RECLAIMED_BYTES
+
+logger = setup_logger("Janitor")
+
+
+def _files(directory: Path) -> list[tuple[float, int, str]]:
+    """(mtime, tamaño, ruta) de todos los archivos bajo `directory`."""
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    return files
+
+
+def _remove_empty_dirs(directory: Path):
+    for root, dirs, files in os.walk(directory, topdown=False):
+        if root != str(directory) and not dirs and not files:
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
+
+
+def sweep_directory(directory: Path, max_age_seconds: float = JANITOR_MAX_AGE_DAYS * 86400,
+                    max_total_bytes: int = JANITOR_MAX_DIR_BYTES,
+                    min_age_seconds: float = JANITOR_MIN_AGE_SECONDS) -> dict:
+    """
+    Borra los archivos más viejos que `max_age_seconds` y, si el directorio
+    sigue ocupando más de `max_total_bytes`, los más viejos hasta quedar por
+    debajo. Los archivos más nuevos que `min_age_seconds` no se tocan (pueden
+    estar escribiéndose).
+    """
+    result = {"directory": str(directory), "files_removed": 0, "bytes_removed": 0, "bytes_remaining": 0}
+    if not directory.is_dir():
+        return result
+
+    now = time.time()
+    files = sorted(_files(directory))
+    total = sum(size for _, size, _ in files)
+
+    for mtime, size, path in files:
+        age = now - mtime
+        if age < min_age_seconds:
+            break  # ordenados por mtime: el resto es más nuevo
+        if age <= max_age_seconds and total <= max_total_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # lo borró otro worker
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo borrar {path}: {e}")
+            continue
+        total -= size
+        result["files_removed"] += 1
+        result["bytes_removed"] += size
+
+    _remove_empty_dirs(directory)
+    result["bytes_remaining"] = total
+
+    label = str(directory)
+    JANITOR_FILES_REMOVED.labels(label).inc(result["files_removed"])
+    JANITOR_RECLAIMED_BYTES.labels(label).inc(result["bytes_removed"])
+    JANITOR_DIRECTORY_BYTES.labels(label).set(total)
+    return result
+
+
+class Janitor:
+    """
+    Hilo de fondo que limpia los directorios locales (uploads/, reports/, temp/, logs/)
+    cada JANITOR_INTERVAL_SECONDS. Lo arranca y lo detiene el lifespan de la app.
+    """
+
+    def __init__(self, directories: Iterable[Path] = JANITOR_DIRS, interval: float = JANITOR_INTERVAL_SECONDS):
+        self.directories = list(directories)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or not self.directories:
+            logger.info("🧹 Limpieza de directorios locales desactivada")
+            return
+        self._thread = threading.Thread(target=self._run, name="janitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def sweep(self) -> list[dict]:
+        results = []
+        for directory in self.directories:
+            try:
+                result = sweep_directory(directory)
+            except Exception as e:
+                logger.error(f"❌ Error limpiando {directory}: {e}")
+                continue
+            if result["files_removed"]:
+                logger.info(f"🧹 {directory}: {result['files_removed']} archivos, "
+                            f"{result['bytes_removed']} bytes liberados")
+            results.append(result)
+        return results
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sweep()
+            self._stop.wait(self.interval)
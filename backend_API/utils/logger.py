@@ -1,23 +1,150 @@
 import os
+import copy
+import json
+import queue
+import atexit
+import random
 import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from backend_API.utils.config import (
+    LOG_BACKUP_COUNT,
+    LOG_DEBUG_SAMPLE_RATE,
+    LOG_DIR,
+    LOG_LEVEL,
+    LOG_MAX_BYTES,
+    LOG_MAX_CHARS,
+    LOG_QUEUE_SIZE,
+    LOG_TO_CONSOLE,
+    LOG_TO_FILE,
+)
 
-LOG_DIR = os.path.join(os.path.dirname(__file__), "..", "logs")  # ruta relativa desde utils
 LOG_FILE = os.path.join(LOG_DIR, "procesador_facturas.log")
 
 os.makedirs(LOG_DIR, exist_ok=True)  # ✅ crear el directorio justo al cargar el módulo
 
-def setup_logger(name: str) -> logging.Logger:
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
+# Atributos estándar de LogRecord: todo lo demás vino por extra= y va al JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def _process_log_file() -> str:
+    """
+    procesador_facturas.<pid>.log: RotatingFileHandler no se coordina entre procesos
+    (workers de uvicorn, backend_API.worker) y dos procesos rotando el mismo archivo
+    pierden o pisan líneas. Los archivos de procesos terminados los borra el janitor.
+    """
+    base, ext = os.path.splitext(LOG_FILE)
+    return f"{base}.{os.getpid()}{ext}"
+
+
+def truncate(value, limit: int = LOG_MAX_CHARS) -> str:
+    """Recorta textos largos (respuestas de Gemini, documentos) indicando cuánto se omitió."""
+    text = value if isinstance(value, str) else str(value)
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}… [+{len(text) - limit} chars]"
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value if isinstance(value, (int, float, bool, type(None))) else truncate(value)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Deja pasar solo una fracción de las líneas DEBUG; INFO o superior siempre pasan."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
 
-    # 🔧 Agregamos codificación UTF-8 explícita al handler
-    file_handler = logging.FileHandler(LOG_FILE, encoding='utf-8')
-    file_handler.setLevel(logging.INFO)
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    Solo encola: el formateo a JSON y la escritura en disco los hace el
+    QueueListener en su propio hilo. Si la cola se llena, se descarta el
+    registro en vez de bloquear el request.
+    """
 
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(formatter)
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Se resuelve el mensaje acá (los args pueden cambiar después) y se recorta
+        message = truncate(record.getMessage())
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.msg = message
+        record.message = message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _NonBlockingQueueHandler.dropped += 1
+
+
+_queue_handler = None
+_listener = None
+_lock = threading.Lock()
+
+
+def _get_queue_handler() -> QueueHandler:
+    global _queue_handler, _listener
+    with _lock:
+        if _queue_handler is None:
+            log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+            handlers = []
+            if LOG_TO_FILE:
+                # 🔧 Agregamos codificación UTF-8 explícita al handler
+                file_handler = RotatingFileHandler(
+                    _process_log_file(), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+                )
+                file_handler.setFormatter(JsonFormatter())
+                handlers.append(file_handler)
+
+            if LOG_TO_CONSOLE:
+                console_handler = logging.StreamHandler()
+                console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+                handlers.append(console_handler)
+
+            _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+            _listener.start()
+            atexit.register(_listener.stop)  # vacía la cola al salir
+
+            _queue_handler = _NonBlockingQueueHandler(log_queue)
+            _queue_handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+        return _queue_handler
+
+
+def setup_logger(name: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.setLevel(LOG_LEVEL)
+    # Sin propagar al root: evita que basicConfig u otros handlers escriban de forma síncrona
+    logger.propagate = False
 
-    if not logger.handlers:
-        logger.addHandler(file_handler)
+    handler = _get_queue_handler()
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
 
     return logger
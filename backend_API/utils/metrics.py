@@ -0,0 +1,159 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+from backend_API.utils.profiling import record_stage
+from backend_API.utils.tracing import span
+
+# Con varios workers (uvicorn --workers / gunicorn) cada proceso escribe sus
+# métricas en PROMETHEUS_MULTIPROC_DIR y /metrics las agrega al exponerlas.
+# La variable tiene que estar definida antes de arrancar los workers.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Etapas de ProcessingService.process_batch
+STAGES = ("s3_upload", "s3_download", "phash", "validate", "transform", "rasterize", "gemini", "parse", "mongo_write",
+          "excel")
+
+# Gemini tarda segundos; el resto de las etapas, milisegundos
+_FAST_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_GEMINI_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+
+STAGE_LATENCY = Histogram(
+    "dip_stage_duration_seconds",
+    "Duración de cada etapa del procesamiento de facturas",
+    ["stage"],
+    buckets=_FAST_BUCKETS,
+)
+GEMINI_LATENCY = Histogram(
+    "dip_gemini_duration_seconds",
+    "Latencia de las llamadas a Gemini",
+    buckets=_GEMINI_BUCKETS,
+)
+
+INVOICES_PROCESSED = Counter(
+    "dip_invoices_processed_total",
+    "Archivos procesados por resultado",
+    ["outcome"],
+)
+RETRIES = Counter(
+    "dip_retries_total",
+    "Reintentos por operación (storage: los que hace botocore contra S3)",
+    ["operation"],
+)
+NEAR_DUPLICATES = Counter(
+    "dip_near_duplicates_total",
+    "Imágenes casi duplicadas de una factura ya guardada",
+    ["action"],
+)
+QUEUE_TASKS = Counter(
+    "dip_queue_tasks_total",
+    "Tareas de la cola de workers por evento (claimed, reclaimed, completed, failed, lost, released)",
+    ["event"],
+)
+CACHE_HITS = Counter(
+    "dip_cache_hits_total",
+    "Resultados servidos sin volver a procesar",
+    ["cache"],
+)
+
+IN_FLIGHT = Gauge(
+    "dip_files_in_flight",
+    "Archivos que se están procesando en este momento",
+    multiprocess_mode="livesum",
+)
+QUEUE_DEPTH = Gauge(
+    "dip_files_queued",
+    "Archivos recibidos que todavía esperan ser procesados",
+    multiprocess_mode="livesum",
+)
+
+JANITOR_RECLAIMED_BYTES = Counter(
+    "dip_janitor_reclaimed_bytes_total",
+    "Bytes liberados por la limpieza de directorios locales",
+    ["directory"],
+)
+JANITOR_FILES_REMOVED = Counter(
+    "dip_janitor_files_removed_total",
+    "Archivos borrados por la limpieza de directorios locales",
+    ["directory"],
+)
+JANITOR_DIRECTORY_BYTES = Gauge(
+    "dip_janitor_directory_bytes",
+    "Tamaño de cada directorio local después de la última limpieza",
+    ["directory"],
+    multiprocess_mode="livemax",
+)
+
+CPU_POOL_SIZE = Gauge(
+    "dip_cpu_pool_workers",
+    "Procesos del pool para las etapas que usan CPU",
+    multiprocess_mode="livesum",
+)
+CPU_POOL_PENDING = Gauge(
+    "dip_cpu_pool_pending",
+    "Tareas enviadas al pool de procesos que todavía no terminaron (en cola o en ejecución)",
+    multiprocess_mode="livesum",
+)
+CPU_POOL_TASKS = Counter(
+    "dip_cpu_pool_tasks_total",
+    "Tareas del pool de procesos por función y resultado",
+    ["task", "outcome"],
+)
+
+HTTP_LATENCY = Histogram(
+    "dip_http_request_duration_seconds",
+    "Latencia HTTP por ruta",
+    ["method", "route", "status"],
+    buckets=_FAST_BUCKETS + (30, 60, 120),
+)
+
+# Los hijos con labels se resuelven una sola vez: en el camino caliente queda
+# solo el observe()
+_stage_children = {stage: STAGE_LATENCY.labels(stage) for stage in STAGES}
+_outcome_children = {outcome: INVOICES_PROCESSED.labels(outcome) for outcome in ("success", "error", "skipped")}
+
+
+def observe_stage(stage: str, seconds: float):
+    _stage_children[stage].observe(seconds)
+    record_stage(stage, seconds)
+    if stage == "gemini":
+        GEMINI_LATENCY.observe(seconds)
+
+
+@contextmanager
+def track_stage(stage: str):
+    """Mide el bloque y lo registra en el histograma de la etapa (incluso si falla); también abre un span."""
+    started = time.perf_counter()
+    try:
+        with span(stage):
+            yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def count_outcome(success: bool, skipped: bool = False):
+    _outcome_children["skipped" if skipped else "success" if success else "error"].inc()
+
+
+def observe_http(method: str, route: str, status: int, seconds: float):
+    HTTP_LATENCY.labels(method, route, str(status)).observe(seconds)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
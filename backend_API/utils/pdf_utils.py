@@ -0,0 +1,67 @@
+import io
+from typing import BinaryIO, Union
+
+from backend_API.utils.config import PDF_DPI, PDF_MAX_PAGES, PDF_PAGE_MODE
+
+PDF_MAGIC = b"%PDF-"
+JPEG_QUALITY = 90
+
+
+def is_pdf(source: Union[str, BinaryIO, bytes]) -> bool:
+    if isinstance(source, (bytes, bytearray)):
+        return source[:len(PDF_MAGIC)] == PDF_MAGIC
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read(len(PDF_MAGIC)) == PDF_MAGIC
+    source.seek(0)
+    header = source.read(len(PDF_MAGIC))
+    source.seek(0)
+    return header == PDF_MAGIC
+
+
+def rasterize_pdf(data: Union[bytes, str], dpi: int = PDF_DPI, max_pages: int = PDF_MAX_PAGES,
+                  first_page_only: bool = False) -> list[bytes]:
+    """
+    Renderiza las páginas del PDF como JPEG. Corre en un proceso del pool: se
+    renderiza y comprime una página por vez, así la memoria depende del tamaño
+    de página y no de la cantidad de páginas.
+    """
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(data)
+    try:
+        if len(pdf) == 0:
+            # Mismo camino que un PDF ilegible: quien llama lo registra como error del archivo
+            raise ValueError("PDF has no pages")
+        pages = 1 if first_page_only else min(len(pdf), max_pages)
+        images = []
+        for index in range(pages):
+            page = pdf[index]
+            try:
+                bitmap = page.render(scale=dpi / 72)
+                buffer = io.BytesIO()
+                bitmap.to_pil().convert("RGB").save(buffer, "JPEG", quality=JPEG_QUALITY)
+                images.append(buffer.getvalue())
+            finally:
+                page.close()
+        return images
+    finally:
+        pdf.close()
+
+
+def rasterize_pdf_in_pool(source: Union[str, BinaryIO, bytes], page_mode: str = PDF_PAGE_MODE) -> list[dict]:
+    """
+    Rasteriza en el pool de procesos y devuelve las páginas como blobs listos para
+    Gemini ({"mime_type", "data"}), sin decodificarlas en este proceso.
+    """
+    # Import local: este módulo también se carga en los procesos del pool, que no necesitan el pool
+    from backend_API.utils.cpu_pool import cpu_pool
+
+    if isinstance(source, (str, bytes)):
+        data = source  # con una ruta, el proceso hijo abre el archivo por su cuenta
+    else:
+        # Acotado por MAX_UPLOAD_FILE_BYTES
+        source.seek(0)
+        data = source.read()
+    pages = cpu_pool.run(rasterize_pdf, data, PDF_DPI, PDF_MAX_PAGES, page_mode == "first")
+    return [{"mime_type": "image/jpeg", "data": page} for page in pages]
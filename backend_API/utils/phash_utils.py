@@ -0,0 +1,121 @@
+import threading
+from datetime import timedelta
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
+
+from bson import ObjectId
+from backend_API.utils.config import PDF_FORMATS
+from backend_API.utils.cpu_pool import cpu_pool
+from backend_API.utils.image_utils import hash_image, read_bytes
+from backend_API.utils.logger import setup_logger
+
+logger = setup_logger("PerceptualHash")
+
+# Margen al traer facturas nuevas: los ObjectId de otros procesos no son estrictamente crecientes
+_REFRESH_OVERLAP = timedelta(seconds=30)
+
+
+def image_hash(source: Union[str, Path, BinaryIO, bytes], filename: str | None = None) -> Optional[str]:
+    """Hash en hex de la imagen, o None si no se puede calcular (PDF, imagen ilegible)."""
+    name = filename or str(source)
+    if Path(name).suffix.lower() in PDF_FORMATS:
+        return None
+    try:
+        # Decodificar y reducir la imagen es CPU: va al pool de procesos
+        return cpu_pool.run(hash_image, read_bytes(source))
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo calcular el hash perceptual de {name}: {e}")
+        return None
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Árbol BK con distancia de Hamming. Cada hijo cuelga de la distancia a su
+    padre, así la búsqueda descarta ramas enteras por desigualdad triangular.
+    """
+
+    def __init__(self):
+        self._root = None  # [hash, item, {distancia: nodo}]
+        self.size = 0
+
+    def add(self, value: int, item):
+        node = [value, item, {}]
+        self.size += 1
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value: int, max_distance: int) -> list[tuple[int, object]]:
+        """Items a distancia <= max_distance, del más cercano al más lejano."""
+        results = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                results.append((distance, node[1]))
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda r: r[0])
+        return results
+
+
+class NearDuplicateIndex:
+    """
+    Índice en memoria de los hashes (`phash`) de las facturas guardadas. Se
+    carga de Mongo en la primera búsqueda y después, antes de cada búsqueda,
+    trae solo las facturas nuevas por _id: ve también las que guardaron otros
+    workers sin recorrer la colección.
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._tree = BKTree()
+        self._known = set()
+        self._forgotten = set()
+        self._last_id: Optional[ObjectId] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        query = {"phash": {"$type": "string"}}
+        if self._last_id is not None:
+            since = self._last_id.generation_time - _REFRESH_OVERLAP
+            query["_id"] = {"$gte": ObjectId.from_datetime(since)}
+        for doc in self._collection.find(query, {"phash": 1, "invoice_file": 1}).sort("_id", 1):
+            self._last_id = doc["_id"]
+            if doc["_id"] in self._known:
+                continue
+            self._known.add(doc["_id"])
+            self._tree.add(int(doc["phash"], 16), (str(doc["_id"]), doc.get("invoice_file")))
+        if not self._loaded:
+            self._loaded = True
+            logger.info(f"🔎 Índice de casi-duplicados cargado: {self._tree.size} hashes")
+
+    def forget(self, invoice_ids: list):
+        """Facturas borradas: el árbol no admite bajas, se filtran en las búsquedas."""
+        with self._lock:
+            self._forgotten.update(invoice_ids)
+
+    def find(self, phash: str, threshold: int) -> Optional[dict]:
+        """Factura más parecida a `phash` dentro del umbral, o None."""
+        with self._lock:
+            self._refresh()
+            matches = [m for m in self._tree.search(int(phash, 16), threshold) if m[1][0] not in self._forgotten]
+        if not matches:
+            return None
+        distance, (invoice_id, invoice_file) = matches[0]
+        return {"invoice_id": invoice_id, "invoice_file": invoice_file, "distance": distance}
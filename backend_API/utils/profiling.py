@@ -0,0 +1,113 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Cantidad de archivos más lentos que se guardan en el perfil de la corrida
+SLOWEST_FILES = 5
+
+# Archivo que se está procesando en el contexto actual (ver RunProfiler.file)
+_current_file: ContextVar[Optional[dict]] = ContextVar("current_file_timing", default=None)
+
+
+def record_stage(stage: str, seconds: float):
+    """Suma la duración de la etapa al archivo en curso, si hay uno."""
+    timing = _current_file.get()
+    if timing is not None:
+        timing["stages"][stage] = timing["stages"].get(stage, 0.0) + seconds
+
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    # Nearest-rank: el menor valor que cubre al menos pct% de las muestras
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+class RunProfiler:
+    """
+    Perfil de tiempos de una corrida: total por etapa con percentiles, los
+    archivos más lentos y los bytes transferidos. Se guarda en el run como
+    `timing_profile`.
+
+    Las etapas se registran con metrics.track_stage; las que ocurren dentro de
+    `with profiler.file(nombre)` se atribuyen a ese archivo.
+    """
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stage_durations: dict[str, list[float]] = {}
+        self._files: list[dict] = []
+        self._run_stages: dict[str, float] = {}
+        self._bytes: dict[str, int] = {}
+
+    @contextmanager
+    def file(self, name: str):
+        timing = {"file": name, "stages": {}}
+        token = _current_file.set(timing)
+        started = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            _current_file.reset(token)
+            timing["total"] = time.perf_counter() - started
+            with self._lock:
+                self._files.append(timing)
+                for stage, seconds in timing["stages"].items():
+                    self._stage_durations.setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def run_stage(self, stage: str):
+        """Etapas de la corrida que no pertenecen a un archivo (estadísticas, Excel, run)."""
+        token = _current_file.set({"stages": {}})
+        try:
+            yield
+        finally:
+            timing = _current_file.get()
+            _current_file.reset(token)
+            with self._lock:
+                for name, seconds in timing["stages"].items():
+                    self._run_stages[name] = self._run_stages.get(name, 0.0) + seconds
+
+    def add_bytes(self, kind: str, amount: int):
+        with self._lock:
+            self._bytes[kind] = self._bytes.get(kind, 0) + amount
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            stages = {}
+            for stage in sorted(set(self._stage_durations) | set(self._run_stages)):
+                values = sorted(self._stage_durations.get(stage, []))
+                run_level = self._run_stages.get(stage, 0.0)
+                stages[stage] = {
+                    "count": len(values),
+                    "total_ms": _ms(sum(values) + run_level),
+                    "run_level_ms": _ms(run_level),
+                    "p50_ms": _ms(_percentile(values, 50)),
+                    "p90_ms": _ms(_percentile(values, 90)),
+                    "p99_ms": _ms(_percentile(values, 99)),
+                    "max_ms": _ms(values[-1]) if values else 0.0,
+                }
+            slowest = sorted(self._files, key=lambda f: f["total"], reverse=True)[:SLOWEST_FILES]
+            return {
+                "total_ms": _ms(time.perf_counter() - self._started),
+                "files": len(self._files),
+                "stages": stages,
+                "slowest_files": [
+                    {
+                        "file": f["file"],
+                        "total_ms": _ms(f["total"]),
+                        "stages_ms": {stage: _ms(s) for stage, s in f["stages"].items()},
+                    }
+                    for f in slowest
+                ],
+                "bytes": dict(self._bytes),
+            }
@@ -0,0 +1,27 @@
+from typing import Iterable, Optional
+
+import pandas as pd
+
+# build_excel corre en el pool de procesos (ver cpu_pool.py): las hojas viajan como columnas +
+# tuplas, sin repetir las claves en cada fila, y este módulo no importa nada más de la API
+
+# (nombre de la hoja, columnas, filas)
+Sheet = tuple[str, list[str], list[tuple]]
+
+
+def to_sheet(name: str, rows: Iterable[dict], labels: Optional[dict] = None) -> Sheet:
+    """Filas dict -> hoja. Las columnas siguen el orden en que aparecen (igual que pd.DataFrame)."""
+    rows = list(rows)
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    values = [tuple(row.get(column) for column in columns) for row in rows]
+    if labels:
+        columns = [labels.get(column, column) for column in columns]
+    return name, columns, values
+
+
+def build_excel(path: str, sheets: list[Sheet]):
+    """Arma los DataFrames y escribe el Excel; las hojas sin filas se omiten."""
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for name, columns, values in sheets:
+            if values:
+                pd.DataFrame.from_records(values, columns=columns).to_excel(writer, sheet_name=name, index=False)
@@ -0,0 +1,367 @@
+import os
+import shutil
+from abc import ABC, abstractmethod
+from datetime import datetime
+from functools import lru_cache
+from hashlib import md5
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, Optional, Union
+from urllib.parse import quote, unquote
+
+from fastapi import HTTPException
+
+from backend_API.utils.config import (
+    AWS_S3_ENDPOINT_URL,
+    LOCAL_STORAGE_BASE_URL,
+    LOCAL_STORAGE_DIR,
+    S3_MAX_POOL_CONNECTIONS,
+    STORAGE_BACKEND,
+    STORAGE_CHUNK_SIZE,
+)
+from backend_API.utils.metrics import RETRIES
+
+AWS_S3_BUCKET = os.getenv("AWS_S3_BUCKET")
+
+# S3 acepta como máximo 1000 claves por llamada a delete_objects
+S3_DELETE_BATCH_SIZE = 1000
+
+Data = Union[bytes, BinaryIO]
+
+
+def _count_retry(request, **kwargs):
+    if request.context.get("retries", {}).get("attempt", 1) > 1:
+        RETRIES.labels("storage").inc()
+
+
+class StorageBackend(ABC):
+    """
+    Interfaz común para guardar imágenes y reportes.
+    Las claves son rutas relativas con "/" (ej. 2025/01/31/uuid_factura.png).
+    """
+
+    @abstractmethod
+    def put(self, key: str, data: Data, content_type: Optional[str] = None) -> str:
+        """Guarda `data` en `key` y devuelve la URL del objeto."""
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        ...
+
+    @abstractmethod
+    def open_stream(self, key: str, chunk_size: int = STORAGE_CHUNK_SIZE,
+                    start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Lee el objeto por bloques sin cargarlo entero en memoria (o solo los bytes start..end, inclusive)."""
+
+    @abstractmethod
+    def size(self, key: str) -> int:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def delete_many(self, keys: Iterable[str]) -> int:
+        """Elimina varias claves y devuelve cuántas se eliminaron."""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def list(self, prefix: str = "") -> Iterator[dict]:
+        """Itera los objetos bajo `prefix` como dicts {key, size, etag, last_modified}."""
+
+    @abstractmethod
+    def url_for(self, key: str) -> str:
+        ...
+
+    @abstractmethod
+    def key_from_url(self, url: str) -> Optional[str]:
+        """Devuelve la clave de una URL generada por este backend, o None si no le pertenece."""
+
+    def presigned_url(self, key: str, filename: Optional[str] = None, expires: int = 900) -> Optional[str]:
+        """URL temporal para descargar el objeto sin pasar por la API, si el backend la soporta."""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: Path = LOCAL_STORAGE_DIR, base_url: Optional[str] = LOCAL_STORAGE_BASE_URL):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.base_url = base_url.rstrip("/") if base_url else None
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key.lstrip("/")).resolve()
+        if self.root not in path.parents:
+            raise HTTPException(status_code=400, detail=f"Invalid storage key: {key}")
+        return path
+
+    def put(self, key: str, data: Data, content_type: Optional[str] = None) -> str:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                if isinstance(data, (bytes, bytearray)):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f, STORAGE_CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            raise HTTPException(status_code=500, detail=f"Error storing file: {str(e)}")
+        return self.url_for(key)
+
+    def get(self, key: str) -> bytes:
+        path = self._path(key)
+        if not path.is_file():
+            raise HTTPException(status_code=404, detail=f"File not found: {key}")
+        return path.read_bytes()
+
+    def open_stream(self, key: str, chunk_size: int = STORAGE_CHUNK_SIZE,
+                    start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        path = self._path(key)
+        if not path.is_file():
+            raise HTTPException(status_code=404, detail=f"File not found: {key}")
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def size(self, key: str) -> int:
+        path = self._path(key)
+        if not path.is_file():
+            raise HTTPException(status_code=404, detail=f"File not found: {key}")
+        return path.stat().st_size
+
+    def delete(self, key: str) -> None:
+        try:
+            self._path(key).unlink(missing_ok=True)
+        except OSError as e:
+            raise HTTPException(status_code=500, detail=f"Error deleting file: {str(e)}")
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        deleted = 0
+        for key in keys:
+            path = self._path(key)
+            if path.is_file():
+                path.unlink()
+                deleted += 1
+        return deleted
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).is_file()
+
+    def list(self, prefix: str = "") -> Iterator[dict]:
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in sorted(filenames):
+                if filename.startswith("."):
+                    continue
+                path = Path(dirpath) / filename
+                key = path.relative_to(self.root).as_posix()
+                if not key.startswith(prefix):
+                    continue
+                stat = path.stat()
+                yield {
+                    "key": key,
+                    "size": stat.st_size,
+                    # Mismo criterio que S3 para objetos simples: md5 del contenido
+                    "etag": _file_md5(path),
+                    "last_modified": datetime.utcfromtimestamp(stat.st_mtime),
+                }
+
+    def url_for(self, key: str) -> str:
+        if self.base_url:
+            return f"{self.base_url}/{quote(key)}"
+        return self._path(key).as_uri()
+
+    def key_from_url(self, url: str) -> Optional[str]:
+        if self.base_url and url.startswith(f"{self.base_url}/"):
+            return unquote(url[len(self.base_url) + 1:])
+        root_uri = self.root.as_uri()
+        if url.startswith(f"{root_uri}/"):
+            return unquote(url[len(root_uri) + 1:])
+        return None
+
+
+class S3Storage(StorageBackend):
+    def __init__(self, bucket: Optional[str] = AWS_S3_BUCKET, endpoint_url: Optional[str] = AWS_S3_ENDPOINT_URL):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url.rstrip("/") if endpoint_url else None
+        self._client = None
+
+    @property
+    def client(self):
+        # Un único cliente por proceso: boto3 reutiliza el pool de conexiones HTTP
+        if self._client is None:
+            import boto3
+            from botocore.config import Config
+
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=self.endpoint_url,
+                config=Config(
+                    max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                    retries={"max_attempts": 3, "mode": "standard"},
+                ),
+            )
+            # botocore reintenta por dentro; cada intento después del primero cuenta como reintento
+            self._client.meta.events.register("request-created.s3", _count_retry)
+        return self._client
+
+    @property
+    def base_url(self) -> str:
+        if self.endpoint_url:
+            return f"{self.endpoint_url}/{self.bucket}"
+        return f"https://{self.bucket}.s3.amazonaws.com"
+
+    def _raise(self, action: str, e: Exception):
+        from botocore.exceptions import ClientError, NoCredentialsError
+
+        if isinstance(e, HTTPException):
+            raise e
+        if isinstance(e, NoCredentialsError):
+            raise HTTPException(status_code=500, detail="AWS credentials not available")
+        if isinstance(e, ClientError) and e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+            raise HTTPException(status_code=404, detail="File not found")
+        raise HTTPException(status_code=500, detail=f"Error {action}: {str(e)}")
+
+    def put(self, key: str, data: Data, content_type: Optional[str] = None) -> str:
+        extra_args = {"ContentType": content_type} if content_type else {}
+        try:
+            if isinstance(data, (bytes, bytearray)):
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=data, **extra_args)
+            else:
+                self.client.upload_fileobj(data, self.bucket, key, ExtraArgs=extra_args)
+        except Exception as e:
+            self._raise("uploading file", e)
+        return self.url_for(key)
+
+    def get(self, key: str) -> bytes:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        except Exception as e:
+            self._raise("downloading file", e)
+
+    def open_stream(self, key: str, chunk_size: int = STORAGE_CHUNK_SIZE,
+                    start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        extra_args = {}
+        if start or end is not None:
+            extra_args["Range"] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=key, **extra_args)["Body"]
+        except Exception as e:
+            self._raise("downloading file", e)
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def size(self, key: str) -> int:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        except Exception as e:
+            self._raise("checking file", e)
+
+    def presigned_url(self, key: str, filename: Optional[str] = None, expires: int = 900) -> Optional[str]:
+        params = {"Bucket": self.bucket, "Key": key}
+        if filename:
+            params["ResponseContentDisposition"] = f'attachment; filename="{filename}"'
+        try:
+            return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=expires)
+        except Exception as e:
+            self._raise("signing URL", e)
+
+    def delete(self, key: str) -> None:
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+        except Exception as e:
+            self._raise("deleting file", e)
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        deleted = 0
+        batch = []
+        for key in keys:
+            batch.append({"Key": key})
+            if len(batch) == S3_DELETE_BATCH_SIZE:
+                deleted += self._delete_batch(batch)
+                batch = []
+        if batch:
+            deleted += self._delete_batch(batch)
+        return deleted
+
+    def _delete_batch(self, batch: list) -> int:
+        try:
+            response = self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": batch, "Quiet": True},
+            )
+        except Exception as e:
+            self._raise("deleting files", e)
+        return len(batch) - len(response.get("Errors", []))
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            self._raise("checking file", e)
+        except Exception as e:
+            self._raise("checking file", e)
+
+    def list(self, prefix: str = "") -> Iterator[dict]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        try:
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+                for obj in page.get("Contents", []):
+                    yield {
+                        "key": obj["Key"],
+                        "size": obj["Size"],
+                        "etag": obj["ETag"].strip('"'),
+                        "last_modified": obj["LastModified"],
+                    }
+        except Exception as e:
+            self._raise("listing files", e)
+
+    def url_for(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    def key_from_url(self, url: str) -> Optional[str]:
+        if url.startswith(f"{self.base_url}/"):
+            return url[len(self.base_url) + 1:]
+        return None
+
+
+def _file_md5(path: Path) -> str:
+    digest = md5()
+    with open(path, "rb") as f:
+        while chunk := f.read(STORAGE_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def delete_by_url(url: str) -> None:
+    storage = get_storage()
+    key = storage.key_from_url(url)
+    if key is None:
+        raise HTTPException(status_code=400, detail="Invalid URL")
+    storage.delete(key)
+
+
+@lru_cache(maxsize=None)
+def get_storage() -> StorageBackend:
+    if STORAGE_BACKEND == "local":
+        return LocalStorage()
+    if STORAGE_BACKEND == "s3":
+        return S3Storage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
@@ -0,0 +1,85 @@
+import os
+import atexit
+from contextlib import contextmanager
+
+from backend_API.utils.config import TRACE_FILE, TRACING_EXPORTER, TRACING_SERVICE_NAME
+from backend_API.utils.logger import setup_logger
+
+logger = setup_logger("Tracing")
+
+
+class _NoopSpan:
+    """Span vacío para cuando el tracing está apagado: el código instrumentado no cambia."""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def update_name(self, name):
+        pass
+
+    def record_exception(self, exception):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _init_tracer():
+    if TRACING_EXPORTER == "none":
+        return None
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    except ImportError:
+        logger.warning("⚠️ TRACING_EXPORTER definido pero opentelemetry-sdk no está instalado: tracing desactivado")
+        return None
+
+    if TRACING_EXPORTER == "file":
+        os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+        # Un span por línea con el JSON estándar de OpenTelemetry
+        exporter = ConsoleSpanExporter(
+            out=open(TRACE_FILE, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + os.linesep,
+        )
+    elif TRACING_EXPORTER == "otlp":
+        # Endpoint y headers con las variables estándar OTEL_EXPORTER_OTLP_*
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("⚠️ TRACING_EXPORTER=otlp pero opentelemetry-exporter-otlp-proto-http no está instalado: tracing desactivado")
+            return None
+        exporter = OTLPSpanExporter()
+    else:
+        raise ValueError(f"Unknown TRACING_EXPORTER: {TRACING_EXPORTER}")
+
+    provider = TracerProvider(resource=Resource.create({"service.name": TRACING_SERVICE_NAME}))
+    # Exporta en un hilo aparte y por lotes: el request no espera la escritura
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    atexit.register(provider.shutdown)
+    logger.info(f"🔎 Tracing activo ({TRACING_EXPORTER})")
+    return trace.get_tracer("backend_API")
+
+
+_tracer = _init_tracer()
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Abre un span hijo del actual. Los atributos None se omiten.
+    Con el tracing apagado devuelve un span vacío sin costo.
+    """
+    if _tracer is None:
+        yield _NOOP_SPAN
+        return
+    with _tracer.start_as_current_span(
+        name, attributes={k: v for k, v in attributes.items() if v is not None}
+    ) as current:
+        yield current
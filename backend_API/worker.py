@@ -0,0 +1,134 @@
+"""
+Worker de la cola de tareas (POST /process/queue).
+
+    python -m backend_API.worker [--concurrency N]
+
+Se pueden levantar tantos como se quiera, en una o varias máquinas, contra el
+mismo Mongo y el mismo storage: cada uno toma tareas con un lease y las procesa
+con el mismo camino que la API (extracción, facturas, logs, Excel). SIGTERM o
+Ctrl+C terminan las tareas en curso y no toman nuevas.
+"""
+import argparse
+import os
+import signal
+import socket
+import threading
+import uuid
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from backend_API.db.config.indexes import ensure_indexes
+from backend_API.services.processing.TaskQueueService import TaskQueueService
+from backend_API.utils.config import (
+    TASK_HEARTBEAT_SECONDS,
+    WORKER_CONCURRENCY,
+    WORKER_METRICS_PORT,
+    WORKER_POLL_SECONDS,
+)
+from backend_API.utils.cpu_pool import cpu_pool
+from backend_API.utils.logger import setup_logger
+
+logger = setup_logger("Worker")
+
+
+class Worker:
+    """
+    `concurrency` hilos toman y procesan tareas; un hilo más renueva los leases
+    de las tareas en curso, cierra las que vencieron demasiadas veces y los jobs
+    que quedaron sin cerrar.
+    """
+
+    def __init__(self, concurrency: int = WORKER_CONCURRENCY, poll_interval: float = WORKER_POLL_SECONDS):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self._held = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._maintenance_stop = threading.Event()
+
+    def stop(self, *_):
+        if not self._stop.is_set():
+            logger.info("🛑 Deteniendo: se terminan las tareas en curso")
+        self._stop.set()
+
+    def run(self):
+        ensure_indexes()
+        cpu_pool.start()
+        logger.info(f"👷 Worker {self.worker_id} con {self.concurrency} hilos")
+
+        maintenance = threading.Thread(target=self._maintenance, name="worker-maintenance", daemon=True)
+        maintenance.start()
+        threads = [threading.Thread(target=self._loop, name=f"worker-{i}") for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Los heartbeats siguen hasta que termina la última tarea
+        self._maintenance_stop.set()
+        maintenance.join(timeout=10)
+        cpu_pool.shutdown()
+        logger.info(f"👋 Worker {self.worker_id} detenido")
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                task = TaskQueueService.claim(self.worker_id)
+            except Exception as e:
+                logger.error(f"❌ Error tomando tareas: {e}")
+                task = None
+            if task is None:
+                self._stop.wait(self.poll_interval)
+                continue
+
+            with self._lock:
+                self._held.add(task["_id"])
+            try:
+                TaskQueueService.process_task(task, self.worker_id)
+            except Exception as e:
+                logger.error(f"❌ Error procesando {task['key']}: {e}")
+                # Vuelve a la cola enseguida, sin esperar a que venza el lease
+                try:
+                    TaskQueueService.release(task, self.worker_id, str(e))
+                except Exception as release_error:
+                    # El lease vence solo y fail_exhausted / claim la retoman
+                    logger.error(f"❌ Error devolviendo {task['key']} a la cola: {release_error}")
+            finally:
+                with self._lock:
+                    self._held.discard(task["_id"])
+
+    def _maintenance(self):
+        while not self._maintenance_stop.wait(TASK_HEARTBEAT_SECONDS):
+            try:
+                with self._lock:
+                    held = list(self._held)
+                TaskQueueService.heartbeat(self.worker_id, held)
+                if not self._stop.is_set():
+                    TaskQueueService.fail_exhausted(self.worker_id)
+                    TaskQueueService.finalize_ready_jobs(self.worker_id)
+            except Exception as e:
+                logger.error(f"❌ Error renovando leases: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de la cola de facturas (POST /process/queue)")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY,
+                        help="Tareas en paralelo en este proceso")
+    args = parser.parse_args()
+
+    if WORKER_METRICS_PORT:
+        from prometheus_client import start_http_server
+
+        start_http_server(WORKER_METRICS_PORT)
+
+    worker = Worker(concurrency=args.concurrency)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
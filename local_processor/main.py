@@ -3,6 +3,11 @@ import sys
 import logging
 from dotenv import load_dotenv
 from scripts.extractor import ProcesadorFacturasGemini
+from scripts.manifiesto import Manifiesto
+from scripts.sumideros import SumideroCSV, SumideroExcel, SumideroJSONL, SumideroManifiesto
+from scripts.vigilante import VigilanteCarpeta
+from scripts.comprimidos import es_comprimido
+from scripts.config import MANIFIESTO_DB
 import google.generativeai as genai
 
 # Configuración del logging
@@ -16,7 +21,12 @@ logging.basicConfig(
 )
 logger = logging.getLogger('Main')
 
-def main(max_archivos: int = None):
+def main(max_archivos: int = None, workers: int = 1, rpm: int = None,
+         reanudar: bool = False, reprocesar: bool = False,
+         vigilar: bool = False, intervalo: float = 5.0, debounce: float = 10.0,
+         intervalo_reporte: float = 300.0,
+         salida_jsonl: str = None, salida_csv: str = None, modo: str = "prompt",
+         archivo: str = None, dpi_pdf: int = 150, max_paginas_pdf: int = 5, solo_primera_pagina: bool = False):
     """Procesa facturas desde la carpeta 'facturas/' y exporta los datos a un archivo Excel."""
     print("🚀 Iniciando el procesamiento de facturas...")
 
@@ -44,21 +54,79 @@ def main(max_archivos: int = None):
         sys.exit(1)
 
     # Procesar las facturas
+    procesador = None
     try:
-        procesador = ProcesadorFacturasGemini(api_key=API_KEY)
-        logger.info(f"Iniciando procesamiento de facturas en la carpeta 'facturas/'.")
-        print(f"📂 Procesando facturas de la carpeta 'facturas/'...")
-        resultados = procesador.procesar_carpeta_facturas("facturas", max_archivos=max_archivos)
-        logger.info(f"Procesamiento completado. Exportando a Excel...")
+        procesador = ProcesadorFacturasGemini(api_key=API_KEY, modo=modo, dpi_pdf=dpi_pdf,
+                                              max_paginas_pdf=max_paginas_pdf,
+                                              solo_primera_pagina=solo_primera_pagina)
+
+        if archivo:
+            procesar_comprimido(procesador, archivo, workers, rpm, salida_jsonl, salida_csv)
+            return
+
+        manifiesto = Manifiesto(str(MANIFIESTO_DB))
+        corrida_id = manifiesto.iniciar_corrida("facturas", reanudar=reanudar)
+
+        if vigilar:
+            vigilante = VigilanteCarpeta(
+                procesador, manifiesto, "facturas", "outputs/facturas_procesadas.xlsx",
+                workers=workers,
+                solicitudes_por_minuto=rpm,
+                intervalo=intervalo,
+                debounce=debounce,
+                intervalo_reporte=intervalo_reporte,
+            )
+            try:
+                vigilante.ejecutar(corrida_id)
+            except KeyboardInterrupt:
+                print("\n🛑 Deteniendo el modo vigilancia...")
+                vigilante.detener()
+            manifiesto.finalizar_corrida(corrida_id)
+            logger.info("Modo vigilancia finalizado.")
+            return
+
+        logger.info(f"Iniciando procesamiento de facturas en la carpeta 'facturas/' (corrida {corrida_id}).")
+        print(f"📂 Procesando facturas de la carpeta 'facturas/' con {workers} worker(s)...")
+        sumideros = [SumideroManifiesto(manifiesto, corrida_id)]
+        if salida_jsonl:
+            sumideros.append(SumideroJSONL(salida_jsonl))
+        if salida_csv:
+            sumideros.append(SumideroCSV(salida_csv))
+        try:
+            stats_corrida = procesador.procesar_en_streaming(
+                "facturas",
+                sumideros,
+                max_archivos=max_archivos,
+                workers=workers,
+                solicitudes_por_minuto=rpm,
+                manifiesto=manifiesto,
+                corrida_id=corrida_id,
+                forzar=reprocesar,
+            )
+        finally:
+            for sumidero in sumideros:
+                sumidero.cerrar()
+        manifiesto.finalizar_corrida(corrida_id)
+        logger.info(f"Procesamiento completado: {stats_corrida['total_archivos']} archivos nuevos o modificados. Exportando a Excel...")
+        logger.info(f"Parseo ({stats_corrida['modo_extraccion']}): {stats_corrida['fallos_parseo']} fallos "
+                    f"({stats_corrida['tasa_fallo_parseo']:.1f}%), {stats_corrida['tiempo_parseo_ms']:.1f} ms en total.")
+        print(f"🧩 Parseo: {stats_corrida['fallos_parseo']} fallos ({stats_corrida['tasa_fallo_parseo']:.1f}%) en {stats_corrida['tiempo_parseo_ms']:.1f} ms.")
         print(f"📄 Exportando datos a 'outputs/facturas_procesadas.xlsx'...")
-        output_path = procesador.exportar_a_excel(resultados, "outputs/facturas_procesadas.xlsx")
+
+        # El reporte y el resumen se arman desde el manifiesto, leyendo un registro a la vez
+        rutas = [os.path.join("facturas", archivo) for archivo in procesador.listar_facturas("facturas")]
+        output_path = procesador.exportar_a_excel(manifiesto.iterar_resultados(rutas), "outputs/facturas_procesadas.xlsx")
         logger.info(f"Datos exportados correctamente a: {output_path}")
         print(f"🎉 ¡Listo! Los datos se exportaron a: {output_path}")
         
         # Mostrar estadísticas
-        stats = procesador.generar_reporte_estadisticas(resultados)
+        stats = procesador.generar_reporte_estadisticas(manifiesto.iterar_resultados(rutas))
         logger.info(f"Estadísticas: {stats['exitosos']} exitosos, {stats['errores']} errores de {stats['total_archivos']} archivos.")
         print(f"📊 Resumen: {stats['exitosos']} facturas procesadas con éxito, {stats['errores']} errores de {stats['total_archivos']} archivos.")
+    except KeyboardInterrupt:
+        logger.warning("Procesamiento interrumpido por el usuario.")
+        print("\n⏸️  Interrumpido. Ejecuta de nuevo con --resume para continuar.")
+        sys.exit(130)
     except FileNotFoundError as e:
         logger.error(f"Error: La carpeta 'facturas/' no existe.")
         print(f"❌ Error: No se encontró la carpeta 'facturas/'. Asegúrate de que exista y contenga imágenes.")
@@ -67,12 +135,71 @@ def main(max_archivos: int = None):
         logger.error(f"Error durante el procesamiento: {e}")
         print(f"❌ Error inesperado: {e}")
         sys.exit(1)
+    finally:
+        if procesador:
+            procesador.cerrar()
+
+def procesar_comprimido(procesador: ProcesadorFacturasGemini, archivo: str, workers: int, rpm: int,
+                        salida_jsonl: str = None, salida_csv: str = None):
+    """Procesa un ZIP/TAR miembro a miembro y exporta un Excel propio del archivo."""
+    if not os.path.isfile(archivo) or not es_comprimido(archivo):
+        print(f"❌ Error: '{archivo}' no es un archivo .zip o .tar válido.")
+        sys.exit(1)
+
+    logger.info(f"Procesando el archivo comprimido '{archivo}'.")
+    print(f"🗜️  Procesando '{archivo}' con {workers} worker(s)...")
+    # Los miembros no existen en disco: no pasan por el manifiesto. El Excel se escribe
+    # a medida que terminan, igual que el JSONL y el CSV
+    nombre_base = os.path.basename(archivo).split(".")[0]
+    output_path = os.path.abspath(f"outputs/{nombre_base}_procesadas.xlsx")
+    sumideros = [SumideroExcel(output_path)]
+    if salida_jsonl:
+        sumideros.append(SumideroJSONL(salida_jsonl))
+    if salida_csv:
+        sumideros.append(SumideroCSV(salida_csv))
+    try:
+        items = procesador.iterar_comprimido(archivo, workers=workers, solicitudes_por_minuto=rpm)
+        stats = procesador.generar_reporte_estadisticas(procesador.escribir_en_sumideros(items, sumideros))
+    finally:
+        for sumidero in sumideros:
+            sumidero.cerrar()
+
+    logger.info(f"Estadísticas de '{archivo}': {stats['exitosos']} exitosos, {stats['errores']} errores de {stats['total_archivos']} archivos.")
+    print(f"🎉 ¡Listo! Los datos se exportaron a: {output_path}")
+    print(f"📊 Resumen: {stats['exitosos']} facturas procesadas con éxito, {stats['errores']} errores de {stats['total_archivos']} archivos.")
+
 
 if __name__ == "__main__":
     # Permitir configurar max_archivos desde la línea de comandos
     import argparse
     parser = argparse.ArgumentParser(description="Procesa facturas y exporta los datos a Excel.")
     parser.add_argument("--max-archivos", type=int, default=None, help="Número máximo de facturas a procesar (opcional).")
+    parser.add_argument("--workers", type=int, default=1, help="Cantidad de facturas procesadas en paralelo (por defecto 1).")
+    parser.add_argument("--rpm", type=int, default=None, help="Máximo de solicitudes a Gemini por minuto (opcional).")
+    parser.add_argument("--modo", choices=["prompt", "estructurado"], default="prompt",
+                        help="'estructurado' obliga a Gemini a responder JSON según un esquema.")
+    parser.add_argument("--resume", action="store_true", help="Continúa la última corrida interrumpida.")
+    parser.add_argument("--reprocesar", action="store_true", help="Ignora el manifiesto y procesa todos los archivos.")
+    parser.add_argument("--salida-jsonl", default=None, help="Agrega cada factura procesada a este archivo JSONL.")
+    parser.add_argument("--salida-csv", default=None, help="Agrega cada factura procesada a este archivo CSV.")
+    parser.add_argument("--archivo", default=None,
+                        help="Procesa un ZIP o TAR (.tar, .tar.gz, .tgz, .tar.bz2, .tar.xz) en lugar de la carpeta 'facturas/'.")
+    parser.add_argument("--pdf-dpi", type=int, default=150, help="Resolución con la que se rasterizan los PDF.")
+    parser.add_argument("--pdf-max-paginas", type=int, default=5, help="Máximo de páginas de cada PDF que se envían a Gemini.")
+    parser.add_argument("--pdf-solo-primera", action="store_true", help="Envía solo la primera página de cada PDF (más rápido).")
+    parser.add_argument("--watch", action="store_true", help="Queda en ejecución y procesa las facturas a medida que llegan.")
+    parser.add_argument("--intervalo", type=float, default=5.0, help="Segundos entre revisiones de la carpeta en modo --watch.")
+    parser.add_argument("--debounce", type=float, default=10.0, help="Segundos sin cambios para considerar un archivo completo.")
+    parser.add_argument("--intervalo-reporte", type=float, default=300.0, help="Segundos entre actualizaciones del Excel en modo --watch.")
     args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers debe ser mayor o igual a 1")
     
-    main(max_archivos=args.max_archivos)
\ No newline at end of file
+    main(max_archivos=args.max_archivos, workers=args.workers, rpm=args.rpm,
+         reanudar=args.resume, reprocesar=args.reprocesar,
+         vigilar=args.watch, intervalo=args.intervalo, debounce=args.debounce,
+         intervalo_reporte=args.intervalo_reporte,
+         salida_jsonl=args.salida_jsonl, salida_csv=args.salida_csv, modo=args.modo,
+         archivo=args.archivo, dpi_pdf=args.pdf_dpi, max_paginas_pdf=args.pdf_max_paginas,
+         solo_primera_pagina=args.pdf_solo_primera)
\ No newline at end of file
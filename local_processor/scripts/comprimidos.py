@@ -0,0 +1,69 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+EXTENSIONES_ZIP = (".zip",)
+EXTENSIONES_TAR = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+def es_comprimido(ruta: str) -> bool:
+    return ruta.lower().endswith(EXTENSIONES_ZIP + EXTENSIONES_TAR)
+
+
+def _omitir(nombre: str, formatos: List[str]) -> bool:
+    # Metadatos de macOS, archivos ocultos y todo lo que no sea una imagen soportada
+    base = os.path.basename(nombre)
+    return (nombre.startswith("__MACOSX/") or not base or base.startswith(".")
+            or Path(base).suffix.lower() not in formatos)
+
+
+def contar_miembros(ruta_archivo: str, formatos: List[str]) -> Optional[int]:
+    """Cantidad de imágenes de un ZIP (lee solo el índice). Para TAR devuelve None: habría que leerlo entero."""
+    if not ruta_archivo.lower().endswith(EXTENSIONES_ZIP):
+        return None
+    with zipfile.ZipFile(ruta_archivo) as archivo:
+        return sum(1 for info in archivo.infolist() if not info.is_dir() and not _omitir(info.filename, formatos))
+
+
+def iterar_miembros(ruta_archivo: str, formatos: List[str], carpeta_temporal: str) -> Iterator[Tuple[str, str]]:
+    """
+    Extrae las imágenes de un ZIP o TAR de a una, a medida que se piden.
+
+    Args:
+        ruta_archivo: Archivo comprimido
+        formatos: Extensiones de imagen soportadas
+        carpeta_temporal: Dónde se escribe cada miembro; quien consume el
+            generador borra cada archivo al terminar de procesarlo
+
+    Yields:
+        (nombre del miembro dentro del archivo, ruta del archivo temporal)
+    """
+    nombre = ruta_archivo.lower()
+    if nombre.endswith(EXTENSIONES_ZIP):
+        with zipfile.ZipFile(ruta_archivo) as archivo:
+            for info in archivo.infolist():
+                if info.is_dir() or _omitir(info.filename, formatos):
+                    continue
+                with archivo.open(info) as origen:
+                    ruta_temporal = _volcar(origen, info.filename, carpeta_temporal)
+                yield info.filename, ruta_temporal
+    elif nombre.endswith(EXTENSIONES_TAR):
+        # Modo "r|*": lectura secuencial, sin buscar hacia atrás ni cargar el índice
+        with tarfile.open(ruta_archivo, mode="r|*") as archivo:
+            for info in archivo:
+                if not info.isfile() or _omitir(info.name, formatos):
+                    continue
+                origen = archivo.extractfile(info)
+                yield info.name, _volcar(origen, info.name, carpeta_temporal)
+    else:
+        raise ValueError(f"Formato de archivo comprimido no soportado: {ruta_archivo}")
+
+
+def _volcar(origen, nombre: str, carpeta_temporal: str) -> str:
+    with tempfile.NamedTemporaryFile(dir=carpeta_temporal, suffix=Path(nombre).suffix.lower(), delete=False) as destino:
+        shutil.copyfileobj(origen, destino, 1024 * 1024)
+    return destino.name
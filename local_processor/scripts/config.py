@@ -1,6 +1,8 @@
 from pathlib import Path
 
-FORMATOS_SOPORTADOS = [".jpg", ".jpeg", ".png", ".webp", ".tiff", ".bmp", ".gif"]
+FORMATOS_IMAGEN = [".jpg", ".jpeg", ".png", ".webp", ".tiff", ".bmp", ".gif"]
+FORMATOS_PDF = [".pdf"]
+FORMATOS_SOPORTADOS = FORMATOS_IMAGEN + FORMATOS_PDF
 LOG_FILE = 'procesador_facturas.log'
 OUTPUT_DIR = Path("outputs")
-
+MANIFIESTO_DB = OUTPUT_DIR / "manifiesto.sqlite"
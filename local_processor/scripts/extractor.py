@@ -1,24 +1,81 @@
 import logging
+import multiprocessing
 import os
-import json
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-import re
-from typing import List, Optional, Dict
+from typing import Iterable, Iterator, List, Optional, Dict
 from PIL import Image
 from pathlib import Path
-import pandas as pd
 import google.generativeai as genai
 
 from scripts.logger import setup_logger
-from scripts.config import FORMATOS_SOPORTADOS, OUTPUT_DIR
-from scripts.utils import limpiar_json_response
+from scripts.comprimidos import contar_miembros, iterar_miembros
+from scripts.config import FORMATOS_PDF, FORMATOS_SOPORTADOS, OUTPUT_DIR
+from scripts.manifiesto import Manifiesto, calcular_hash
+from scripts.pdf import es_pdf, rasterizar_pdf
+from scripts.pipeline import escanear_carpeta, filtrar_pendientes, limitar, mapear_en_orden
+from scripts.sumideros import CAMPOS_FACTURA, Sumidero, SumideroExcel
+from scripts.utils import LimitadorTasa, ProgresoConsola, limpiar_json_response, parsear_respuesta
+
+MODOS_EXTRACCION = ("prompt", "estructurado")
+
 
 class ProcesadorFacturasGemini:
-    def __init__(self, api_key: str, model_name: str = "gemini-1.5-flash"):
+    def __init__(self, api_key: str, model_name: str = "gemini-1.5-flash", modo: str = "prompt",
+                 dpi_pdf: int = 150, max_paginas_pdf: int = 5, solo_primera_pagina: bool = False,
+                 procesos_pdf: Optional[int] = None):
+        """
+        Args:
+            api_key: Clave de la API de Gemini
+            model_name: Modelo a utilizar
+            modo: "prompt" pide el JSON en el texto del prompt; "estructurado"
+                obliga a Gemini a responder JSON que cumple un esquema
+            dpi_pdf: Resolución con la que se rasterizan los PDF
+            max_paginas_pdf: Máximo de páginas de un PDF que se envían a Gemini
+            solo_primera_pagina: Envía solo la primera página de cada PDF (más rápido y barato)
+            procesos_pdf: Procesos para rasterizar PDF (por defecto, hasta 4 según los núcleos)
+        """
+        if modo not in MODOS_EXTRACCION:
+            raise ValueError(f"Modo de extracción no válido: {modo}")
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel(model_name)
-        self.logger = setup_logger()
+        self.logger = setup_logger('ProcesadorFacturas')
         self.formatos_soportados = FORMATOS_SOPORTADOS
+        self.modo = modo
+        self.dpi_pdf = dpi_pdf
+        self.max_paginas_pdf = max_paginas_pdf
+        self.solo_primera_pagina = solo_primera_pagina
+        self.procesos_pdf = procesos_pdf or min(4, os.cpu_count() or 1)
+        self._pool_pdf = None
+
+    @property
+    def pool_pdf(self) -> ProcessPoolExecutor:
+        # Se crea recién con el primer PDF; rasterizar en procesos no frena a los hilos que llaman a Gemini
+        if self._pool_pdf is None:
+            self._pool_pdf = ProcessPoolExecutor(max_workers=self.procesos_pdf,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return self._pool_pdf
+
+    def rasterizar(self, ruta_pdf: str) -> List[Dict]:
+        """Páginas del PDF como blobs JPEG para Gemini."""
+        paginas = self.pool_pdf.submit(
+            rasterizar_pdf, ruta_pdf, self.dpi_pdf, self.max_paginas_pdf, self.solo_primera_pagina
+        ).result()
+        return [{"mime_type": "image/jpeg", "data": pagina} for pagina in paginas]
+
+    def cerrar(self):
+        if self._pool_pdf is not None:
+            self._pool_pdf.shutdown(cancel_futures=True)
+            self._pool_pdf = None
+
+    @staticmethod
+    def esquema_respuesta() -> Dict:
+        """Esquema JSON para el modo estructurado: las mismas claves que pide el prompt."""
+        propiedades = {clave: {"type": "STRING"} for clave in CAMPOS_FACTURA.values()}
+        propiedades["fecha"]["description"] = "YYYY-MM-DD"
+        propiedades["precio_total"]["description"] = "solo números, sin símbolos de moneda"
+        return {"type": "OBJECT", "properties": propiedades, "required": list(propiedades)}
 
     def _setup_logger(self) -> logging.Logger:
         """Configura el sistema de logging"""
@@ -60,6 +117,9 @@ class ProcesadorFacturasGemini:
             if extension not in self.formatos_soportados:
                 return False
                 
+            if extension in FORMATOS_PDF:
+                return es_pdf(ruta_imagen)
+
             # Intentar abrir la imagen
             with Image.open(ruta_imagen) as img:
                 img.verify()
@@ -80,7 +140,6 @@ class ProcesadorFacturasGemini:
         """
         if not self.validar_imagen(ruta_imagen):
             raise ValueError(f"Imagen no válida: {ruta_imagen}")
-        imagen = Image.open(ruta_imagen)
         
         prompt = """
         Analiza esta factura y extrae los siguientes datos en formato JSON válido.
@@ -105,7 +164,16 @@ class ProcesadorFacturasGemini:
         """
         
         try:
-            response = self.model.generate_content([prompt, imagen])
+            if Path(ruta_imagen).suffix.lower() in FORMATOS_PDF:
+                # Todas las páginas (hasta el máximo) van en la misma consulta
+                paginas = self.rasterizar(ruta_imagen)
+                if len(paginas) > 1:
+                    paginas = ["Las imágenes son páginas consecutivas de la misma factura.", *paginas]
+                response = self._consultar_gemini([prompt, *paginas])
+            else:
+                # Cerrar la imagen al terminar: evita acumular descriptores abiertos en carpetas grandes
+                with Image.open(ruta_imagen) as imagen:
+                    response = self._consultar_gemini([prompt, imagen])
             return {
                 'success': True,
                 'data': response.text,
@@ -119,6 +187,17 @@ class ProcesadorFacturasGemini:
                 'error': str(e)
             }
     
+    def _consultar_gemini(self, contenido: List):
+        if self.modo == "estructurado":
+            return self.model.generate_content(
+                contenido,
+                generation_config=genai.GenerationConfig(
+                    response_mime_type="application/json",
+                    response_schema=self.esquema_respuesta(),
+                ),
+            )
+        return self.model.generate_content(contenido)
+
     def limpiar_json_response(self, response_text: str) -> str:
         """
         Limpia la respuesta para extraer solo el JSON válido
@@ -129,163 +208,256 @@ class ProcesadorFacturasGemini:
         Returns:
             JSON limpio como string
         """
-        # Buscar JSON entre ```json y ``` o entre { y }
-        json_patterns = [
-            r'```json\s*(\{.*?\})\s*```',
-            r'```\s*(\{.*?\})\s*```',
-            r'(\{.*?\})'
-        ]
-        
-        for pattern in json_patterns:
-            match = re.search(pattern, response_text, re.DOTALL)
-            if match:
-                return match.group(1)
-        
-        return response_text
+        return limpiar_json_response(response_text)
 
+    def procesar_archivo(self, ruta_completa: str,
+                         limitador: Optional[LimitadorTasa] = None,
+                         con_hash: bool = False) -> Dict:
+        """
+        Procesa un único archivo sin propagar errores
         
-    def procesar_carpeta_facturas(self, carpeta_facturas: str, 
-                                 max_archivos: Optional[int] = None) -> List[Dict]:
+        Args:
+            ruta_completa: Ruta a la imagen de la factura
+            limitador: Limitador de solicitudes compartido (opcional)
+            con_hash: Calcula el SHA-256 del archivo para el manifiesto
+            
+        Returns:
+            Diccionario con el archivo, timestamp, resultado de la extracción
+            y los datos ya parseados ('datos' / 'error_parseo')
         """
-        Procesa todas las facturas en una carpeta
+        archivo = os.path.basename(ruta_completa)
+        if limitador:
+            limitador.esperar()
+        self.logger.info(f"Procesando: {archivo}")
+        try:
+            resultado = self.extraer_datos_factura(ruta_completa)
+        except Exception as e:
+            self.logger.error(f"Error procesando {archivo}: {e}")
+            resultado = {'success': False, 'data': None, 'error': str(e)}
+        return parsear_respuesta({
+            'archivo': archivo,
+            'ruta_completa': ruta_completa,
+            'timestamp': datetime.now().isoformat(),
+            'hash': calcular_hash(ruta_completa) if con_hash else None,
+            'resultado': resultado
+        })
+
+    def listar_facturas(self, carpeta_facturas: str) -> List[str]:
+        """
+        Lista los archivos de imagen soportados de una carpeta, ordenados por nombre
         
         Args:
             carpeta_facturas: Ruta a la carpeta con facturas
-            max_archivos: Número máximo de archivos a procesar (None para todos)
             
         Returns:
-            Lista de diccionarios con los datos extraídos
+            Lista de nombres de archivo
         """
+        return [os.path.basename(ruta) for ruta in escanear_carpeta(carpeta_facturas, self.formatos_soportados)]
 
-        if not os.path.exists(carpeta_facturas):
-            raise FileNotFoundError(f"La carpeta {carpeta_facturas} no existe")
+    def iterar_carpeta_facturas(self, carpeta_facturas: str,
+                                max_archivos: Optional[int] = None,
+                                workers: int = 1,
+                                solicitudes_por_minuto: Optional[int] = None,
+                                mostrar_progreso: bool = True,
+                                manifiesto: Optional[Manifiesto] = None,
+                                corrida_id: Optional[int] = None,
+                                forzar: bool = False) -> Iterator[Dict]:
+        """
+        Procesa las facturas de una carpeta como un flujo de registros
+        (escanear -> filtrar -> validar/extraer/parsear en paralelo)
         
-        datos_extraidos = []
-        archivos_procesados = 0
+        Args:
+            carpeta_facturas: Ruta a la carpeta con facturas
+            max_archivos: Número máximo de archivos a procesar (None para todos)
+            workers: Cantidad de hilos que llaman a Gemini en paralelo
+            solicitudes_por_minuto: Límite de llamadas a Gemini por minuto (None sin límite)
+            mostrar_progreso: Muestra avance y throughput en la consola
+            manifiesto: Registro persistente; si se indica, se omiten los archivos sin cambios
+            corrida_id: Corrida del manifiesto que se está ejecutando o reanudando
+            forzar: Procesa todos los archivos aunque el manifiesto los tenga
+            
+        Yields:
+            Un registro por archivo procesado, en el orden de los archivos
+        """
+        filtrar = manifiesto is not None and not forzar
+        rutas = escanear_carpeta(carpeta_facturas, self.formatos_soportados)
+        if filtrar:
+            rutas = filtrar_pendientes(rutas, manifiesto, corrida_id)
+        rutas = limitar(rutas, max_archivos)
 
-        # Obtener lista de archivos de imagen
-        archivos_imagen = []
-        
-        for archivo in os.listdir(carpeta_facturas):
-            if Path(archivo).suffix.lower() in self.formatos_soportados:
-                archivos_imagen.append(archivo)
-        
-        self.logger.info(f"Encontrados {len(archivos_imagen)} archivos de imagen")
+        progreso = None
+        if mostrar_progreso:
+            # El total sale de otro recorrido de los nombres, sin guardarlos; con manifiesto
+            # habría que consultar cada archivo, así que el progreso va sin total
+            total = None
+            if not filtrar:
+                total = sum(1 for _ in escanear_carpeta(carpeta_facturas, self.formatos_soportados))
+                total = min(total, max_archivos) if max_archivos else total
+                self.logger.info(f"{total} archivos de imagen para procesar")
+            progreso = ProgresoConsola(total)
+
+        limitador = LimitadorTasa(solicitudes_por_minuto) if solicitudes_por_minuto else None
+
+        def procesar(ruta: str) -> Dict:
+            return self.procesar_archivo(ruta, limitador=limitador, con_hash=manifiesto is not None)
+
+        try:
+            for item in mapear_en_orden(procesar, rutas, workers):
+                if progreso:
+                    progreso.avanzar(item['datos'] is not None)
+                yield item
+        finally:
+            if progreso:
+                progreso.terminar()
+
+    def iterar_comprimido(self, ruta_archivo: str,
+                          workers: int = 1,
+                          solicitudes_por_minuto: Optional[int] = None,
+                          mostrar_progreso: bool = True) -> Iterator[Dict]:
+        """
+        Procesa las facturas de un ZIP o TAR sin descomprimirlo completo: cada
+        miembro se extrae a un archivo temporal recién cuando hay un worker
+        libre y se borra al terminar
         
-        for archivo in archivos_imagen:
-            if max_archivos and archivos_procesados >= max_archivos:
-                break
-                
-            ruta_completa = os.path.join(carpeta_facturas, archivo)
-            self.logger.info(f"Procesando: {archivo}")
-            
-            resultado = self.extraer_datos_factura(ruta_completa)
+        Args:
+            ruta_archivo: Archivo comprimido (.zip, .tar, .tar.gz, .tgz, .tar.bz2, .tar.xz)
+            workers: Cantidad de hilos que llaman a Gemini en paralelo
+            solicitudes_por_minuto: Límite de llamadas a Gemini por minuto (None sin límite)
+            mostrar_progreso: Muestra avance y throughput (en TAR sin total: no se conoce sin leerlo)
             
-            datos_extraidos.append({
-                'archivo': archivo,
-                'ruta_completa': ruta_completa,
-                'timestamp': datetime.now().isoformat(),
-                'resultado': resultado
-            })
+        Yields:
+            Un registro por miembro, en el orden del archivo; 'archivo' es el nombre dentro del comprimido
+        """
+        progreso = ProgresoConsola(contar_miembros(ruta_archivo, self.formatos_soportados)) if mostrar_progreso else None
+        limitador = LimitadorTasa(solicitudes_por_minuto) if solicitudes_por_minuto else None
+
+        # La carpeta temporal se borra al final aunque el consumidor corte antes
+        with tempfile.TemporaryDirectory(prefix="facturas_") as carpeta_temporal:
+            def procesar(miembro) -> Dict:
+                nombre, ruta_temporal = miembro
+                try:
+                    item = self.procesar_archivo(ruta_temporal, limitador=limitador, con_hash=True)
+                finally:
+                    os.remove(ruta_temporal)
+                item['archivo'] = nombre
+                item['ruta_completa'] = f"{ruta_archivo}/{nombre}"
+                return item
+
+            miembros = iterar_miembros(ruta_archivo, self.formatos_soportados, carpeta_temporal)
+            try:
+                for item in mapear_en_orden(procesar, miembros, workers):
+                    if progreso:
+                        progreso.avanzar(item['datos'] is not None)
+                    yield item
+            finally:
+                if progreso:
+                    progreso.terminar()
+
+    def procesar_en_streaming(self, carpeta_facturas: str, sumideros: List[Sumidero], **opciones) -> Dict:
+        """
+        Procesa la carpeta enviando cada registro a los sumideros a medida que termina,
+        sin acumular resultados en memoria
+        
+        Args:
+            carpeta_facturas: Ruta a la carpeta con facturas
+            sumideros: Destinos de cada registro (manifiesto, JSONL, CSV...)
+            **opciones: Mismos parámetros que `iterar_carpeta_facturas`
             
-            archivos_procesados += 1
+        Returns:
+            Estadísticas de los archivos procesados en esta ejecución
+        """
+        return self.generar_reporte_estadisticas(
+            self.escribir_en_sumideros(self.iterar_carpeta_facturas(carpeta_facturas, **opciones), sumideros)
+        )
+
+    @staticmethod
+    def escribir_en_sumideros(items: Iterable[Dict], sumideros: List[Sumidero]) -> Iterator[Dict]:
+        for item in items:
+            for sumidero in sumideros:
+                sumidero.escribir(item)
+            yield item
+
+    def procesar_carpeta_facturas(self, carpeta_facturas: str, 
+                                 max_archivos: Optional[int] = None,
+                                 workers: int = 1,
+                                 solicitudes_por_minuto: Optional[int] = None,
+                                 mostrar_progreso: bool = True,
+                                 manifiesto: Optional[Manifiesto] = None,
+                                 corrida_id: Optional[int] = None,
+                                 forzar: bool = False) -> List[Dict]:
+        """
+        Procesa todas las facturas en una carpeta y devuelve la lista completa.
+        Para carpetas grandes conviene `procesar_en_streaming`.
         
-        self.logger.info(f"Procesados {archivos_procesados} archivos")
-        return datos_extraidos
+        Args:
+            Los mismos que `iterar_carpeta_facturas`
+            
+        Returns:
+            Lista de diccionarios con los datos extraídos, en el orden de los archivos
+            (con manifiesto, incluye también los resultados reutilizados)
+        """
+        items = self.iterar_carpeta_facturas(
+            carpeta_facturas, max_archivos, workers, solicitudes_por_minuto,
+            mostrar_progreso, manifiesto, corrida_id, forzar
+        )
+        if not manifiesto:
+            return list(items)
+
+        for item in items:
+            manifiesto.registrar(item, corrida_id)
+        # El reporte se arma desde el manifiesto: incluye lo procesado en corridas anteriores
+        rutas = [os.path.join(carpeta_facturas, archivo) for archivo in self.listar_facturas(carpeta_facturas)]
+        return list(manifiesto.iterar_resultados(rutas))
     
-    def exportar_a_excel(self, datos_extraidos: List[Dict], nombre_archivo: str ="facturas_procesadas.xlsx") -> str:
+    def exportar_a_excel(self, datos_extraidos: Iterable[Dict], nombre_archivo: str ="facturas_procesadas.xlsx") -> str:
         """
         Exporta los datos extraídos a un archivo Excel
         
         Args:
-            datos_extraidos: Lista de datos extraídos
+            datos_extraidos: Registros procesados (lista o iterador, p. ej. desde el manifiesto)
             nombre_archivo: Nombre del archivo Excel
             
         Returns:
             Ruta del archivo creado
         """
-        filas = []
-        errores = []
-        
-        for item in datos_extraidos:
-            fila_base = {
-                'Archivo': item['archivo'],
-                'Fecha_Procesamiento': item['timestamp'],
-                'Estado': 'Éxito' if item['resultado']['success'] else 'Error'
-            }
-            
-            if item['resultado']['success']:
-                # Limpiar y parsear JSON
-
-                try:
-                    # Intentar parsear JSON
-                    json_limpio = self.limpiar_json_response(item['resultado']['data'])
-                    datos_json = json.loads(json_limpio)
-                    fila = {
-                        **fila_base,
-                        'Empresa': datos_json.get('empresa', 'No encontrado'),
-                        'Fecha_Factura': datos_json.get('fecha', 'No encontrado'),
-                        'Número_Factura': datos_json.get('numero_factura', 'No encontrado'),
-                        'Precio_Total': datos_json.get('precio_total', 'No encontrado'),
-                        'Moneda': datos_json.get('moneda', 'No encontrado'),
-                        'Cantidad_Items': datos_json.get('cantidad_items', 'No encontrado'),
-                        'Descripción': datos_json.get('descripcion_principal', 'No encontrado'),
-                        'CUIT_RUC': datos_json.get('cuit_ruc', 'No encontrado'),
-                        'Dirección': datos_json.get('direccion', 'No encontrado'),
-                        'Teléfono': datos_json.get('telefono', 'No encontrado'),
-                        'Email': datos_json.get('email', 'No encontrado')
-                    }
-                    filas.append(fila)
-                except json.JSONDecodeError as e:
-                    self.logger.error(f"Error parseando JSON para {item['archivo']}: {e}")
-                    errores.append({
-                        **fila_base,
-                        'Error': f"Error JSON: {e}",
-                        'Respuesta_Cruda': item['resultado']['data']
-                    })
-            else:
-                errores.append({
-                    **fila_base,
-                    'Error': item['resultado']['error'],
-                    'Respuesta_Cruda': 'N/A'
-                })
-        
-    # Crear archivo Excel con múltiples hojas
-        with pd.ExcelWriter(nombre_archivo, engine='openpyxl') as writer:
-            if filas:
-                df_exitosos = pd.DataFrame(filas)
-                df_exitosos.to_excel(writer, sheet_name='Facturas_Procesadas', index=False)
-            
-            if errores:
-                df_errores = pd.DataFrame(errores)
-                df_errores.to_excel(writer, sheet_name='Errores', index=False)
-            
-            # Resumen
-            resumen = pd.DataFrame([{
-                'Total_Archivos': len(datos_extraidos),
-                'Exitosos': len(filas),
-                'Errores': len(errores),
-                'Fecha_Proceso': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }])
-            resumen.to_excel(writer, sheet_name='Resumen', index=False)
+        # Cada registro se escribe en el Excel apenas llega: no se acumulan las filas
+        with SumideroExcel(nombre_archivo) as excel:
+            for item in datos_extraidos:
+                if 'datos' not in item:
+                    parsear_respuesta(item)
+                if item.get('datos') is None and item['resultado']['success']:
+                    self.logger.error(f"Error parseando JSON para {item['archivo']}: "
+                                      f"{item.get('error_parseo') or 'Error JSON'}")
+                excel.escribir(item)
         
         self.logger.info(f"Datos exportados a: {nombre_archivo}")
-        self.logger.info(f"Procesados: {len(filas)} exitosos, {len(errores)} errores")
+        self.logger.info(f"Procesados: {excel.exitosos} exitosos, {excel.errores} errores")
         
         return os.path.abspath(nombre_archivo)
     
-    def generar_reporte_estadisticas(self, datos_extraidos: List[Dict]) -> Dict:
+    def generar_reporte_estadisticas(self, datos_extraidos: Iterable[Dict]) -> Dict:
         """
         Genera estadísticas del procesamiento
         
         Args:
-            datos_extraidos: Lista de datos extraídos
+            datos_extraidos: Registros procesados (se recorren una sola vez)
             
         Returns:
             Diccionario con estadísticas
         """
-        total = len(datos_extraidos)
-        exitosos = sum(1 for item in datos_extraidos if item['resultado']['success'])
+        total = 0
+        exitosos = 0
+        parseos = 0
+        fallos_parseo = 0
+        tiempo_parseo_ms = 0.0
+        for item in datos_extraidos:
+            total += 1
+            if item['resultado']['success']:
+                exitosos += 1
+                parseos += 1
+                if item.get('datos') is None:
+                    fallos_parseo += 1
+                tiempo_parseo_ms += item.get('tiempo_parseo_ms') or 0.0
         errores = total - exitosos
         
         estadisticas = {
@@ -293,6 +465,10 @@ class ProcesadorFacturasGemini:
             'exitosos': exitosos,
             'errores': errores,
             'tasa_exito': (exitosos / total * 100) if total > 0 else 0,
+            'modo_extraccion': self.modo,
+            'fallos_parseo': fallos_parseo,
+            'tasa_fallo_parseo': (fallos_parseo / parseos * 100) if parseos > 0 else 0,
+            'tiempo_parseo_ms': round(tiempo_parseo_ms, 3),
             'timestamp': datetime.now().isoformat()
         }
         
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+from scripts.utils import parsear_respuesta
+
+
+def calcular_hash(ruta: str, tamano_bloque: int = 1024 * 1024) -> str:
+    """Calcula el SHA-256 del archivo leyéndolo por bloques."""
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        while bloque := f.read(tamano_bloque):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+class Manifiesto:
+    """
+    Registro persistente (SQLite) de los archivos procesados.
+
+    Cada archivo se guarda apenas termina, con su tamaño, mtime, hash y el
+    resultado de Gemini, de modo que una corrida interrumpida no pierde trabajo
+    y las siguientes corridas solo procesan archivos nuevos o modificados.
+    """
+
+    def __init__(self, ruta_db: str):
+        Path(ruta_db).parent.mkdir(parents=True, exist_ok=True)
+        self.ruta_db = ruta_db
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(ruta_db, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS corridas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                carpeta TEXT NOT NULL,
+                iniciada TEXT NOT NULL,
+                finalizada TEXT,
+                estado TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS archivos (
+                ruta TEXT PRIMARY KEY,
+                archivo TEXT NOT NULL,
+                tamano INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                hash TEXT NOT NULL,
+                exito INTEGER NOT NULL,
+                respuesta TEXT,
+                datos_json TEXT,
+                error TEXT,
+                timestamp TEXT NOT NULL,
+                corrida_id INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_archivos_corrida ON archivos (corrida_id);
+        """)
+        self._conn.commit()
+
+    # Corridas
+    def iniciar_corrida(self, carpeta: str, reanudar: bool = False) -> int:
+        """
+        Devuelve el id de la corrida a usar.
+
+        Con `reanudar=True` retoma la última corrida de la carpeta que no terminó;
+        si no hay ninguna, crea una nueva.
+        """
+        with self._lock:
+            if reanudar:
+                fila = self._conn.execute(
+                    "SELECT id FROM corridas WHERE carpeta = ? AND estado = 'en_curso' ORDER BY id DESC LIMIT 1",
+                    (carpeta,)
+                ).fetchone()
+                if fila:
+                    return fila['id']
+            cursor = self._conn.execute(
+                "INSERT INTO corridas (carpeta, iniciada, estado) VALUES (?, ?, 'en_curso')",
+                (carpeta, datetime.now().isoformat())
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def finalizar_corrida(self, corrida_id: int):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE corridas SET finalizada = ?, estado = 'finalizada' WHERE id = ?",
+                (datetime.now().isoformat(), corrida_id)
+            )
+            self._conn.commit()
+
+    # Archivos
+    def necesita_procesar(self, ruta: str, corrida_id: Optional[int] = None) -> bool:
+        """
+        Indica si el archivo debe enviarse a Gemini.
+
+        Se omite si ya tiene un resultado exitoso y no cambió (mismo tamaño y
+        mtime, o mismo hash si el mtime cambió), o si ya se intentó en la
+        corrida que se está reanudando.
+        """
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT tamano, mtime, hash, exito, corrida_id FROM archivos WHERE ruta = ?",
+                (ruta,)
+            ).fetchone()
+        if fila is None:
+            return True
+        if corrida_id is not None and fila['corrida_id'] == corrida_id:
+            return False
+        if not fila['exito']:
+            return True
+
+        stat = os.stat(ruta)
+        if stat.st_size == fila['tamano'] and stat.st_mtime == fila['mtime']:
+            return False
+        if stat.st_size != fila['tamano'] or calcular_hash(ruta) != fila['hash']:
+            return True
+
+        # Mismo contenido con otro mtime (copia, touch): actualizar y no reprocesar
+        with self._lock:
+            self._conn.execute("UPDATE archivos SET mtime = ? WHERE ruta = ?", (stat.st_mtime, ruta))
+            self._conn.commit()
+        return False
+
+    def registrar(self, item: Dict, corrida_id: Optional[int] = None):
+        """Guarda el resultado de un archivo apenas termina de procesarse."""
+        ruta = item['ruta_completa']
+        stat = os.stat(ruta)
+        resultado = item['resultado']
+
+        if 'datos' not in item:
+            # Registros que no pasaron por parsear_respuesta
+            parsear_respuesta(item)
+        datos_json = json.dumps(item['datos'], ensure_ascii=False) if item['datos'] is not None else None
+
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO archivos (ruta, archivo, tamano, mtime, hash, exito, respuesta, datos_json, error, timestamp, corrida_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(ruta) DO UPDATE SET
+                    archivo = excluded.archivo, tamano = excluded.tamano, mtime = excluded.mtime,
+                    hash = excluded.hash, exito = excluded.exito, respuesta = excluded.respuesta,
+                    datos_json = excluded.datos_json, error = excluded.error,
+                    timestamp = excluded.timestamp, corrida_id = excluded.corrida_id
+                """,
+                (
+                    ruta, item['archivo'], stat.st_size, stat.st_mtime,
+                    item.get('hash') or calcular_hash(ruta),
+                    int(resultado['success']), resultado['data'], datos_json,
+                    resultado['error'] or item.get('error_parseo'), item['timestamp'], corrida_id
+                )
+            )
+            self._conn.commit()
+
+    def iterar_resultados(self, rutas: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+        """
+        Devuelve los resultados guardados con la misma forma que
+        `procesar_carpeta_facturas`, en el orden de `rutas` (o por nombre).
+        Lee una fila a la vez para no cargar el manifiesto completo.
+        """
+        if rutas is None:
+            with self._lock:
+                filas = self._conn.execute("SELECT ruta FROM archivos ORDER BY archivo").fetchall()
+            rutas = (fila['ruta'] for fila in filas)
+
+        for ruta in rutas:
+            with self._lock:
+                fila = self._conn.execute("SELECT * FROM archivos WHERE ruta = ?", (ruta,)).fetchone()
+            if fila is None:
+                continue
+            exito = bool(fila['exito'])
+            datos = json.loads(fila['datos_json']) if fila['datos_json'] else None
+            yield {
+                'archivo': fila['archivo'],
+                'ruta_completa': fila['ruta'],
+                'timestamp': fila['timestamp'],
+                'hash': fila['hash'],
+                'resultado': {
+                    'success': exito,
+                    'data': fila['respuesta'],
+                    'error': None if exito else fila['error'],
+                },
+                'datos': datos,
+                'error_parseo': fila['error'] if exito and datos is None else None,
+            }
+
+    def cerrar(self):
+        with self._lock:
+            self._conn.close()
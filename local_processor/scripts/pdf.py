@@ -0,0 +1,52 @@
+import io
+from typing import List
+
+FIRMA_PDF = b"%PDF-"
+CALIDAD_JPEG = 90
+
+
+def es_pdf(ruta: str) -> bool:
+    """Verifica la cabecera del archivo (el contenido se valida al rasterizar)."""
+    with open(ruta, 'rb') as f:
+        return f.read(len(FIRMA_PDF)) == FIRMA_PDF
+
+
+def rasterizar_pdf(ruta: str, dpi: int = 150, max_paginas: int = 5, solo_primera: bool = False) -> List[bytes]:
+    """
+    Convierte las páginas de un PDF en imágenes JPEG. Pensada para correr en un
+    proceso del pool: renderiza y comprime una página por vez, así la memoria
+    depende del tamaño de la página y no de la cantidad de páginas.
+
+    Args:
+        ruta: Ruta al PDF
+        dpi: Resolución del renderizado
+        max_paginas: Máximo de páginas a convertir
+        solo_primera: Convierte solo la primera página (camino rápido)
+
+    Returns:
+        Lista con el JPEG de cada página, en orden
+
+    Raises:
+        ValueError: si el PDF no tiene páginas
+    """
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(ruta)
+    try:
+        if len(pdf) == 0:
+            # Igual que un PDF ilegible: queda como error del archivo en el reporte
+            raise ValueError("PDF sin páginas")
+        paginas = 1 if solo_primera else min(len(pdf), max_paginas)
+        imagenes = []
+        for indice in range(paginas):
+            pagina = pdf[indice]
+            try:
+                bitmap = pagina.render(scale=dpi / 72)
+                buffer = io.BytesIO()
+                bitmap.to_pil().convert("RGB").save(buffer, "JPEG", quality=CALIDAD_JPEG)
+                imagenes.append(buffer.getvalue())
+            finally:
+                pagina.close()
+        return imagenes
+    finally:
+        pdf.close()
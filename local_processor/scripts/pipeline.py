@@ -0,0 +1,58 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from scripts.manifiesto import Manifiesto
+
+# Etapas del procesamiento local como generadores encadenados:
+#   escanear -> filtrar pendientes -> (validar + extraer + parsear en paralelo) -> sumideros
+# Cada etapa consume un registro a la vez, así que la memoria no crece con la carpeta.
+
+
+def escanear_carpeta(carpeta: str, formatos: List[str]) -> Iterator[str]:
+    """Genera las rutas de las imágenes soportadas, ordenadas por nombre."""
+    if not os.path.exists(carpeta):
+        raise FileNotFoundError(f"La carpeta {carpeta} no existe")
+
+    # Solo se ordenan los nombres; el contenido se lee recién en la etapa de extracción
+    for archivo in sorted(os.listdir(carpeta)):
+        if Path(archivo).suffix.lower() in formatos:
+            yield os.path.join(carpeta, archivo)
+
+
+def filtrar_pendientes(rutas: Iterable[str], manifiesto: Manifiesto,
+                       corrida_id: Optional[int] = None) -> Iterator[str]:
+    """Descarta los archivos que el manifiesto ya tiene procesados y sin cambios."""
+    for ruta in rutas:
+        if manifiesto.necesita_procesar(ruta, corrida_id):
+            yield ruta
+
+
+def limitar(elementos: Iterable, maximo: Optional[int]) -> Iterator:
+    return islice(elementos, maximo) if maximo else iter(elementos)
+
+
+def mapear_en_orden(funcion: Callable, elementos: Iterable, workers: int = 1,
+                    en_vuelo: Optional[int] = None) -> Iterator:
+    """
+    Aplica `funcion` en un pool de hilos y devuelve los resultados en el
+    orden de entrada. Nunca hay más de `en_vuelo` elementos pendientes,
+    por lo que la memoria queda acotada por la concurrencia.
+    """
+    workers = max(1, workers)
+    en_vuelo = en_vuelo or workers * 2
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pendientes = deque()
+    try:
+        for elemento in elementos:
+            pendientes.append(executor.submit(funcion, elemento))
+            if len(pendientes) >= en_vuelo:
+                yield pendientes.popleft().result()
+        while pendientes:
+            yield pendientes.popleft().result()
+    finally:
+        # Si el consumidor se detiene (Ctrl+C, error) no se procesan los pendientes
+        executor.shutdown(wait=False, cancel_futures=True)
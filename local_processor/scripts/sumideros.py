@@ -0,0 +1,178 @@
+import csv
+import json
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from openpyxl import Workbook
+
+from scripts.manifiesto import Manifiesto
+
+# Columnas de la hoja de facturas (Excel y CSV) y la clave del JSON de Gemini de cada una
+CAMPOS_FACTURA = {
+    'Empresa': 'empresa',
+    'Fecha_Factura': 'fecha',
+    'Número_Factura': 'numero_factura',
+    'Precio_Total': 'precio_total',
+    'Moneda': 'moneda',
+    'Cantidad_Items': 'cantidad_items',
+    'Descripción': 'descripcion_principal',
+    'CUIT_RUC': 'cuit_ruc',
+    'Dirección': 'direccion',
+    'Teléfono': 'telefono',
+    'Email': 'email',
+}
+
+COLUMNAS_CSV = ['Archivo', 'Fecha_Procesamiento', 'Estado', *CAMPOS_FACTURA, 'Error']
+COLUMNAS_FACTURAS = ['Archivo', 'Fecha_Procesamiento', 'Estado', *CAMPOS_FACTURA]
+COLUMNAS_ERRORES = ['Archivo', 'Fecha_Procesamiento', 'Estado', 'Error', 'Respuesta_Cruda']
+
+
+def construir_fila(item: Dict) -> Tuple[bool, Dict]:
+    """
+    Convierte un registro ya parseado en una fila de reporte.
+
+    Returns:
+        (True, fila de factura) o (False, fila de error)
+    """
+    fila_base = {
+        'Archivo': item['archivo'],
+        'Fecha_Procesamiento': item['timestamp'],
+        'Estado': 'Éxito' if item['resultado']['success'] else 'Error'
+    }
+
+    datos = item.get('datos')
+    if datos is not None:
+        return True, {
+            **fila_base,
+            **{columna: datos.get(clave, 'No encontrado') for columna, clave in CAMPOS_FACTURA.items()}
+        }
+
+    if item['resultado']['success']:
+        return False, {
+            **fila_base,
+            'Error': item.get('error_parseo') or 'Error JSON',
+            'Respuesta_Cruda': item['resultado']['data']
+        }
+    return False, {
+        **fila_base,
+        'Error': item['resultado']['error'],
+        'Respuesta_Cruda': 'N/A'
+    }
+
+
+class Sumidero(ABC):
+    """Destino de los registros procesados; recibe uno a la vez."""
+
+    @abstractmethod
+    def escribir(self, item: Dict):
+        pass
+
+    def cerrar(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+class SumideroJSONL(Sumidero):
+    """Agrega una línea JSON por factura (sin la respuesta cruda de los casos exitosos)."""
+
+    def __init__(self, ruta: str):
+        Path(ruta).parent.mkdir(parents=True, exist_ok=True)
+        self._archivo = open(ruta, 'a', encoding='utf-8')
+
+    def escribir(self, item: Dict):
+        registro = {
+            'archivo': item['archivo'],
+            'ruta': item['ruta_completa'],
+            'timestamp': item['timestamp'],
+            'hash': item.get('hash'),
+            'exito': item.get('datos') is not None,
+            'datos': item.get('datos'),
+            'error': item.get('error_parseo') or item['resultado']['error'],
+        }
+        if registro['datos'] is None and item['resultado']['success']:
+            registro['respuesta_cruda'] = item['resultado']['data']
+        self._archivo.write(json.dumps(registro, ensure_ascii=False) + '\n')
+        self._archivo.flush()
+
+    def cerrar(self):
+        self._archivo.close()
+
+
+class SumideroCSV(Sumidero):
+    """Agrega una fila por factura; escribe el encabezado si el archivo es nuevo."""
+
+    def __init__(self, ruta: str):
+        Path(ruta).parent.mkdir(parents=True, exist_ok=True)
+        nuevo = not os.path.exists(ruta) or os.path.getsize(ruta) == 0
+        # utf-8-sig para que Excel reconozca los acentos al abrir el CSV
+        self._archivo = open(ruta, 'a', encoding='utf-8-sig' if nuevo else 'utf-8', newline='')
+        self._writer = csv.DictWriter(self._archivo, fieldnames=COLUMNAS_CSV, extrasaction='ignore')
+        if nuevo:
+            self._writer.writeheader()
+
+    def escribir(self, item: Dict):
+        _, fila = construir_fila(item)
+        self._writer.writerow(fila)
+        self._archivo.flush()
+
+    def cerrar(self):
+        self._archivo.close()
+
+
+class SumideroExcel(Sumidero):
+    """
+    Arma el Excel (facturas, errores y resumen) a medida que llegan los registros:
+    openpyxl en modo write_only guarda cada fila sin mantener la hoja en memoria.
+    Las hojas sin filas se omiten, igual que antes.
+    """
+
+    def __init__(self, ruta: str):
+        Path(ruta).parent.mkdir(parents=True, exist_ok=True)
+        self.ruta = ruta
+        self.exitosos = 0
+        self.errores = 0
+        self._libro = Workbook(write_only=True)
+        self._hojas = {}
+
+    def _hoja(self, nombre: str, columnas: list, posicion: int):
+        if nombre not in self._hojas:
+            hoja = self._libro.create_sheet(nombre, posicion)
+            hoja.append(columnas)
+            self._hojas[nombre] = hoja
+        return self._hojas[nombre]
+
+    def escribir(self, item: Dict):
+        exito, fila = construir_fila(item)
+        if exito:
+            self.exitosos += 1
+            hoja, columnas = self._hoja('Facturas_Procesadas', COLUMNAS_FACTURAS, 0), COLUMNAS_FACTURAS
+        else:
+            self.errores += 1
+            hoja, columnas = self._hoja('Errores', COLUMNAS_ERRORES, len(self._hojas)), COLUMNAS_ERRORES
+        hoja.append([fila.get(columna) for columna in columnas])
+
+    def cerrar(self):
+        resumen = self._libro.create_sheet('Resumen')
+        resumen.append(['Total_Archivos', 'Exitosos', 'Errores', 'Fecha_Proceso'])
+        resumen.append([self.exitosos + self.errores, self.exitosos, self.errores,
+                        datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
+        self._libro.save(self.ruta)
+
+
+class SumideroManifiesto(Sumidero):
+    """Guarda cada registro en el manifiesto SQLite."""
+
+    def __init__(self, manifiesto: Manifiesto, corrida_id: Optional[int] = None):
+        self.manifiesto = manifiesto
+        self.corrida_id = corrida_id
+
+    def escribir(self, item: Dict):
+        self.manifiesto.registrar(item, self.corrida_id)
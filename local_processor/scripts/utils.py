@@ -1,13 +1,138 @@
-import re
+import json
+import sys
+import threading
+import time
+from typing import Optional
+
+def extraer_objeto_json(texto: str):
+    """
+    Devuelve el primer objeto JSON completo del texto en una sola pasada,
+    contando llaves fuera de los strings (soporta objetos anidados y llaves
+    dentro de valores). None si no hay un objeto cerrado.
+    """
+    inicio = None
+    profundidad = 0
+    en_string = False
+    escapado = False
+
+    for i, caracter in enumerate(texto):
+        if inicio is None:
+            if caracter == '{':
+                inicio, profundidad = i, 1
+            continue
+        if en_string:
+            if escapado:
+                escapado = False
+            elif caracter == '\\':
+                escapado = True
+            elif caracter == '"':
+                en_string = False
+        elif caracter == '"':
+            en_string = True
+        elif caracter == '{':
+            profundidad += 1
+        elif caracter == '}':
+            profundidad -= 1
+            if profundidad == 0:
+                return texto[inicio:i + 1]
+    return None
+
 
 def limpiar_json_response(response_text: str) -> str:
-    patrones = [
-        r'```json\s*(\{.*?\})\s*```',
-        r'```\s*(\{.*?\})\s*```',
-        r'(\{.*?\})'
-    ]
-    for pattern in patrones:
-        match = re.search(pattern, response_text, re.DOTALL)
-        if match:
-            return match.group(1)
-    return response_text
+    objeto = extraer_objeto_json(response_text)
+    return objeto if objeto is not None else response_text
+
+
+def parsear_respuesta(item: dict) -> dict:
+    """
+    Parsea una única vez la respuesta de Gemini del registro.
+
+    Agrega 'datos' (dict o None), 'error_parseo' (str o None) y
+    'tiempo_parseo_ms'; las etapas siguientes y los sumideros usan esos
+    campos sin volver a parsear.
+    """
+    item['datos'] = None
+    item['error_parseo'] = None
+    item['tiempo_parseo_ms'] = None
+    resultado = item['resultado']
+    if resultado['success']:
+        inicio = time.perf_counter()
+        try:
+            datos = json.loads(limpiar_json_response(resultado['data']))
+            if not isinstance(datos, dict):
+                raise ValueError("la respuesta no es un objeto JSON")
+            item['datos'] = datos
+        except (json.JSONDecodeError, TypeError, ValueError) as e:
+            item['error_parseo'] = f"Error JSON: {e}"
+        item['tiempo_parseo_ms'] = (time.perf_counter() - inicio) * 1000
+    return item
+
+
+class LimitadorTasa:
+    """
+    Limita la cantidad de solicitudes por minuto entre todos los hilos.
+    Espacia las llamadas de forma uniforme (una cada 60/rpm segundos).
+    """
+
+    def __init__(self, solicitudes_por_minuto: int):
+        self.intervalo = 60.0 / solicitudes_por_minuto
+        self._lock = threading.Lock()
+        self._proximo = time.monotonic()
+
+    def esperar(self):
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(self._proximo, ahora)
+            self._proximo = turno + self.intervalo
+        espera = turno - ahora
+        if espera > 0:
+            time.sleep(espera)
+
+
+class ProgresoConsola:
+    """
+    Muestra en una sola línea el avance y el throughput del procesamiento.
+    Sin `total` (no se conoce sin leer todo) muestra solo lo hecho y la tasa.
+    """
+
+    def __init__(self, total: Optional[int] = None, salida=sys.stdout):
+        self.total = total
+        self.hechos = 0
+        self.errores = 0
+        self.salida = salida
+        self._inicio = time.monotonic()
+        self._lock = threading.Lock()
+
+    def avanzar(self, exito: bool = True):
+        with self._lock:
+            self.hechos += 1
+            if not exito:
+                self.errores += 1
+            self._mostrar()
+
+    def _mostrar(self):
+        transcurrido = time.monotonic() - self._inicio
+        tasa = self.hechos / transcurrido if transcurrido > 0 else 0.0
+        if self.total is None:
+            self.salida.write(
+                f"\r📈 {self.hechos} | {tasa * 60:.1f} facturas/min | errores: {self.errores}"
+            )
+            self.salida.flush()
+            return
+        porcentaje = (self.hechos / self.total * 100) if self.total else 100.0
+        restante = (self.total - self.hechos) / tasa if tasa > 0 else 0.0
+        self.salida.write(
+            f"\r📈 {self.hechos}/{self.total} ({porcentaje:.1f}%) | "
+            f"{tasa * 60:.1f} facturas/min | errores: {self.errores} | "
+            f"restante: {restante:.0f}s"
+        )
+        if self.hechos == self.total:
+            self.salida.write("\n")
+        self.salida.flush()
+
+    def terminar(self):
+        """Cierra la línea si quedó abierta (sin total, o si se cortó antes de llegar)."""
+        with self._lock:
+            if self.hechos and self.hechos != self.total:
+                self.salida.write("\n")
+                self.salida.flush()
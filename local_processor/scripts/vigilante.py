@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Set, Tuple
+
+from scripts.extractor import ProcesadorFacturasGemini
+from scripts.logger import setup_logger
+from scripts.manifiesto import Manifiesto
+from scripts.utils import LimitadorTasa
+
+
+class VigilanteCarpeta:
+    """
+    Modo continuo: revisa la carpeta cada `intervalo` segundos y procesa los
+    archivos nuevos a medida que llegan.
+
+    Un archivo se considera completo cuando su tamaño y mtime no cambian
+    durante `debounce` segundos (evita leer escaneos a medio copiar).
+    Se usa polling con os.scandir, que funciona igual en carpetas de red
+    compartidas, donde inotify no recibe los eventos de otras máquinas.
+    """
+
+    def __init__(self, procesador: ProcesadorFacturasGemini, manifiesto: Manifiesto,
+                 carpeta: str, ruta_reporte: str,
+                 workers: int = 1,
+                 solicitudes_por_minuto: Optional[int] = None,
+                 intervalo: float = 5.0,
+                 debounce: float = 10.0,
+                 intervalo_reporte: float = 300.0):
+        self.procesador = procesador
+        self.manifiesto = manifiesto
+        self.carpeta = carpeta
+        self.ruta_reporte = ruta_reporte
+        self.workers = max(1, workers)
+        self.limitador = LimitadorTasa(solicitudes_por_minuto) if solicitudes_por_minuto else None
+        self.intervalo = intervalo
+        self.debounce = debounce
+        self.intervalo_reporte = intervalo_reporte
+        self.logger = setup_logger('VigilanteCarpeta')
+
+        # ruta -> (tamaño, mtime, momento desde el que está estable)
+        self._candidatos: Dict[str, Tuple[int, float, float]] = {}
+        self._en_proceso: Set[str] = set()
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._nuevos_resultados = 0
+
+    def detener(self):
+        self._detener.set()
+
+    def ejecutar(self, corrida_id: int):
+        """Bucle principal; termina con detener() o Ctrl+C."""
+        os.makedirs(self.carpeta, exist_ok=True)
+        self.logger.info(f"Vigilando '{self.carpeta}' cada {self.intervalo}s (debounce {self.debounce}s)")
+        print(f"👀 Vigilando '{self.carpeta}'... (Ctrl+C para salir)")
+
+        ultimo_reporte = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while not self._detener.is_set():
+                for ruta in self._archivos_listos():
+                    # Cola acotada: no encolar más de lo que los workers pueden atender
+                    with self._lock:
+                        if len(self._en_proceso) >= self.workers * 2:
+                            break
+                        self._en_proceso.add(ruta)
+                    futuro = executor.submit(self.procesador.procesar_archivo, ruta, self.limitador, True)
+                    futuro.add_done_callback(lambda f, r=ruta: self._registrar(f, r, corrida_id))
+
+                if time.monotonic() - ultimo_reporte >= self.intervalo_reporte:
+                    self.actualizar_reporte()
+                    ultimo_reporte = time.monotonic()
+
+                self._detener.wait(self.intervalo)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            self.actualizar_reporte()
+
+    def _archivos_listos(self):
+        ahora = time.monotonic()
+        vistos = set()
+        with os.scandir(self.carpeta) as entradas:
+            for entrada in entradas:
+                if not entrada.is_file() or os.path.splitext(entrada.name)[1].lower() not in self.procesador.formatos_soportados:
+                    continue
+                ruta = os.path.join(self.carpeta, entrada.name)
+                vistos.add(ruta)
+                with self._lock:
+                    if ruta in self._en_proceso:
+                        continue
+
+                stat = entrada.stat()
+                previo = self._candidatos.get(ruta)
+                if previo is None or previo[:2] != (stat.st_size, stat.st_mtime):
+                    self._candidatos[ruta] = (stat.st_size, stat.st_mtime, ahora)
+                    continue
+                if stat.st_size == 0 or ahora - previo[2] < self.debounce:
+                    continue
+
+                if self.manifiesto.necesita_procesar(ruta):
+                    yield ruta
+                # Ya procesado (o recién encolado): se vuelve a evaluar solo si cambia
+                self._candidatos[ruta] = (stat.st_size, stat.st_mtime, float('inf'))
+
+        # Olvidar archivos que se movieron o eliminaron
+        for ruta in list(self._candidatos):
+            if ruta not in vistos:
+                del self._candidatos[ruta]
+
+    def _registrar(self, futuro: Future, ruta: str, corrida_id: int):
+        try:
+            if futuro.cancelled():
+                return
+            item = futuro.result()
+            self.manifiesto.registrar(item, corrida_id)
+            estado = "✅" if item['resultado']['success'] else "❌"
+            print(f"{estado} {item['archivo']}")
+            with self._lock:
+                self._nuevos_resultados += 1
+        except Exception as e:
+            self.logger.error(f"Error registrando {ruta}: {e}")
+        finally:
+            with self._lock:
+                self._en_proceso.discard(ruta)
+
+    def actualizar_reporte(self):
+        """Regenera el Excel desde el manifiesto si hubo resultados nuevos."""
+        with self._lock:
+            if not self._nuevos_resultados:
+                return
+            self._nuevos_resultados = 0
+        try:
+            rutas = [os.path.join(self.carpeta, archivo) for archivo in self.procesador.listar_facturas(self.carpeta)]
+            resultados = list(self.manifiesto.iterar_resultados(rutas))
+            self.procesador.exportar_a_excel(resultados, self.ruta_reporte)
+            self.logger.info(f"Reporte actualizado: {self.ruta_reporte} ({len(resultados)} facturas)")
+        except Exception as e:
+            self.logger.error(f"Error actualizando el reporte: {e}")
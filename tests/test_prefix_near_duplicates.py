@@ -0,0 +1,71 @@
+from backend_API.models.processing.PrefixRunRequest import PrefixRunRequest
+from backend_API.services.processing import PrefixService as prefix_module
+from backend_API.services.processing import ProcessingService as processing_module
+from backend_API.services.processing.PrefixService import PrefixService
+from backend_API.services.processing.ProcessingService import ProcessingService
+
+OBJECT = {"key": "facturas/copia.jpg", "etag": "etag-1", "size": 3}
+MATCH = {"invoice_id": "64b000000000000000000001", "invoice_file": "original.jpg", "distance": 2}
+
+
+class FakeProcessedObjects:
+    """processed_objects en memoria: solo lo que usa PrefixService."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def find(self, query, projection=None):
+        keys = query["key"]["$in"]
+        statuses = query["status"]["$in"]
+        return [doc for key, doc in self.docs.items() if key in keys and doc["status"] in statuses]
+
+    def update_one(self, query, update, upsert=False):
+        self.docs.setdefault(query["key"], {}).update(update["$set"])
+
+
+class FakeDb:
+    def __init__(self):
+        self.processed_objects = FakeProcessedObjects()
+
+
+class FakeStorage:
+    def __init__(self):
+        self.downloads = 0
+
+    def list(self, prefix):
+        return [OBJECT]
+
+    def open_stream(self, key, start=None, end=None):
+        self.downloads += 1
+        return iter([b"img"])
+
+    def url_for(self, key):
+        return f"https://storage/{key}"
+
+
+class FakeIndex:
+    def find(self, phash, threshold):
+        return MATCH
+
+
+def test_skipped_near_duplicate_is_marked_processed(monkeypatch):
+    fake_db = FakeDb()
+    storage = FakeStorage()
+    monkeypatch.setattr(prefix_module, "db", fake_db)
+    monkeypatch.setattr(prefix_module, "get_storage", lambda: storage)
+    monkeypatch.setattr(processing_module, "NEAR_DUPLICATE_MODE", "skip")
+    monkeypatch.setattr(processing_module, "near_duplicate_index", FakeIndex())
+    monkeypatch.setattr(processing_module, "image_hash", lambda source, filename=None: "ffff000000000000")
+    monkeypatch.setattr(ProcessingService, "finalize_run", staticmethod(lambda ctx, total: {"summary": {}}))
+
+    first = PrefixService.process_prefix(PrefixRunRequest(prefix="facturas/", workers=1))
+
+    marked = fake_db.processed_objects.docs[OBJECT["key"]]
+    assert marked["status"] == "Skipped"
+    assert marked["etag"] == OBJECT["etag"]
+    assert first["summary"]["objects_skipped"] == 0
+
+    # Al retomar el prefijo el objeto no se vuelve a descargar ni hashear
+    second = PrefixService.process_prefix(PrefixRunRequest(prefix="facturas/", workers=1))
+    assert second["summary"]["objects_skipped"] == 1
+    assert storage.downloads == 1